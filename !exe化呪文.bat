@@ -1,5 +1,5 @@
 python -m pip install --upgrade pip
-pip install pyinstaller pynput PySide6
+pip install pyinstaller pynput PySide6 numpy mss
 
 
 pyinstaller autoclicker.py ^
@@ -1,14 +1,19 @@
 import sys
+from startup import TIMER
 from PySide6.QtWidgets import QApplication
 from utils import ensure_app_dirs
 from config import AppConfig
 from gui import MainWindow
 
 def main():
+    TIMER.mark("imports")
     app = QApplication(sys.argv)
-    ensure_app_dirs()  
-    cfg = AppConfig.load()
-    w = MainWindow(start_minimized=bool(cfg.get("start_minimized", False)))
+    TIMER.mark("qapp")
+    ensure_app_dirs()
+    cfg = AppConfig.load()   # 読み込み・移行はここで1回だけ（ウィンドウへ渡す）
+    TIMER.mark("config")
+    w = MainWindow(start_minimized=bool(cfg.get("start_minimized", False)), cfg=cfg)
+    TIMER.mark("window")
     w.show()
     sys.exit(app.exec())
 
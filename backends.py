@@ -0,0 +1,161 @@
+import time
+from typing import Optional, List, Tuple
+
+# ===== 入力注入バックエンド =====
+# エンジンは resolve_* で解決済みのオブジェクトだけを扱う（毎ティックの文字列解析なし）。
+# move/click/tap は submit() までまとめて送ってよい（即時送出のバックエンドでは submit は何もしない）。
+
+class InputBackend:
+    name = "base"
+
+    def resolve_button(self, button: str): return button
+    def resolve_key(self, spec: Optional[str]):
+        """'F8' / 'A' / '0' → バックエンド固有のキー。送出不能なら None"""
+        if not spec: return None
+        s = str(spec).strip().upper()
+        return s or None
+    def resolve_char(self, ch: str):
+        """記録した文字をそのまま送るためのキー（大文字小文字を保つ）"""
+        return self.resolve_key(ch)
+
+    def position(self) -> Tuple[int, int]: return (0, 0)
+    def move(self, x: int, y: int): pass
+    def click(self, button): pass
+    def mouse_down(self, button): pass
+    def mouse_up(self, button): pass
+    def press(self, key): pass
+    def release(self, key): pass
+    def tap(self, key): self.press(key); self.release(key)
+    def submit(self): pass
+    def close(self): pass
+
+
+class PynputBackend(InputBackend):
+    """従来どおり pynput の Controller で送出"""
+    name = "pynput"
+
+    def __init__(self):
+        from pynput import mouse, keyboard
+        self._Button = mouse.Button; self._Key = keyboard.Key
+        self._mouse = mouse.Controller()
+        self._keybd = keyboard.Controller()
+
+    def resolve_button(self, button: str):
+        return getattr(self._Button, button, self._Button.left)
+
+    def resolve_key(self, spec: Optional[str]):
+        s = super().resolve_key(spec)
+        if s and s.startswith("F") and s[1:].isdigit():
+            fk = getattr(self._Key, f"f{int(s[1:])}", None)
+            if fk: return fk
+        if s and len(s) > 1:  # 'ENTER' / 'SHIFT' など名前付きキー
+            return getattr(self._Key, s.lower(), None)
+        return s
+    def resolve_char(self, ch: str): return ch
+
+    def position(self) -> Tuple[int, int]:
+        x, y = self._mouse.position
+        return (int(x), int(y))
+    def move(self, x: int, y: int): self._mouse.position = (x, y)
+    def click(self, button): self._mouse.click(button)
+    def mouse_down(self, button): self._mouse.press(button)
+    def mouse_up(self, button): self._mouse.release(button)
+    def press(self, key): self._keybd.press(key)
+    def release(self, key): self._keybd.release(key)
+
+
+class UinputBackend(InputBackend):
+    """Linux: /dev/uinput へ evdev イベントを直接書く（X/Wayland のクライアント経由より1イベントが軽い）。
+    python-evdev と /dev/uinput への書き込み権限が必要。座標は絶対座標デバイスとして送る"""
+    name = "uinput"
+
+    def __init__(self, screen: Optional[Tuple[int, int]] = None):
+        from evdev import UInput, AbsInfo, ecodes
+        self._ec = ecodes
+        w, h = screen or (1920, 1080)
+        keys = [v for k, v in ecodes.ecodes.items() if k.startswith("KEY_") and isinstance(v, int) and v < 0x100]
+        cap = {
+            ecodes.EV_KEY: sorted(set(keys + [ecodes.BTN_LEFT, ecodes.BTN_RIGHT])),
+            ecodes.EV_ABS: [(ecodes.ABS_X, AbsInfo(0, 0, max(1, w - 1), 0, 0, 0)),
+                            (ecodes.ABS_Y, AbsInfo(0, 0, max(1, h - 1), 0, 0, 0))],
+        }
+        self._ui = UInput(cap, name="AutoClicker")
+        self._pos = (0, 0)
+        self._pending: List[Tuple[int, int, int]] = []  # (type, code, value)。SYN は (0,0,0)
+
+    _ALIAS = {"SHIFT": "LEFTSHIFT", "SHIFT_R": "RIGHTSHIFT", "CTRL": "LEFTCTRL", "CTRL_R": "RIGHTCTRL",
+              "ALT": "LEFTALT", "ALT_R": "RIGHTALT", "CMD": "LEFTMETA", "PAGE_UP": "PAGEUP",
+              "PAGE_DOWN": "PAGEDOWN", "CAPS_LOCK": "CAPSLOCK"}
+
+    def resolve_button(self, button: str):
+        return getattr(self._ec, f"BTN_{str(button).upper()}", self._ec.BTN_LEFT)
+
+    def resolve_key(self, spec: Optional[str]):
+        s = super().resolve_key(spec)
+        if not s: return None
+        return getattr(self._ec, f"KEY_{self._ALIAS.get(s, s)}", None)
+
+    def position(self) -> Tuple[int, int]: return self._pos
+
+    def move(self, x: int, y: int):
+        ec = self._ec; self._pos = (int(x), int(y))
+        self._pending += [(ec.EV_ABS, ec.ABS_X, int(x)), (ec.EV_ABS, ec.ABS_Y, int(y)), (0, 0, 0)]
+
+    def click(self, button): self.press(button); self.release(button)
+    def mouse_down(self, button): self.press(button)
+    def mouse_up(self, button): self.release(button)
+    def press(self, key):   self._pending += [(self._ec.EV_KEY, key, 1), (0, 0, 0)]
+    def release(self, key): self._pending += [(self._ec.EV_KEY, key, 0), (0, 0, 0)]
+
+    def submit(self):
+        ui = self._ui; pending = self._pending; self._pending = []
+        for t, c, v in pending:
+            if t == 0: ui.syn()
+            else: ui.write(t, c, v)
+
+    def close(self):
+        try: self._ui.close()
+        except Exception: pass
+
+
+class RecordingBackend(InputBackend):
+    """何も送らず、全イベントを perf_counter 時刻付きでメモリに記録する（ヘッドレス計測・CI用）。
+    events: [(t, kind, a, b)]  kind = 'move'|'click'|'down'|'up'|'press'|'release'"""
+    name = "record"
+
+    def __init__(self):
+        self.events: List[tuple] = []
+        self._pos = (0, 0)
+
+    def position(self) -> Tuple[int, int]: return self._pos
+    def move(self, x: int, y: int):
+        self._pos = (x, y); self.events.append((time.perf_counter(), "move", x, y))
+    def click(self, button):  self.events.append((time.perf_counter(), "click", button, None))
+    def mouse_down(self, button): self.events.append((time.perf_counter(), "down", button, None))
+    def mouse_up(self, button):   self.events.append((time.perf_counter(), "up", button, None))
+    def press(self, key):     self.events.append((time.perf_counter(), "press", key, None))
+    def release(self, key):   self.events.append((time.perf_counter(), "release", key, None))
+    def tap(self, key):
+        t = time.perf_counter(); ev = self.events
+        ev.append((t, "press", key, None)); ev.append((t, "release", key, None))
+
+    def times(self, *kinds: str) -> List[float]:
+        """指定種別のイベント時刻（省略時は発火=click/press）"""
+        kinds = kinds or ("click", "press")
+        return [e[0] for e in self.events if e[1] in kinds]
+
+    def clear(self): self.events = []
+
+
+BACKENDS = ("pynput", "uinput", "record")
+
+def create_backend(name: Optional[str] = "pynput", screen: Optional[Tuple[int, int]] = None) -> InputBackend:
+    """名前からバックエンドを作る。uinput が使えない環境では pynput にフォールバック"""
+    if name == "record":
+        return RecordingBackend()
+    if name == "uinput":
+        try:
+            return UinputBackend(screen)
+        except Exception:
+            pass
+    return PynputBackend()
@@ -0,0 +1,272 @@
+"""AutoClickEngine のタイミング精度・スループット計測（ディスプレイ不要）
+
+    python bench.py                       # 標準セット
+    python bench.py --quick --out a.json  # 短時間セットを JSON 出力
+    python bench.py --compare a.json      # 前回結果との比較表示
+
+入力は RecordingBackend（何も送らず時刻だけ記録）に流すので、ヘッドレスのCIでも動く。
+"""
+import argparse, json, os, platform, shutil, subprocess, sys, tempfile, time
+from typing import Dict, Any, List, Optional
+from backends import RecordingBackend
+from processor import AutoClickEngine
+
+INTERVALS_MS = (1, 5, 20, 100, 1000)
+QUICK_INTERVALS_MS = (1, 5, 20, 100)
+
+def _pct(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals: return 0.0
+    i = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[i]
+
+def _params(**over) -> Dict[str, Any]:
+    p = dict(button="left", delay_ms=100,
+             stages=[], normal_sec=0, click_mode="follow", click_params={},
+             key_to_repeat=None, key_sequence=[], recorded_points=[], timing_policy="skip")
+    p.update(over)
+    return p
+
+def run_case(name: str, params: Dict[str, Any], duration: float,
+             phases: Optional[List[tuple]] = None) -> Dict[str, Any]:
+    """1ケース実行。phases=[(境界秒, 旧ms, 新ms), ...] があれば段切替の誤差も測る"""
+    io = RecordingBackend()
+    eng = AutoClickEngine(io, hooks=False)
+    eng.set_params(**params)
+    cpu0 = time.process_time(); t_start = time.perf_counter()
+    eng.toggle()
+    time.sleep(duration)
+    eng.toggle()
+    th = eng._worker_thread
+    if th: th.join(2.0)
+    wall = time.perf_counter() - t_start; cpu = time.process_time() - cpu0
+    eng.shutdown()
+
+    ts = io.times()
+    res: Dict[str, Any] = {"name": name, "duration_s": round(wall, 4), "actions": len(ts),
+                           "cpu_pct": round(100.0 * cpu / wall, 2) if wall > 0 else 0.0}
+    if len(ts) < 2:
+        return res
+    gaps = [b - a for a, b in zip(ts, ts[1:])]
+    span = ts[-1] - ts[0]
+    res["rate_per_s"] = round((len(ts) - 1) / span, 3) if span > 0 else 0.0
+    if phases is None:
+        target = params["delay_ms"] / 1000.0
+        res["target_per_s"] = round(1.0 / target, 3)
+        err = sorted(abs(g - target) * 1000.0 for g in gaps)
+        res["jitter_ms"] = {"p50": round(_pct(err, .5), 4), "p99": round(_pct(err, .99), 4), "max": round(err[-1], 4)}
+    else:
+        # 段切替: 新間隔に近い最初のギャップの始点 ↔ 期待境界
+        errs = []
+        for boundary, old_ms, new_ms in phases:
+            expect = ts[0] + boundary
+            for a, g in zip(ts, gaps):
+                if a >= expect - old_ms / 1000.0 and abs(g * 1000 - new_ms) < abs(g * 1000 - old_ms):
+                    errs.append(round((a - expect) * 1000.0, 4)); break
+        res["phase_switch_error_ms"] = errs
+    return res
+
+class _FakeKey:
+    """pynput のキーの代わり（正規化に使う name / char / vk だけ持つ）"""
+    __slots__ = ("name", "char", "vk")
+    def __init__(self, name=None, char=None, vk=None): self.name = name; self.char = char; self.vk = vk
+
+def run_hook_case(n: int = 20000) -> Dict[str, Any]:
+    """キーボードフックのコールバックにキーイベントを n 件流し、コールバック所要時間とディスパッチ遅延を測る"""
+    eng = AutoClickEngine(RecordingBackend(), hooks=False)
+    keys = [_FakeKey(char=c) for c in "asdfghjkl"] + [_FakeKey(name="shift"), _FakeKey(name="f5")]
+    for i in range(n // 2):
+        k = keys[i % len(keys)]
+        eng._on_press(k); eng._on_release(k)
+        if i % 64 == 0: time.sleep(0)   # 人間の打鍵よりずっと密だが、ディスパッチャにも回す
+    hm = eng.hook_metrics; end = time.perf_counter() + 5.0
+    while hm._li < hm.events and time.perf_counter() < end: time.sleep(0.01)
+    eng.shutdown()
+    return {"name": f"hook/{n}", **{k: (round(v, 3) if isinstance(v, float) else v) for k, v in hm.snapshot().items()}}
+
+def run_trigger_case(n: int = 50, interval_ms: int = 2) -> Dict[str, Any]:
+    """合成画面で監視領域を n 回変え、画面の変化から操作までの遅延（監視間隔の待ちを含む）を測る。numpy が無ければ None"""
+    try:
+        from capture import SyntheticCapture, np
+    except ImportError:
+        return None
+    if np is None: return None   # capture は numpy なしでも読み込めるので、ここで確かめる
+    src = SyntheticCapture(640, 480); io = RecordingBackend()
+    eng = AutoClickEngine(io, hooks=False, capture=src)
+    eng.set_params(**_params(delay_ms=1, trigger={"type": "change", "x1": 100, "y1": 100, "x2": 163, "y2": 163,
+                                                  "interval_ms": interval_ms}))
+    eng.toggle(); time.sleep(0.05)
+    lat = []
+    for i in range(n):
+        f = src.frame.copy(); f[100:164, 100:164] = 255 if i % 2 == 0 else 0
+        k = len(io.times()); src.set_frame(f)
+        end = src.changed_at + 0.5
+        while len(io.times()) == k and time.perf_counter() < end: time.sleep(0.0002)
+        if len(io.times()) > k: lat.append((io.times()[k] - src.changed_at) * 1000.0)
+        time.sleep(0.01)
+    eng.toggle()
+    th = eng._worker_thread
+    if th: th.join(2.0)
+    snap = eng.stats(); eng.shutdown()
+    lat.sort()
+    return {"name": f"trigger/change/{interval_ms}ms", "changes": n, "fires": len(lat),
+            "react_ms": {"p50": round(_pct(lat, .5), 4), "p99": round(_pct(lat, .99), 4), "max": round(lat[-1], 4) if lat else 0.0},
+            "poll_p50_us": round(snap.get("trigger_poll_p50_us", 0.0), 3)}
+
+def run_template_case(n: int = 40, region=(800, 600), size=(48, 40)) -> Dict[str, Any]:
+    """合成画面で参照画像を n 回動かし、探索の所要時間を測る。
+    大きく動かした直後は領域全体の探索（full）、そのあと数px ずつ動かす間は前回位置のまわりの探索（local）。numpy が無ければ None"""
+    try:
+        import numpy as np
+        from capture import SyntheticCapture
+        from finder import TemplateSpec, encode_image
+    except ImportError:
+        return None
+    rng = np.random.default_rng(0)
+    rw, rh = region; tw, th = size
+    tmpl = np.kron((rng.random((th // 4 + 1, tw // 4 + 1)) * 255).astype(np.uint8), np.ones((4, 4), np.uint8))[:th, :tw]
+    base = (rng.random((rh, rw, 3)) * 64).astype(np.uint8)
+    src = SyntheticCapture(rw, rh)
+    f = TemplateSpec({"x1": 0, "y1": 0, "x2": rw - 1, "y2": rh - 1,
+                      "image": encode_image(tw, th, tmpl.tobytes())}).finder(src)
+    full, local = [], []; hits = 0
+    for i in range(n):
+        x = int(rng.integers(0, rw - tw - 8)); y = int(rng.integers(0, rh - th - 8))
+        for j, (dx, dy) in enumerate(((0, 0), (2, 1), (4, 3), (7, 5))):
+            fr = base.copy(); fr[y + dy:y + dy + th, x + dx:x + dx + tw] = tmpl[:, :, None]; src.set_frame(fr)
+            t = time.perf_counter(); xy = f.find(); ms = (time.perf_counter() - t) * 1000.0
+            (local if f.local else full).append(ms)
+            hits += xy == (x + dx + tw // 2, y + dy + th // 2)
+    full.sort(); local.sort()
+    return {"name": f"template/{rw}x{rh}/{tw}x{th}", "searches": n * 4, "hits": hits,
+            "find_ms": {"local_p50": round(_pct(local, .5), 4), "local_p99": round(_pct(local, .99), 4),
+                        "full_p50": round(_pct(full, .5), 4), "full_p99": round(_pct(full, .99), 4)}}
+
+def run_config_case(n: int = 3000) -> Dict[str, Any]:
+    """プロファイル n 件の合成設定で読み込み・保存の時間を測る（一時ディレクトリで。実際の設定には触れない）。
+    legacy = 版番号なしの旧形式（全件移行してストアへ取り込み）、load = 最新版（名前の一覧だけ）、
+    names = 部分一致の絞り込み、save_full = 全件の書き直し（従来の動作）、save_one = 1件だけ差し替えた保存"""
+    import config
+    from points import PointBuffer, PointSidecar
+    d = tempfile.mkdtemp(prefix="acbench-")
+    saved = config.CFG_FILE, config._sidecar, config.STORE_FILE, config._store
+    config.CFG_FILE = os.path.join(d, "cfg.json"); config._sidecar = PointSidecar(os.path.join(d, "pts.bin"))
+    config.STORE_FILE = os.path.join(d, "profiles.sqlite3"); config._store = None
+    def ms(fn):
+        t = time.perf_counter(); r = fn(); return (time.perf_counter() - t) * 1000.0, r
+    try:
+        profs = {f"task{i:05d}": {"button": "left", "delay_ms": 20 + i % 200, "burst1_sec": i % 3, "burst1_ms": 10,
+                                  "click_mode": "random_rect", "click_params": {"x1": 0, "x2": 800, "y1": 0, "y2": 600},
+                                  "key_sequence": ["a", "d"], "macro": "click\nwait 50" if i % 7 == 0 else "",
+                                  "recorded_points": [[i % 1920, j] for j in range(i % 5)]}
+                 for i in range(n)}
+        with open(config.CFG_FILE, "w", encoding="utf-8") as f:
+            json.dump({"hotkey": "Ctrl+Alt", "profiles": profs, "last_profile": "task00000"}, f, ensure_ascii=False)
+        legacy, _ = ms(config.AppConfig.load)
+        load, cfg = ms(config.AppConfig.load)
+        pm = cfg["profiles"]
+        first, _ = ms(lambda: pm["task00001"])
+        names, _ = ms(lambda: pm.names("00"))
+        save_untouched, _ = ms(lambda: config.AppConfig.save(cfg))
+        p = dict(pm["task00002"]); p["delay_ms"] = 5; pm["task00002"] = p
+        save_one, _ = ms(lambda: config.AppConfig.save(cfg))
+        full = dict(cfg, profiles={k: dict(pm[k]) for k in pm})   # 全件が差し替わった扱い（従来の保存と同じ仕事）
+        save_full, _ = ms(lambda: config.AppConfig.save(full))
+        ok = config.AppConfig.load()["profiles"]["task00002"]["delay_ms"] == 5 and isinstance(pm["task00003"]["recorded_points"], PointBuffer)
+    finally:
+        if config._store is not None: config._store.close()
+        config.CFG_FILE, config._sidecar, config.STORE_FILE, config._store = saved
+        shutil.rmtree(d, ignore_errors=True)
+    r = lambda v: round(v, 3)
+    return {"name": f"config/{n}profiles", "ok": ok,
+            "config_ms": {"load_legacy": r(legacy), "load": r(load), "first_access": r(first), "names": r(names),
+                          "save_untouched": r(save_untouched), "save_one": r(save_one), "save_full": r(save_full)}}
+
+def extra_cases() -> List[tuple]:
+    """間隔ごとのケース以外（名前, 実行関数）。名前は既定の引数で各関数が返す name と同じ"""
+    return [("hook/20000", run_hook_case), ("trigger/change/2ms", run_trigger_case),
+            ("config/3000profiles", run_config_case), ("template/800x600/48x40", run_template_case)]
+
+def cases(intervals) -> List[tuple]:
+    out = []
+    pts = [(i * 7 % 1920, i * 13 % 1080) for i in range(1000)]
+    for ms in intervals:
+        dur = max(1.0, min(20 * ms / 1000.0, 20.0))
+        out.append((f"follow/left/{ms}ms", _params(delay_ms=ms), dur, None))
+        out.append((f"fixed/left/{ms}ms", _params(delay_ms=ms, click_mode="fixed", click_params={"x": 10, "y": 20}), dur, None))
+        out.append((f"random_rect/left/{ms}ms", _params(delay_ms=ms, click_mode="random_rect",
+                                                       click_params={"x1": 0, "x2": 800, "y1": 0, "y2": 600}), dur, None))
+        out.append((f"random_gauss/left/{ms}ms", _params(delay_ms=ms, click_mode="random_rect",
+                                                        click_params={"x1": 0, "x2": 800, "y1": 0, "y2": 600,
+                                                                      "dist": "gaussian", "seed": 1}), dur, None))
+        out.append((f"recorded1000/left/{ms}ms", _params(delay_ms=ms, click_mode="recorded", recorded_points=pts), dur, None))
+        out.append((f"macro/{ms}ms", _params(button="macro", delay_ms=ms,
+                                             macro=f"loop 1000\nclick left 10 20\nwait {ms}\nend"), dur, None))
+        out.append((f"keyseq/{ms}ms", _params(button="key", delay_ms=ms, key_sequence=["A", "D", "F8"]), dur, None))
+    # 段1→段2→通常
+    for b1, b2, d in ((5, 1, 20), (50, 20, 100)):
+        out.append((f"burst/{b1}->{b2}->{d}ms",
+                    _params(delay_ms=d, stages=[{"ms": b1, "sec": 1}, {"ms": b2, "sec": 1}]), 3.0,
+                    [(1.0, b1, b2), (2.0, b2, d)]))
+    # 多段カーブ（段数が増えても1ティックのコストが変わらないことの確認用）
+    many = [{"ms": 2 + i % 3, "sec": 0.05, "ramp": ("step", "linear", "exp")[i % 3]} for i in range(200)]
+    out.append(("curve/200stages->5ms", _params(delay_ms=5, stages=many), 3.0, []))
+    return out
+
+def _meta() -> Dict[str, Any]:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        rev = ""
+    return {"commit": rev, "python": sys.version.split()[0], "platform": platform.platform(),
+            "at": int(time.time())}
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    prev = {r["name"]: r for r in old.get("results", [])}
+    print(f"{'case':32} {'rate(old→new)':>24} {'p99 jitter ms(old→new)':>28}")
+    for r in new.get("results", []):
+        o = prev.get(r["name"])
+        if not o: continue
+        if "hook_cb_p99_us" in r:
+            print(f"{r['name']:32} {'hook p99 us':>24} {o.get('hook_cb_p99_us', 0):.2f}→{r['hook_cb_p99_us']:.2f}"); continue
+        if "config_ms" in r:
+            print(f"{r['name']:32} {'load / save_one ms':>24} {o.get('config_ms', {}).get('load', 0):.1f}→{r['config_ms']['load']:.1f} / "
+                  f"{o.get('config_ms', {}).get('save_one', 0):.1f}→{r['config_ms']['save_one']:.1f}"); continue
+        if "find_ms" in r:
+            print(f"{r['name']:32} {'find local p50 ms':>24} {o.get('find_ms', {}).get('local_p50', 0):.3f}→{r['find_ms']['local_p50']:.3f}"); continue
+        if "react_ms" in r:
+            print(f"{r['name']:32} {'react p99 ms':>24} {o.get('react_ms', {}).get('p99', 0):.3f}→{r['react_ms']['p99']:.3f}"); continue
+        rate = f"{o.get('rate_per_s', 0):.1f}→{r.get('rate_per_s', 0):.1f}"
+        j = f"{o.get('jitter_ms', {}).get('p99', 0):.3f}→{r.get('jitter_ms', {}).get('p99', 0):.3f}"
+        print(f"{r['name']:32} {rate:>24} {j:>28}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="AutoClickEngine benchmark (headless)")
+    ap.add_argument("--quick", action="store_true", help="1s間隔を除いた短時間セット")
+    ap.add_argument("--filter", default="", help="ケース名の部分一致で絞り込み")
+    ap.add_argument("--out", default="", help="結果JSONの出力先")
+    ap.add_argument("--compare", default="", help="比較対象の結果JSON")
+    a = ap.parse_args(argv)
+
+    results = []
+    for name, params, dur, phases in cases(QUICK_INTERVALS_MS if a.quick else INTERVALS_MS):
+        if a.filter and a.filter not in name: continue
+        r = run_case(name, params, dur, phases)
+        results.append(r)
+        print(json.dumps(r, ensure_ascii=False), flush=True)
+    for name, run in extra_cases():
+        if a.filter and a.filter not in name: continue
+        r = run()
+        if r is None: continue   # 必要なモジュールが無い
+        results.append(r)
+        print(json.dumps(r, ensure_ascii=False), flush=True)
+    doc = {"meta": _meta(), "results": results}
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f:
+            json.dump(doc, f, ensure_ascii=False, indent=2)
+    if a.compare:
+        with open(a.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), doc)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import threading, time
+from typing import Any, Dict, Optional, Tuple
+try:
+    import numpy as np   # トリガー（領域の差分・色判定）に必要
+except ImportError:
+    np = None
+
+# ===== 画面の取り込み =====
+# grab(rect) は rect=(x1, x2, y1, y2)（両端を含む）の領域だけを (h, w, 3) の uint8 RGB 配列で返す（取れなければ None）。
+# 実画面は mss（無ければ Pillow の ImageGrab）。SyntheticCapture はテスト・ベンチ用に任意の画面を流し込める。
+
+Rect = Tuple[int, int, int, int]   # (x1, x2, y1, y2)
+
+
+class CaptureSource:
+    name = "none"
+    def grab(self, rect: Rect) -> Optional["np.ndarray"]: return None
+    def close(self): pass
+
+
+class MssCapture(CaptureSource):
+    """mss で領域だけを取り込む。mss のインスタンスはスレッドごとに作る（Windows ではスレッドをまたげない）"""
+    name = "mss"
+
+    def __init__(self):
+        import mss   # noqa: F401  無ければ ImportError（create_capture がフォールバック）
+        self._tls = threading.local()
+
+    def grab(self, rect: Rect):
+        sct = getattr(self._tls, "sct", None)
+        if sct is None:
+            import mss
+            sct = self._tls.sct = mss.mss()
+        x1, x2, y1, y2 = rect
+        shot = sct.grab({"left": x1, "top": y1, "width": x2 - x1 + 1, "height": y2 - y1 + 1})
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        return bgra[:, :, 2::-1]   # BGRA → RGB（コピーしないビュー）
+
+
+class PilCapture(CaptureSource):
+    name = "pil"
+
+    def __init__(self):
+        from PIL import ImageGrab
+        self._grab = ImageGrab.grab
+
+    def grab(self, rect: Rect):
+        x1, x2, y1, y2 = rect
+        return np.asarray(self._grab(bbox=(x1, y1, x2 + 1, y2 + 1)).convert("RGB"))
+
+
+class SyntheticCapture(CaptureSource):
+    """合成画面（テスト・ベンチ用）。set_frame() で画面全体を差し替え、grab() はそこから領域を切り出す。
+    changed_at に差し替えた時刻（perf_counter）を残すので、画面の変化から操作までの遅延を外から測れる"""
+    name = "synthetic"
+
+    def __init__(self, width: int = 1920, height: int = 1080):
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.changed_at = 0.0
+        self.grabs = 0
+
+    def set_frame(self, frame: "np.ndarray"):
+        self.frame = frame; self.changed_at = time.perf_counter()
+
+    def grab(self, rect: Rect):
+        x1, x2, y1, y2 = rect
+        self.grabs += 1
+        return self.frame[y1:y2 + 1, x1:x2 + 1]
+
+
+def create_capture(name: Optional[str] = None) -> CaptureSource:
+    """使える取り込み方法を返す（numpy が無い・どれも使えない環境では何も取れない CaptureSource）"""
+    if np is None: return CaptureSource()
+    order = [name] if name in ("mss", "pil") else ["mss", "pil"]
+    for n in order:
+        try:
+            return MssCapture() if n == "mss" else PilCapture()
+        except Exception:
+            continue
+    return CaptureSource()
+
+
+# ===== トリガー =====
+#   change : 前回の取り込みから tol を超えて変わった画素が ratio 以上なら発火
+#   color  : color から tol 以内の画素が ratio 以上になった瞬間に発火（一致し続けている間は発火しない）
+TRIGGERS = ("none", "change", "color")
+
+def _rect(d: Dict[str, Any]) -> Rect:
+    x1 = int(d.get("x1", 0)); x2 = int(d.get("x2", 31))
+    y1 = int(d.get("y1", 0)); y2 = int(d.get("y2", 31))
+    return (max(0, min(x1, x2)), max(x1, x2), max(0, min(y1, y2)), max(y1, y2))
+
+def parse_color(s: Any) -> Tuple[int, int, int]:
+    """'#RRGGBB' / 'R,G,B' / [R, G, B] → (R, G, B)。読めなければ白"""
+    try:
+        if isinstance(s, (list, tuple)) and len(s) == 3:
+            return tuple(max(0, min(255, int(v))) for v in s)   # type: ignore[return-value]
+        s = str(s).strip()
+        if s.startswith("#") and len(s) == 7:
+            return (int(s[1:3], 16), int(s[3:5], 16), int(s[5:7], 16))
+        r, g, b = (int(v) for v in s.split(","))
+        return (max(0, min(255, r)), max(0, min(255, g)), max(0, min(255, b)))
+    except (TypeError, ValueError):
+        return (255, 255, 255)
+
+
+class TriggerSpec:
+    """profile["trigger"] から作る不変の定義。ClickPlan が持ち、実行ごとに watcher() で状態を作る"""
+    __slots__ = ("kind", "rect", "color", "tol", "ratio", "interval_s", "_key")
+
+    def __init__(self, d: Dict[str, Any]):
+        st = object.__setattr__
+        kind = d.get("type", "none")
+        st(self, "kind", kind if kind in TRIGGERS else "none")
+        st(self, "rect", _rect(d))
+        st(self, "color", parse_color(d.get("color", "#ffffff")))
+        st(self, "tol", max(0, min(255, int(d.get("tol", 24)))))
+        st(self, "ratio", max(0.0, min(1.0, float(d.get("ratio", 0.01)))))
+        st(self, "interval_s", max(1, int(d.get("interval_ms", 10))) / 1000.0)
+        st(self, "_key", (self.kind, self.rect, self.color, self.tol, self.ratio, self.interval_s))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TriggerSpec is immutable")
+
+    def __eq__(self, other): return isinstance(other, TriggerSpec) and self._key == other._key
+    def __hash__(self): return hash(self._key)
+
+    def watcher(self, source: CaptureSource) -> "TriggerWatcher":
+        return TriggerWatcher(self, source)
+
+
+class TriggerWatcher:
+    """ワーカー専有の監視状態（前回の画面・一致状態・作業用バッファ）。poll() は取り込み1回と判定1回"""
+    __slots__ = ("spec", "source", "_prev", "_diff", "_on", "_need", "_color")
+
+    def __init__(self, spec: TriggerSpec, source: CaptureSource):
+        self.spec = spec; self.source = source
+        self._prev = None; self._diff = None; self._on = False
+        x1, x2, y1, y2 = spec.rect
+        self._need = max(1, int(round(spec.ratio * (x2 - x1 + 1) * (y2 - y1 + 1))))   # 必要な画素数
+        self._color = np.asarray(spec.color, dtype=np.int16) if np is not None else None
+
+    def rearm(self):
+        """発火後に呼ぶ。待ち（クールダウン）の間の変化では次に発火しないよう、差分の基準を取り直させる"""
+        self._prev = None
+
+    def poll(self) -> bool:
+        """取り込んで判定。発火すべきなら True"""
+        if np is None: return False
+        frame = self.source.grab(self.spec.rect)
+        if frame is None: return False
+        cur = frame.astype(np.int16)   # 差分用に符号付きへ（ついでに取り込み元のバッファから切り離す）
+        if self.spec.kind == "color":
+            hit = int(np.count_nonzero(np.abs(cur - self._color).max(axis=2) <= self.spec.tol)) >= self._need
+            fire = hit and not self._on
+            self._on = hit
+            return fire
+        prev = self._prev; self._prev = cur
+        if prev is None or prev.shape != cur.shape: return False
+        d = self._diff
+        if d is None or d.shape != cur.shape: d = self._diff = np.empty_like(cur)
+        np.subtract(cur, prev, out=d); np.abs(d, out=d)
+        return int(np.count_nonzero(d.max(axis=2) > self.spec.tol)) >= self._need
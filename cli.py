@@ -0,0 +1,137 @@
+"""AutoClicker のコンソール版（GUI・Qt なし。キオスク端末や検証機用）
+
+    python cli.py --list                     # プロファイル一覧
+    python cli.py --list 連打                 # 名前に「連打」を含むものだけ
+    python cli.py 連打A                       # ホットキーで開始/停止（Ctrl+C で終了）
+    python cli.py 連打A --duration 30         # すぐ開始して30秒で停止・終了
+    python cli.py 連打A --backend record --duration 5 --stats 0.5
+    python cli.py 連打A --duration 10 --events 30   # 終了時にイベントログの直近30件を表示
+
+プロファイルと既定のホットキーは GUI と同じ設定ファイル（AppConfig）から読む。
+"""
+import argparse, json, sys, threading, time
+from typing import Any, Dict, Optional, Tuple
+from config import AppConfig, ProfileMap
+from backends import create_backend
+from processor import AutoClickEngine, EngineEvents, HotkeySpec
+from macro import MacroError
+from eventlog import EventLog
+from utils import LOGS_DIR
+
+class ConsoleEvents(EngineEvents):
+    """エンジンの通知をコンソールへ。統計は stats_s ごとに1行（エンジンの間引きより粗くしたいとき用）"""
+    def __init__(self, stats_s: float, out=sys.stdout):
+        self.stats_s = stats_s; self.out = out
+        self.stopped = threading.Event()
+        self._last = 0.0
+
+    def _print(self, s: str):
+        print(s, file=self.out, flush=True)
+
+    def on_state_changed(self, running: bool):
+        if running: self.stopped.clear()
+        else: self.stopped.set()
+        self._print("開始" if running else "停止")
+
+    def on_point_recorded(self, x: int, y: int):
+        self._print(f"記録: ({x}, {y})")
+
+    def on_metrics(self, snap: Dict[str, Any]):
+        now = time.perf_counter()
+        if self.stats_s <= 0 or now - self._last < self.stats_s: return
+        self._last = now
+        self._print(format_stats(snap))
+
+def format_stats(snap: Dict[str, Any]) -> str:
+    return (f"{snap.get('uptime_s', 0):7.1f}s  {snap.get('actions', 0):8d}回  "
+            f"{snap.get('rate_per_s', 0):8.1f}回/秒（目標 {snap.get('target_ms', 0):.1f}ms）  "
+            f"ジッタ p50 {snap.get('jitter_p50_ms', 0):.2f}ms / p99 {snap.get('jitter_p99_ms', 0):.2f}ms  "
+            f"取りこぼし {snap.get('missed', 0)}  エラー {snap.get('errors', 0)}")
+
+def _screen(s: Optional[str]) -> Optional[Tuple[int, int]]:
+    if not s: return None
+    w, _, h = s.lower().partition("x")
+    try:
+        return int(w), int(h)
+    except ValueError:
+        raise SystemExit(f"--screen は 1920x1080 の形式で指定してください: {s}")
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="AutoClicker（ヘッドレス）")
+    ap.add_argument("profile", nargs="?", help="プロファイル名（省略時は最後に使ったもの）")
+    ap.add_argument("--list", nargs="?", const="", metavar="PATTERN",
+                    help="プロファイル一覧を表示して終了（PATTERN を含む名前だけ。大文字小文字は区別しない）")
+    ap.add_argument("--duration", type=float, default=0.0, help="すぐ開始してこの秒数で停止・終了（0=ホットキー待ち）")
+    ap.add_argument("--hotkey", help="開始/停止ホットキー（既定は設定ファイルの値。カンマ区切りで複数）")
+    ap.add_argument("--stats", type=float, default=1.0, help="統計の表示間隔（秒。0で表示しない）")
+    ap.add_argument("--backend", help="入力バックエンド pynput / uinput / record（既定は設定ファイルの値）")
+    ap.add_argument("--screen", help="uinput の画面サイズ（例: 1920x1080）")
+    ap.add_argument("--control", nargs="?", const="", metavar="ADDRESS",
+                    help="制御API（control.py）を待ち受ける。アドレス省略時は既定のソケット")
+    ap.add_argument("--events", type=int, default=0, metavar="N",
+                    help="終了時にイベントログ（logs/ にも記録）の直近 N 件を表示")
+    a = ap.parse_args(argv)
+
+    cfg = AppConfig.load()
+    profiles = cfg.get("profiles") or {}
+    if a.list is not None:
+        names = profiles.names(a.list) if isinstance(profiles, ProfileMap) else \
+            sorted(n for n in profiles if a.list.casefold() in n.casefold())
+        for name in names: print(name)
+        return 0
+    name = a.profile or cfg.get("last_profile") or ""
+    if name not in profiles:
+        print(f"プロファイルがありません: {name or '（未指定）'}", file=sys.stderr)
+        return 2
+
+    ev = ConsoleEvents(a.stats)
+    io = create_backend(a.backend or cfg.get("input_backend", "pynput"), _screen(a.screen))
+    eng = AutoClickEngine(io, hooks=False, events=ev, log=EventLog(LOGS_DIR))
+    try:
+        eng.set_profile(profiles[name])
+    except MacroError as ex:
+        print(f"マクロのエラー: {ex}", file=sys.stderr)
+        eng.shutdown(); return 2
+    print(f"プロファイル: {name}（ジョブ {eng.job_count()}）  バックエンド: {io.name}")
+    ctl = None
+    if a.control is not None:
+        from control import ControlServer
+        ctl = ControlServer(eng, a.control or None, params=profiles[name], profiles=profiles.get)
+        try:
+            ctl.start()
+        except OSError as ex:
+            print(f"制御APIを開始できません: {ex}", file=sys.stderr)
+            eng.shutdown(); return 1
+        print(f"制御API: {ctl.address}")
+
+    try:
+        if a.duration > 0:
+            eng.toggle()
+            ev.stopped.wait(a.duration)   # マクロの stop などで先に止まることもある
+            if eng.is_running(): eng.toggle()
+        else:
+            hks = HotkeySpec.parse_many(a.hotkey or cfg.get("hotkey", "Ctrl+Alt"))
+            if not hks:
+                print(f"ホットキーが不正です: {a.hotkey}", file=sys.stderr); return 2
+            eng.set_hotkeys(hks)
+            if eng.start_hooks():
+                print("ホットキーで開始/停止（Ctrl+C で終了）")
+            elif ctl:
+                print("キーボードフックなし。制御APIで開始/停止（Ctrl+C で終了）")
+            else:
+                print("キーボードフックを開始できません（--duration か --control を使ってください）", file=sys.stderr); return 1
+            while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        if eng.is_running(): eng.toggle()
+    finally:
+        if ctl: ctl.stop()
+        th = eng._worker_thread
+        if th: th.join(2.0)
+        eng.shutdown()
+    print(format_stats(eng.stats()))
+    for e in eng.log.tail(a.events) if a.events > 0 else ():
+        print(json.dumps(e, ensure_ascii=False, default=str))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
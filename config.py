@@ -1,30 +1,65 @@
-import json, os, time
-from typing import Dict, Any, List
+import bisect, json, os, time, threading
+from collections.abc import MutableMapping
+from typing import Dict, Any, Iterator, List, Optional
 from utils import CONFIG_DIR, ensure_app_dirs
+from points import PointBuffer, PointSidecar
+from curve import CURVE_ENDS, clean_stages, stages_from_bursts
+from store import ProfileStore
 
 CFG_FILE = os.path.join(CONFIG_DIR, "[config]AutoClickerQt_setting.json")
+POINTS_FILE = os.path.join(CONFIG_DIR, "[config]AutoClickerQt_points.bin")   # 記録点（int32 バイナリ）
+STORE_FILE = os.path.join(CONFIG_DIR, "[config]AutoClickerQt_profiles.sqlite3")  # プロファイル本体（store.py）
+_sidecar = PointSidecar(POINTS_FILE)
+_store: Optional[ProfileStore] = None
+_log = None   # eventlog.EventLog（AppConfig.attach_log で渡す）。保存の失敗を記録する
+
+def _log_error(where: str, ex: BaseException) -> None:
+    if _log is not None: _log.error(where, ex)
+
+def _profile_store() -> ProfileStore:
+    global _store
+    if _store is None or _store.path != STORE_FILE:
+        _store = ProfileStore(STORE_FILE, os.path.splitext(STORE_FILE)[0] + "_points.bin")   # 大きな記録点の置き場
+    return _store
 
 _DEFAULTS = {
     "hotkey": "Ctrl+Alt",
     "start_minimized": False,
+    "input_backend": "pynput",   # 'pynput'|'uinput'
     "profiles": {},
     "last_profile": None,
-    "profiles_history": [] 
+    "profiles_history": [],   # [{"name","at","delta"}] 古い→新しい。delta は同名の1つ新しい版からの差分
+    "history_base": {}        # {name: 同名の最新スナップショット}（差分の起点）
 }
 
+HISTORY_MAX = 300
+SCHEMA_VERSION = 3   # 保存形式の版（1 = 版番号なし、2 = プロファイルも JSON 内、3 = プロファイルは STORE_FILE）
+
 _PROFILE_DEFAULT = {
     "button": "left",
     "delay_ms": 100,
-    "burst1_enabled": False, "burst1_sec": 0, "burst1_ms": 50,
-    "burst2_enabled": False, "burst2_sec": 0, "burst2_ms": 20,
-    "normal_sec": 0,
+    "stages": [],                      # レートカーブの段 [{"ms","sec","ramp"}]（curve.py）
+    "normal_sec": 0,                   # 通常間隔の持続（0=無制限）。過ぎたら curve_end に従う
+    "curve_end": "loop",
+    "duration_s": 0, "budget": 0,      # 総時間（秒）・総回数の上限（0=無制限）
+    "timing_policy": "skip",
     "click_mode": "follow",
     "click_params": {},
     "key_to_repeat": None,
     "key_sequence": [],
-    "recorded_points": [] 
+    "macro": "",                       # button == "macro" のときに実行するマクロ（macro.py）
+    "trigger": {},                     # 画面トリガー {"type": "change"|"color", x1..y2, color, tol, ratio, interval_ms}（capture.py）
+    "recorded_points": PointBuffer(),  # JSON 上は {"$pts": key} でサイドカーを参照
+    "jobs": []                         # 並行して回す追加ジョブ（各要素はプロファイルと同じ形。入れ子なし）
 }
 
+def _coerce_points(v) -> PointBuffer:
+    if isinstance(v, dict): return PointBuffer()   # 未解決のサイドカー参照
+    try:
+        return PointBuffer.coerce(v)
+    except Exception:
+        return PointBuffer()
+
 def _migrate_profile(p: Dict[str, Any]) -> Dict[str, Any]:
     out = _PROFILE_DEFAULT.copy()
     if not isinstance(p, dict): return out
@@ -35,17 +70,28 @@ def _migrate_profile(p: Dict[str, Any]) -> Dict[str, Any]:
         "click_params": p.get("click_params", out["click_params"]) or {},
         "key_to_repeat": p.get("key_to_repeat", out["key_to_repeat"]),
         "normal_sec": int(p.get("normal_sec", out["normal_sec"])),
-        "recorded_points": p.get("recorded_points", out["recorded_points"]) or []
+        "curve_end": p.get("curve_end") if p.get("curve_end") in CURVE_ENDS else out["curve_end"],
+        "duration_s": max(0, int(p.get("duration_s", 0) or 0)),
+        "budget": max(0, int(p.get("budget", 0) or 0)),
+        "timing_policy": p.get("timing_policy") if p.get("timing_policy") in ("catchup","skip","reset") else out["timing_policy"],
+        "macro": str(p.get("macro") or ""),
+        "trigger": dict(p["trigger"]) if isinstance(p.get("trigger"), dict) else {},
+        "recorded_points": _coerce_points(p.get("recorded_points"))
     })
-    b1_sec = int(p.get("burst1_sec", 0)); b1_ms = int(p.get("burst1_ms", out["burst1_ms"]))
-    b2_sec = int(p.get("burst2_sec", 0)); b2_ms = int(p.get("burst2_ms", out["burst2_ms"]))
-    out["burst1_sec"] = b1_sec; out["burst1_ms"] = b1_ms
-    out["burst2_sec"] = b2_sec; out["burst2_ms"] = b2_ms
-    out["burst1_enabled"] = bool(p.get("burst1_enabled", b1_sec > 0))
-    out["burst2_enabled"] = bool(p.get("burst2_enabled", b2_sec > 0))
+    # 段: 旧形式（段1/段2 の burst*_*）なら段のリストへ
+    out["stages"] = clean_stages(p["stages"]) if "stages" in p else stages_from_bursts(p)
     ks = p.get("key_sequence", [])
     if not isinstance(ks, list): ks = []
     out["key_sequence"] = [str(x).strip().upper() for x in ks if str(x).strip()]
+    jobs = p.get("jobs", [])
+    out["jobs"] = [_migrate_job(j) for j in jobs if isinstance(j, dict)] if isinstance(jobs, list) else []
+    return out
+
+def _migrate_job(j: Dict[str, Any]) -> Dict[str, Any]:
+    """追加ジョブ1件。記録点はサイドカーを使わず JSON にそのまま持つ（ジョブ側は少数の想定）"""
+    out = _migrate_profile({k: v for k, v in j.items() if k != "jobs"})
+    del out["jobs"]
+    out["recorded_points"] = [list(xy) for xy in out["recorded_points"]]
     return out
 
 def _migrate_all(data: Dict[str, Any]) -> Dict[str, Any]:
@@ -58,24 +104,260 @@ def _migrate_all(data: Dict[str, Any]) -> Dict[str, Any]:
     lp = data.get("last_profile")
     out["last_profile"] = lp if isinstance(lp, str) and lp in migrated else None
     # 履歴
+    out["profiles_history"] = []; out["history_base"] = {}
     hist = data.get("profiles_history", [])
-    if isinstance(hist, list):
-        # 形式を軽く正規化
-        clean = []
-        for item in hist[-10:]:
+    if not isinstance(hist, list): hist = []
+    if any(isinstance(it, dict) and "data" in it for it in hist):
+        # 旧形式（全文スナップショット）→ 古い順に積み直して差分形式へ
+        for item in hist:
             try:
-                clean.append({
-                    "name": str(item.get("name")),
-                    "at":  int(item.get("at", int(time.time()))),
-                    "data": _migrate_profile(item.get("data", {}))
-                })
+                AppConfig.push_history(out, str(item.get("name")), item.get("data", {}),
+                                       at=int(item.get("at", int(time.time()))))
             except Exception:
                 pass
-        out["profiles_history"] = clean[-10:]
     else:
-        out["profiles_history"] = []
+        bases = data.get("history_base", {})
+        if not isinstance(bases, dict): bases = {}
+        out["history_base"] = {str(n): _migrate_profile(b) for n, b in bases.items()}
+        clean = []
+        for item in hist[-HISTORY_MAX:]:
+            try:
+                name = str(item.get("name"))
+                if name not in out["history_base"]: continue
+                delta = item.get("delta", {})
+                clean.append({"name": name, "at": int(item.get("at", int(time.time()))),
+                              "delta": delta if isinstance(delta, dict) else {}})
+            except Exception:
+                pass
+        out["profiles_history"] = clean
+        _trim_history(out)
+    return out
+
+# ===== プロファイル（ProfileStore の窓口） =====
+class ProfileMap(MutableMapping):
+    """プロファイル名 → プロファイル。起動時は名前の一覧だけを読み、中身は最初に触れたときに1件ずつ読んで移行する。
+    変更・削除は名前だけ覚えておき、保存（ConfigWriter のスレッド）で変わった分だけ検証して1トランザクションで書く
+    （GUI はプロファイル dict を差し替えるだけで中身は書き換えないので、保存時に読む値は差し替えた時点のもの）。
+    store が None なら保存先のないメモリ上だけの一覧"""
+    def __init__(self, store: Optional[ProfileStore] = None):
+        self.store = store
+        self._lock = threading.Lock()
+        self._names: List[str] = store.names() if store is not None else []   # 名前順
+        self._known = set(self._names)
+        self._vals: Dict[str, Dict[str, Any]] = {}   # 読み込み済み・変更済み
+        self._dirty: set = set()
+
+    def __getitem__(self, name: str) -> Dict[str, Any]:
+        v = self._vals.get(name)
+        if v is not None: return v
+        if name not in self._known or self.store is None: raise KeyError(name)
+        raw = self.store.get(name)
+        if raw is None: raise KeyError(name)
+        v = self._vals[name] = _migrate_profile(raw)
+        return v
+
+    def __setitem__(self, name: str, p: Dict[str, Any]):
+        with self._lock:
+            if name not in self._known:
+                bisect.insort(self._names, name); self._known.add(name)
+            self._vals[name] = p; self._dirty.add(name)
+
+    def __delitem__(self, name: str):
+        with self._lock:
+            if name not in self._known: raise KeyError(name)
+            self._names.pop(bisect.bisect_left(self._names, name)); self._known.discard(name)
+            self._vals.pop(name, None); self._dirty.add(name)
+
+    def __iter__(self) -> Iterator[str]: return iter(list(self._names))
+    def __len__(self) -> int: return len(self._names)
+    def __contains__(self, name) -> bool: return name in self._known
+
+    def names(self, like: str = "") -> List[str]:
+        """名前順の一覧。like は部分一致（大文字小文字を区別しない）"""
+        if not like: return list(self._names)
+        k = like.casefold()
+        return [n for n in list(self._names) if k in n.casefold()]
+
+    def commit(self) -> int:
+        """変更・削除をストアへ書く（書いた件数）。失敗したら変更の印を戻して例外を上げる（次の保存で再試行）"""
+        if self.store is None: return 0
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            ups = [(n, self._vals[n]) for n in dirty if n in self._known and n in self._vals]
+            dels = [n for n in dirty if n not in self._known]
+        if not ups and not dels: return 0
+        try:
+            self.store.write([(n, _migrate_profile(p)) for n, p in ups], dels)
+        except Exception:
+            with self._lock: self._dirty |= dirty
+            raise
+        return len(ups) + len(dels)
+
+# ===== 履歴（差分） =====
+def _diff(new: Dict[str, Any], old: Dict[str, Any]) -> Dict[str, Any]:
+    """new に適用すると old に戻る差分。リストで old が new の先頭部分なら長さだけ持つ（F12追記の典型）"""
+    d = {}
+    for k, ov in old.items():
+        nv = new.get(k)
+        if nv == ov: continue
+        if isinstance(ov, (list, PointBuffer)) and type(nv) is type(ov) and len(ov) < len(nv) and nv[:len(ov)] == ov:
+            d[k] = {"$prefix": len(ov)}
+        else:
+            d[k] = ov
+    return d
+
+def _apply(snap: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    if not delta: return snap
+    out = dict(snap)
+    for k, v in delta.items():
+        if isinstance(v, dict) and "$prefix" in v and isinstance(out.get(k), (list, PointBuffer)):
+            out[k] = out[k][:int(v["$prefix"])]
+        else:
+            out[k] = v
+    return out
+
+def _trim_history(cfg: Dict[str, Any]) -> None:
+    hist = cfg.get("profiles_history", [])
+    if len(hist) > HISTORY_MAX:
+        hist = hist[-HISTORY_MAX:]; cfg["profiles_history"] = hist
+    names = {it["name"] for it in hist}
+    bases = cfg.get("history_base", {})
+    if any(n not in names for n in bases):
+        cfg["history_base"] = {n: b for n, b in bases.items() if n in names}
+
+def _normalize(data: dict) -> dict:
+    """保存用に整形。別スレッドから呼ばれても良いように、dict/list は先に list() で写し取ってから走査する
+    （GUI側はプロファイルdictを差し替えるだけで中身は書き換えない）"""
+    d = _DEFAULTS.copy()
+    if isinstance(data, dict):
+        d["hotkey"] = data.get("hotkey", d["hotkey"])
+        d["start_minimized"] = bool(data.get("start_minimized", d["start_minimized"]))
+        d["input_backend"] = data.get("input_backend") if data.get("input_backend") in ("pynput","uinput") else d["input_backend"]
+        # profiles
+        profs = data.get("profiles", {})
+        if isinstance(profs, (dict, ProfileMap)):   # プロファイル本体はストアに書く（ここでは last_profile の確認だけ）
+            lp = data.get("last_profile")
+            d["last_profile"] = lp if isinstance(lp, str) and lp in profs else None
+        # history
+        hist = data.get("profiles_history", [])
+        bases = data.get("history_base", {})
+        if isinstance(hist, list) and isinstance(bases, dict):
+            d["profiles_history"] = list(hist[-HISTORY_MAX:])
+            d["history_base"] = dict(list(bases.items()))
+    del d["profiles"]
+    d["schema_version"] = SCHEMA_VERSION
+    return d
+
+# ===== 記録点 ⇔ サイドカー参照 =====
+def _map_points(d: dict, fn) -> dict:
+    """profiles / history_base / 履歴差分 の recorded_points に fn を適用した浅いコピーを返す"""
+    def prof(p):
+        if isinstance(p, dict) and "recorded_points" in p:
+            p = dict(p); p["recorded_points"] = fn(p["recorded_points"])
+        return p
+    out = dict(d)
+    if isinstance(d.get("profiles"), dict):
+        out["profiles"] = {n: prof(p) for n, p in list(d["profiles"].items())}
+    if isinstance(d.get("history_base"), dict):
+        out["history_base"] = {n: prof(p) for n, p in list(d["history_base"].items())}
+    if isinstance(d.get("profiles_history"), list):
+        out["profiles_history"] = [dict(it, delta=prof(it.get("delta"))) if isinstance(it, dict) and isinstance(it.get("delta"), dict) else it
+                                   for it in list(d["profiles_history"])]
     return out
 
+def _encode_points(d: dict, refs: Dict[str, PointBuffer]) -> dict:
+    def enc(v):
+        if isinstance(v, PointBuffer):
+            if not len(v): return []
+            refs[v.key] = v
+            return {"$pts": v.key}
+        return v
+    return _map_points(d, enc)
+
+def _decode_points(d: dict, table: Dict[str, PointBuffer]) -> dict:
+    def dec(v):
+        if isinstance(v, dict) and "$pts" in v: return table.get(str(v["$pts"]), PointBuffer())
+        return v
+    return _map_points(d, dec)
+
+def _write_atomic(path: str, d: dict) -> None:
+    """一時ファイルに書いてから rename（途中でクラッシュしても既存ファイルは壊れない）"""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(d, f, ensure_ascii=False, indent=2)
+        f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class ConfigWriter:
+    """設定の遅延・非同期保存（write-behind）。
+    mark_dirty() を何度呼んでも debounce_s 以内の変更は1回の書き込みにまとまり、整形とファイル書き込みは
+    バックグラウンドスレッドで行う。終了時は flush()/close() で同期的に書き切る"""
+    def __init__(self, debounce_s: float = 0.5):
+        self.debounce_s = debounce_s
+        self._lock = threading.Lock()        # 状態
+        self._io_lock = threading.Lock()     # 書き込みの直列化
+        self._evt = threading.Event()
+        self._cfg: dict | None = None
+        self._dirty_at = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self, cfg: dict):
+        with self._lock:
+            if self._closed: return
+            self._cfg = cfg; self._dirty_at = time.monotonic()
+        self._evt.set()
+
+    @property
+    def dirty(self) -> bool:
+        with self._lock: return self._cfg is not None
+
+    def _take(self) -> dict | None:
+        with self._lock:
+            cfg, self._cfg = self._cfg, None
+            self._evt.clear()
+            return cfg
+
+    def _write(self, cfg: dict):
+        with self._io_lock:
+            AppConfig.save(cfg)
+
+    def _run(self):
+        while True:
+            self._evt.wait()
+            with self._lock:
+                if self._closed: return
+                remain = self._dirty_at + self.debounce_s - time.monotonic()
+            if remain > 0:
+                time.sleep(remain); continue   # 静かになるまで待つ
+            cfg = self._take()
+            if cfg is not None: self._write(cfg)
+
+    def flush(self):
+        """保留中の変更を書き切る。裏で書き込み中ならその完了も待つ"""
+        cfg = self._take()
+        if cfg is not None:
+            self._write(cfg)
+        else:
+            with self._io_lock: pass
+
+    def close(self):
+        with self._lock: self._closed = True
+        self._evt.set()
+        if self._thread is not threading.current_thread(): self._thread.join()
+        self.flush()
+
+def _load_current(data: Dict[str, Any], table: Dict[str, PointBuffer]) -> Dict[str, Any]:
+    """最新版のファイル: 保存時に検証済みなので移行しない。プロファイルはストアの名前一覧だけ読む"""
+    cfg = _DEFAULTS.copy()
+    cfg.update({k: data.get(k, v) for k, v in _DEFAULTS.items() if k != "profiles"})
+    cfg = _decode_points(cfg, table)   # 記録点の参照を解決するのは履歴の起点・差分だけ（最大 HISTORY_MAX 件）
+    cfg["profiles"] = ProfileMap(_profile_store())
+    lp = cfg.get("last_profile")
+    cfg["last_profile"] = lp if isinstance(lp, str) and lp in cfg["profiles"] else None
+    return cfg
+
 class AppConfig:
     @staticmethod
     def load() -> dict:
@@ -84,46 +366,98 @@ class AppConfig:
             try:
                 with open(CFG_FILE, "r", encoding="utf-8") as f:
                     data = json.load(f) or {}
-                cfg = _migrate_all(data)
+                try:
+                    table = _sidecar.load()
+                except Exception:
+                    table = {}
+                if data.get("schema_version") == SCHEMA_VERSION:
+                    return _load_current(data, table)
+                # 旧形式 → 全件移行してストアへ取り込み、JSON は設定と履歴だけにして書き戻す（次回からは移行なし）
+                cfg = _migrate_all(_decode_points(data, table))
+                store = _profile_store()
+                store.replace_all(cfg["profiles"])
+                cfg["profiles"] = ProfileMap(store)
                 AppConfig.save(cfg)
                 return cfg
             except Exception:
                 pass
-        cfg = _DEFAULTS.copy()
-        AppConfig.save(cfg)
+        cfg = _DEFAULTS.copy()   # 初回は書かない（GUIが既定プロファイルを作った時点で保存される）
+        cfg["profiles"] = AppConfig.profile_map()
         return cfg
 
+    @staticmethod
+    def attach_log(log) -> None:
+        """保存の失敗を記録するイベントログ（None で外す）"""
+        global _log
+        _log = log
+
+    @staticmethod
+    def profile_map() -> ProfileMap:
+        """ストアにつながったプロファイル一覧（設定に profiles が無い・壊れているときの作り直し用）。
+        ストアを開けなければメモリ上だけ"""
+        try:
+            return ProfileMap(_profile_store())
+        except Exception:
+            return ProfileMap()
+
     @staticmethod
     def save(data: dict) -> None:
         ensure_app_dirs()
-        d = _DEFAULTS.copy()
-        if isinstance(data, dict):
-            d["hotkey"] = data.get("hotkey", d["hotkey"])
-            d["start_minimized"] = bool(data.get("start_minimized", d["start_minimized"]))
-            # profiles
-            profs = data.get("profiles", {})
-            if isinstance(profs, dict):
-                clean = {name: _migrate_profile(p) for name, p in profs.items()}
-                d["profiles"] = clean
-                # last_profile
-                lp = data.get("last_profile")
-                d["last_profile"] = lp if isinstance(lp, str) and lp in clean else None
-            # history
-            hist = data.get("profiles_history", [])
-            if isinstance(hist, list):
-                d["profiles_history"] = hist[-10:]
         try:
-            with open(CFG_FILE, "w", encoding="utf-8") as f:
-                json.dump(d, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
+            profs = data.get("profiles")
+            if isinstance(profs, ProfileMap):
+                profs.commit()                # 変わったプロファイルだけ
+            elif isinstance(profs, dict):     # 素の dict は追加・上書きだけ（ここに無いプロファイルは消さない）
+                _profile_store().write([(n, _migrate_profile(p)) for n, p in list(profs.items())])
+            refs: Dict[str, PointBuffer] = {}
+            d = _encode_points(_normalize(data), refs)
+        except Exception as ex:
+            _log_error("config.save", ex); return
+        try:
+            _sidecar.save(refs)           # 参照先を先に書く（JSON が存在しない点を指さないように）
+        except Exception as ex:
+            _log_error("points.save", ex)   # 記録点が書けなくても設定は書く（解けない参照は空の点列で読まれる）
+        try:
+            _write_atomic(CFG_FILE, d)
+        except Exception as ex:
+            _log_error("config.save", ex)
 
     @staticmethod
-    def push_history(cfg: dict, name: str, snapshot: Dict[str, Any]) -> dict:
-        """履歴へ追加（最大10件）"""
-        item = {"name": name, "at": int(time.time()), "data": _migrate_profile(snapshot)}
+    def push_history(cfg: dict, name: str, snapshot: Dict[str, Any], at: int | None = None) -> dict:
+        """履歴へ追加（最大 HISTORY_MAX 件）。全文ではなく差分で持ち、直前と同じなら追加しない"""
+        snap = _migrate_profile(snapshot)
+        now = int(time.time()) if at is None else at
         hist: List[Dict[str, Any]] = cfg.get("profiles_history", [])
         if not isinstance(hist, list): hist = []
-        hist.append(item)
-        cfg["profiles_history"] = hist[-10:]
+        bases: Dict[str, Any] = cfg.get("history_base", {})
+        if not isinstance(bases, dict): bases = {}
+        base = bases.get(name)
+        last = next((i for i in range(len(hist) - 1, -1, -1) if hist[i].get("name") == name), None)
+        if base is not None and last is not None:
+            back = _diff(snap, base)
+            if not back:  # 変化なし → 時刻だけ更新
+                hist[last] = {"name": name, "at": now, "delta": {}}
+                cfg["profiles_history"] = hist; cfg["history_base"] = bases
+                return cfg
+            # それまでの最新版は「新しい版からの差分」に付け替え（要素ごと差し替え: 保存スレッドと競合しない）
+            hist[last] = {"name": name, "at": hist[last].get("at", now), "delta": back}
+        hist.append({"name": name, "at": now, "delta": {}})
+        bases = dict(bases); bases[name] = snap
+        cfg["profiles_history"] = hist; cfg["history_base"] = bases
+        _trim_history(cfg)
         return cfg
+
+    @staticmethod
+    def history_snapshot(cfg: dict, index: int) -> Dict[str, Any] | None:
+        """履歴 index 番目（負数可）のスナップショットを復元"""
+        hist = cfg.get("profiles_history", []); bases = cfg.get("history_base", {})
+        try:
+            name = hist[index]["name"]; index %= len(hist)
+        except (IndexError, KeyError, TypeError, ZeroDivisionError):
+            return None
+        snap = bases.get(name)
+        if snap is None: return None
+        for i in range(len(hist) - 1, index - 1, -1):
+            if hist[i].get("name") == name:
+                snap = _apply(snap, hist[i].get("delta") or {})
+        return _migrate_profile(snap)
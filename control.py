@@ -0,0 +1,309 @@
+"""ローカル制御API（ほかのプロセスから開始/停止・設定変更・統計取得）
+
+    python control.py start | stop | toggle | ping | stats
+    python control.py events 50                     # イベントログの直近50件（既定100）
+    python control.py profile 連打A
+    python control.py set delay_ms=50 'stages=[{"ms":20,"sec":3}]'
+    python control.py points 100,200 300,400        # 記録点を追加（--clear で置き換え）
+
+サーバは cli.py --control で起動したときだけ動く（GUI は待ち受けない）。
+通信は Unix ドメインソケット（Windows はループバックの TCP）。1メッセージ = [u32 長さ(BE)] + UTF-8 JSON。
+要求は {"cmd": ...} か、そのリスト（バッチ。順に適用し、続く set / points は set_params 1回にまとめる）。
+応答は同じ形で {"ok": bool, ...}。サーバ側で受信から適用完了までの時間を latency_us として返し、統計にも残す。
+Unix ソケットは本人だけが開ける（0600）。TCP は同じマシンの誰でもつなげるので、起動ごとの合言葉を本人だけが
+読めるファイル（token_path）に書き、接続の最初のメッセージ {"auth": 合言葉} で確かめる（違えば切断）。
+"""
+import asyncio, hmac, json, os, secrets, socket, struct, sys, tempfile, threading, time
+from array import array
+from typing import Any, Callable, Dict, List, Optional
+from points import PointBuffer
+from processor import AutoClickEngine, PLAN_KEYS, plan_params
+
+_HDR = struct.Struct(">I")
+MAX_FRAME = 1 << 20     # 1メッセージの上限（超えたら切断）
+MAX_BATCH = 4096        # 1メッセージのコマンド数の上限
+LAT_RING = 1024         # 適用遅延の記録数
+
+def default_address() -> str:
+    if os.name == "nt" or not hasattr(socket, "AF_UNIX"):
+        return "tcp:127.0.0.1:47651"
+    return os.path.join(tempfile.gettempdir(), f"autoclicker-{os.getuid()}.sock")
+
+def _tcp(address: str):
+    host, _, port = address[4:].rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def token_path(address: str) -> Optional[str]:
+    """TCP で待ち受けるときの合言葉ファイル。一時フォルダはユーザーごと（Windows は %LOCALAPPDATA%\\Temp）"""
+    if not address.startswith("tcp:"): return None
+    return os.path.join(tempfile.gettempdir(), f"autoclicker-{_tcp(address)[1]}.token")
+
+def _write_token(path: str, token: str) -> None:
+    tmp = path + ".tmp"
+    if os.path.exists(tmp): os.unlink(tmp)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)   # 作った時点から本人だけ
+    with os.fdopen(fd, "w", encoding="ascii") as f: f.write(token)
+    os.replace(tmp, path)
+
+def encode(msg: Any) -> bytes:
+    body = json.dumps(msg, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _HDR.pack(len(body)) + body
+
+def _pct(sorted_vals, q: float) -> float:
+    if not sorted_vals: return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+
+class ControlServer:
+    """asyncio のサーバを専用スレッドで動かす。コマンドはイベントループ上でそのままエンジンへ適用する
+    （エンジンの公開APIは参照の差し替えかロック1回なので、ループを長く止めない）"""
+
+    def __init__(self, engine: AutoClickEngine, address: Optional[str] = None,
+                 params: Optional[Dict[str, Any]] = None,
+                 profiles: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None):
+        self.engine = engine
+        self.address = address or default_address()
+        self._params = plan_params(params or {})   # 直近に set_params へ渡した値
+        self._profiles = profiles
+        self._lat = array("q", bytes(8 * LAT_RING)); self._ln = 0
+        self.lat_max_ns = 0; self.commands = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event(); self._error: Optional[BaseException] = None
+        self._token: Optional[str] = None   # TCP のときの合言葉
+
+    # ===== 起動・停止 =====
+    def start(self):
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), name="control", daemon=True)
+        self._thread.start()
+        self._ready.wait(5.0)
+        if self._error is not None: raise self._error
+
+    def stop(self):
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread: self._thread.join(2.0)
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop(); self._stop = asyncio.Event()
+        path = None; tok = token_path(self.address)
+        try:
+            if tok:
+                host, port = _tcp(self.address)
+                self._token = secrets.token_urlsafe(32)
+                server = await asyncio.start_server(self._client, host, port)
+                _write_token(tok, self._token)
+            else:
+                path = self.address
+                if os.path.exists(path): os.unlink(path)   # 前回の残骸
+                server = await asyncio.start_unix_server(self._client, path)
+                os.chmod(path, 0o600)   # 同じユーザーのプロセスだけ
+        except BaseException as ex:
+            self._error = ex; self._ready.set(); return
+        self._ready.set()
+        try:
+            async with server:
+                await self._stop.wait()
+        finally:
+            for p in (path, tok):
+                if not p: continue
+                try: os.unlink(p)
+                except OSError: pass
+
+    async def _auth(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """最初のメッセージで合言葉を確かめる"""
+        n = _HDR.unpack(await reader.readexactly(_HDR.size))[0]
+        ok = False
+        if n <= 1024:
+            try:
+                msg = json.loads(await reader.readexactly(n))
+                ok = isinstance(msg, dict) and hmac.compare_digest(str(msg.get("auth", "")), self._token or "")
+            except ValueError:
+                pass
+        writer.write(encode({"ok": True} if ok else {"ok": False, "error": "認証に失敗しました"}))
+        await writer.drain()
+        return ok
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            if self._token is not None and not await self._auth(reader, writer): return
+            while True:
+                n = _HDR.unpack(await reader.readexactly(_HDR.size))[0]
+                if n > MAX_FRAME:
+                    writer.write(encode({"ok": False, "error": f"メッセージが大きすぎます（{n}バイト）"})); break
+                body = await reader.readexactly(n)
+                t = time.perf_counter_ns()
+                try:
+                    msg = json.loads(body)
+                except ValueError:
+                    resp: Any = {"ok": False, "error": "JSON ではありません"}
+                else:
+                    resp = self.handle(msg, t)
+                writer.write(encode(resp))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # ===== コマンド =====
+    def handle(self, msg: Any, t0: Optional[int] = None) -> Any:
+        """1メッセージ分を適用して応答を返す（単体なら dict、バッチなら {"results": [...]}）"""
+        t0 = t0 or time.perf_counter_ns()
+        batch = isinstance(msg, list)
+        cmds = msg if batch else [msg]
+        if len(cmds) > MAX_BATCH:
+            return {"ok": False, "error": f"コマンドが多すぎます（最大 {MAX_BATCH}）"}
+        results: List[Any] = [None] * len(cmds)
+        pending: Dict[str, Any] = {}; waiting: List[int] = []
+
+        def flush():
+            if not waiting: return
+            new = dict(self._params); new.update(pending)
+            try:
+                self.engine.set_params(**new)
+                self._params = new
+                res: Dict[str, Any] = {"ok": True}
+            except Exception as ex:   # MacroError・型の誤りなど（計画は変わらない）
+                res = {"ok": False, "error": str(ex)}
+            for i in waiting:
+                is_pts = res["ok"] and cmds[i].get("cmd") == "points"
+                results[i] = dict(res, points=len(new["recorded_points"])) if is_pts else res
+            pending.clear(); waiting.clear()
+
+        for i, c in enumerate(cmds):
+            cmd = c.get("cmd") if isinstance(c, dict) else None
+            if cmd == "set":
+                p = c.get("params")
+                bad = [k for k in p if k not in PLAN_KEYS] if isinstance(p, dict) else ["params"]
+                if bad:
+                    results[i] = {"ok": False, "error": f"不明な項目: {', '.join(map(str, bad))}"}; continue
+                pending.update(p); waiting.append(i)
+            elif cmd == "points":
+                base = PointBuffer() if c.get("clear") else \
+                    PointBuffer.coerce(pending.get("recorded_points", self._params["recorded_points"]))
+                try:
+                    pending["recorded_points"] = base.extended((int(x), int(y)) for x, y in c.get("add") or [])
+                except (TypeError, ValueError):
+                    results[i] = {"ok": False, "error": "add は [[x, y], ...] で指定してください"}; continue
+                waiting.append(i)
+            else:
+                flush()
+                results[i] = self._command(cmd, c)
+        flush()
+
+        ns = time.perf_counter_ns() - t0
+        self._record(ns, len(cmds))
+        if batch:
+            return {"ok": all(r.get("ok") for r in results), "results": results, "latency_us": ns / 1000.0}
+        return dict(results[0], latency_us=ns / 1000.0)
+
+    def _command(self, cmd: Optional[str], c: Any) -> Dict[str, Any]:
+        eng = self.engine
+        if cmd == "ping":
+            return {"ok": True}
+        if cmd in ("start", "stop", "toggle"):
+            if cmd == "toggle" or eng.is_running() != (cmd == "start"): eng.toggle()
+            return {"ok": True, "running": eng.is_running()}
+        if cmd == "profile":
+            name = str(c.get("name") or "")
+            p = self._profiles(name) if self._profiles else None
+            if not isinstance(p, dict): return {"ok": False, "error": f"プロファイルがありません: {name}"}
+            new = plan_params(p)
+            try:
+                eng.set_params(**new)
+            except Exception as ex:
+                return {"ok": False, "error": str(ex)}
+            self._params = new
+            eng.set_jobs(p.get("jobs") or [])
+            return {"ok": True, "jobs": eng.job_count()}
+        if cmd == "stats":
+            return {"ok": True, "running": eng.is_running(), "stats": dict(eng.stats(), **self.stats())}
+        if cmd == "events":
+            try:
+                n = int(c.get("n", 100))
+            except (TypeError, ValueError):
+                return {"ok": False, "error": "n は整数で指定してください"}
+            return {"ok": True, "events": eng.log.tail(n)}
+        return {"ok": False, "error": f"不明なコマンド: {cmd}"}
+
+    def _record(self, ns: int, n: int):
+        self._lat[self._ln % LAT_RING] = ns; self._ln += 1
+        self.commands += n
+        if ns > self.lat_max_ns: self.lat_max_ns = ns
+
+    def stats(self) -> Dict[str, Any]:
+        lat = sorted(self._lat[:min(self._ln, LAT_RING)])
+        return {"ctl_messages": self._ln, "ctl_commands": self.commands,
+                "ctl_lat_p50_us": _pct(lat, .5) / 1000.0, "ctl_lat_p99_us": _pct(lat, .99) / 1000.0,
+                "ctl_lat_max_us": self.lat_max_ns / 1000.0}
+
+
+class ControlClient:
+    """同期クライアント（接続は使い回す）"""
+    def __init__(self, address: Optional[str] = None, timeout: float = 2.0):
+        address = address or default_address()
+        if address.startswith("tcp:"):
+            with open(token_path(address), encoding="ascii") as f: token = f.read().strip()
+            self._sock = socket.create_connection(_tcp(address), timeout)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            resp = self.call({"auth": token})
+            if not resp.get("ok"):
+                self._sock.close(); raise ConnectionError(resp.get("error") or "認証に失敗しました")
+        else:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(timeout); self._sock.connect(address)
+
+    def call(self, msg: Any) -> Any:
+        self._sock.sendall(encode(msg))
+        n = _HDR.unpack(self._recv(_HDR.size))[0]
+        return json.loads(self._recv(n))
+
+    def _recv(self, n: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self._sock.recv(n - len(buf))
+            if not chunk: raise ConnectionError("接続が切れました")
+            buf += chunk
+        return bytes(buf)
+
+    def close(self): self._sock.close()
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+
+def _value(s: str) -> Any:
+    try:
+        return json.loads(s)
+    except ValueError:
+        return s
+
+def main(argv=None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="AutoClicker の制御（cli.py --control で起動したもの）")
+    ap.add_argument("--address", help=f"接続先（既定 {default_address()}）")
+    ap.add_argument("--clear", action="store_true", help="points: 追加ではなく置き換え")
+    ap.add_argument("cmd", choices=("ping", "start", "stop", "toggle", "stats", "events", "profile", "set", "points"))
+    ap.add_argument("args", nargs="*")
+    a = ap.parse_intermixed_args(argv)
+    if a.cmd == "profile":
+        msg: Dict[str, Any] = {"cmd": "profile", "name": " ".join(a.args)}
+    elif a.cmd == "set":
+        msg = {"cmd": "set", "params": {k: _value(v) for k, _, v in (s.partition("=") for s in a.args)}}
+    elif a.cmd == "events":
+        msg = {"cmd": "events", "n": int(a.args[0]) if a.args else 100}
+    elif a.cmd == "points":
+        msg = {"cmd": "points", "clear": a.clear, "add": [[int(v) for v in s.split(",")] for s in a.args]}
+    else:
+        msg = {"cmd": a.cmd}
+    try:
+        with ControlClient(a.address) as c:
+            resp = c.call(msg)
+    except OSError as ex:
+        print(f"接続できません: {ex}", file=sys.stderr); return 1
+    print(json.dumps(resp, ensure_ascii=False, indent=1))
+    return 0 if resp.get("ok") else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
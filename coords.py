@@ -0,0 +1,229 @@
+import math, random, threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+try:
+    import numpy as np   # あればバッチ生成をベクトル化（無くても動く）
+except ImportError:
+    np = None
+
+# ===== ランダム座標の分布 =====
+#   uniform    : 矩形内で一様
+#   gaussian   : 矩形の中心まわりの正規分布（矩形でクリップ）
+#   poisson    : ポアソンディスク（点どうしが min_dist 以上離れた集合を巡回。連続して同じ画素に当たらない）
+#   multi_rect : 重み付きの複数矩形から一様
+DISTRIBUTIONS = ("uniform", "gaussian", "poisson", "multi_rect")
+
+BATCH = 4096            # 1回に生成する座標数（半分使ったら次のバッチを裏で作る）
+POISSON_MAX = 10000     # ポアソン集合の上限点数（超えそうなら間隔を広げる）
+POISSON_MIN_DIST = 2.0  # 整数化しても同じ画素に潰れない最小間隔
+POISSON_K = 12          # 1点あたりの候補数（Bridson 法。少ないほど速く、充填はやや粗い）
+
+Rect = Tuple[int, int, int, int]   # (x1, x2, y1, y2)  x1<=x2, y1<=y2
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _submit(fn: Callable, *args) -> Future:
+    """生成は専用スレッド1本で（ワーカーのホットパスでは作らない）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="coords")
+    return _pool.submit(fn, *args)
+
+def _rect(d: Dict[str, Any]) -> Rect:
+    x1 = int(d.get("x1", 0)); x2 = int(d.get("x2", 100))
+    y1 = int(d.get("y1", 0)); y2 = int(d.get("y2", 100))
+    return (min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2))
+
+def parse_rects(text: str) -> List[Dict[str, int]]:
+    """'x1,y1,x2,y2[,重み]; ...' → [{"x1","y1","x2","y2","w"}]（不正な項目は無視）"""
+    out = []
+    for part in (text or "").replace("；", ";").split(";"):
+        nums = [t.strip() for t in part.replace("、", ",").split(",") if t.strip()]
+        try:
+            v = [int(float(t)) for t in nums]
+        except ValueError:
+            continue
+        if len(v) in (4, 5):
+            out.append({"x1": v[0], "y1": v[1], "x2": v[2], "y2": v[3], "w": v[4] if len(v) == 5 else 1})
+    return out
+
+def format_rects(rects: List[Dict[str, Any]]) -> str:
+    return "; ".join(f"{r.get('x1',0)},{r.get('y1',0)},{r.get('x2',0)},{r.get('y2',0)},{r.get('w',1)}" for r in rects or [])
+
+
+class CoordSpec:
+    """click_params から作る不変の分布定義。ClickPlan が持ち、実行ごとに stream() で座標列を作る。
+    seed を指定すると同じ環境では毎回同じ座標列になる"""
+    __slots__ = ("dist", "rect", "sigma", "min_dist", "rects", "weights", "seed", "_pset", "_key")
+
+    def __init__(self, cp: Dict[str, Any]):
+        st = object.__setattr__
+        dist = cp.get("dist", "uniform")
+        st(self, "dist", dist if dist in DISTRIBUTIONS else "uniform")
+        st(self, "rect", _rect(cp))
+        x1, x2, y1, y2 = self.rect
+        sigma = float(cp.get("sigma", 0) or 0)
+        st(self, "sigma", sigma if sigma > 0 else max(1.0, (x2 - x1) / 4.0, (y2 - y1) / 4.0))
+        st(self, "min_dist", max(POISSON_MIN_DIST, float(cp.get("min_dist", 0) or 0)))
+        rects, weights = [], []
+        for r in cp.get("rects") or []:
+            if not isinstance(r, dict): continue
+            w = float(r.get("w", 1) or 0)
+            if w > 0: rects.append(_rect(r)); weights.append(w)
+        if self.dist == "multi_rect" and not rects:   # 矩形が無ければ一様と同じ
+            rects, weights = [self.rect], [1.0]
+        st(self, "rects", tuple(rects)); st(self, "weights", tuple(weights))
+        seed = cp.get("seed")
+        st(self, "seed", int(seed) if isinstance(seed, (int, float)) or (isinstance(seed, str) and seed.isdigit()) else None)
+        st(self, "_key", (self.dist, self.rect, self.sigma, self.min_dist, self.rects, self.weights, self.seed))
+        # ポアソン集合は作るのが重いので、定義した時点で裏で作り始める
+        st(self, "_pset", _submit(_poisson_set, self.rect, self.min_dist, self.seed) if self.dist == "poisson" else None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CoordSpec is immutable")
+
+    def __eq__(self, other): return isinstance(other, CoordSpec) and self._key == other._key
+    def __hash__(self): return hash(self._key)
+
+    def stream(self) -> "CoordStream":
+        return CoordStream(self._generator())
+
+    def _generator(self) -> Callable[[int], List[Tuple[int, int]]]:
+        """n → n件の座標リスト。状態（乱数）はクロージャ内。呼ぶのは生成スレッドだけで、同時に1つまで"""
+        if np is not None:
+            rng = np.random.default_rng(self.seed)
+        else:
+            rnd = random.Random(self.seed)
+        x1, x2, y1, y2 = self.rect
+        if self.dist == "gaussian":
+            cx = (x1 + x2) / 2.0; cy = (y1 + y2) / 2.0; s = self.sigma
+            if np is not None:
+                def gen(n):
+                    xs = np.clip(np.rint(rng.normal(cx, s, n)), x1, x2).astype(np.int64)
+                    ys = np.clip(np.rint(rng.normal(cy, s, n)), y1, y2).astype(np.int64)
+                    return list(zip(xs.tolist(), ys.tolist()))
+            else:
+                def gen(n):
+                    g = rnd.gauss
+                    return [(min(x2, max(x1, round(g(cx, s)))), min(y2, max(y1, round(g(cy, s))))) for _ in range(n)]
+            return gen
+        if self.dist == "multi_rect":
+            rects = self.rects; tot = sum(self.weights)
+            if np is not None:
+                r = np.asarray(rects, dtype=np.int64)
+                p = np.asarray(self.weights, dtype=np.float64) / tot
+                def gen(n):
+                    k = rng.choice(len(rects), n, p=p)
+                    xs = r[k, 0] + (rng.random(n) * (r[k, 1] - r[k, 0] + 1)).astype(np.int64)
+                    ys = r[k, 2] + (rng.random(n) * (r[k, 3] - r[k, 2] + 1)).astype(np.int64)
+                    return list(zip(xs.tolist(), ys.tolist()))
+            else:
+                def gen(n):
+                    ri = rnd.randint
+                    return [(ri(a, b), ri(c, d)) for a, b, c, d in rnd.choices(rects, self.weights, k=n)]
+            return gen
+        if self.dist == "poisson":
+            pset_f = self._pset; last = [None]
+            def gen(n):
+                pts = pset_f.result()
+                out: List[Tuple[int, int]] = []
+                while len(out) < max(n, 1) and pts:
+                    if np is not None:
+                        ep = [pts[i] for i in rng.permutation(len(pts)).tolist()]
+                    else:
+                        ep = list(pts); rnd.shuffle(ep)
+                    # 周回の継ぎ目でも同じ点が続かないように
+                    prev = out[-1] if out else last[0]
+                    if len(ep) > 1 and ep[0] == prev:
+                        m = len(ep) // 2; ep[0], ep[m] = ep[m], ep[0]
+                    out += ep
+                if out: last[0] = out[-1]
+                return out or [(x1, y1)]
+            return gen
+        if np is not None:
+            def gen(n):
+                xs = rng.integers(x1, x2 + 1, n); ys = rng.integers(y1, y2 + 1, n)
+                return list(zip(xs.tolist(), ys.tolist()))
+        else:
+            def gen(n):
+                ri = rnd.randint
+                return [(ri(x1, x2), ri(y1, y2)) for _ in range(n)]
+        return gen
+
+
+class CoordStream:
+    """先読みの座標列。ワーカーは next() で配列を1つ進めるだけ。
+    バッチを半分使った時点で次のバッチを生成スレッドに頼む（使い切るまでに大抵できあがっている）"""
+    __slots__ = ("_gen", "_pts", "_i", "_half", "_next")
+
+    def __init__(self, gen: Callable[[int], List[Tuple[int, int]]], prefetch: bool = True):
+        self._gen = gen
+        self._pts: List[Tuple[int, int]] = []
+        self._i = 0; self._half = 0
+        self._next: Optional[Future] = _submit(gen, BATCH) if prefetch else None
+
+    def next(self) -> Tuple[int, int]:
+        i = self._i
+        if i >= len(self._pts):
+            fut = self._next or _submit(self._gen, BATCH)
+            self._next = None
+            self._pts = fut.result(); self._half = len(self._pts) // 2
+            i = 0
+        elif i == self._half and self._next is None:
+            self._next = _submit(self._gen, BATCH)
+        self._i = i + 1
+        return self._pts[i]
+
+
+# ===== ポアソンディスク（Bridson） =====
+_pset_cache: Dict[tuple, List[Tuple[int, int]]] = {}
+
+def _poisson_set(rect: Rect, min_dist: float, seed: Optional[int], cap: int = POISSON_MAX) -> List[Tuple[int, int]]:
+    """矩形内で互いに min_dist 以上離れた点集合（グリッド加速の Bridson 法）。
+    点数が cap を超えそうな間隔なら広げる。同じ引数の結果は使い回す"""
+    key = (rect, min_dist, seed, cap)
+    hit = _pset_cache.get(key)
+    if hit is not None: return hit
+    x1, x2, y1, y2 = rect
+    w = x2 - x1 + 1; h = y2 - y1 + 1
+    r = max(min_dist, math.sqrt(w * h / (0.6 * cap)))   # 充填率 ~0.6/r² を目安に上限へ収める
+    rnd = random.Random(seed)
+    cell = r / math.sqrt(2.0)
+    gw = int(w / cell) + 1; gh = int(h / cell) + 1
+    grid = [-1] * (gw * gh)
+    pts: List[Tuple[float, float]] = []; active: List[int] = []
+    r2 = r * r; two_pi = 2.0 * math.pi
+    cos, sin, uni, rr = math.cos, math.sin, rnd.uniform, rnd.randrange
+
+    def add(x, y):
+        grid[int(y / cell) * gw + int(x / cell)] = len(pts)
+        active.append(len(pts)); pts.append((x, y))
+
+    add(uni(0, w), uni(0, h))
+    while active and len(pts) < cap:
+        ai = rr(len(active)); px, py = pts[active[ai]]
+        for _ in range(POISSON_K):
+            a = uni(0.0, two_pi); d = uni(r, 2.0 * r)
+            x = px + d * cos(a); y = py + d * sin(a)
+            if not (0.0 <= x < w and 0.0 <= y < h): continue
+            gx = int(x / cell); gy = int(y / cell)
+            ok = True
+            for yy in range(max(0, gy - 2), min(gh, gy + 3)):
+                row = yy * gw
+                for xx in range(max(0, gx - 2), min(gw, gx + 3)):
+                    j = grid[row + xx]
+                    if j >= 0:
+                        qx, qy = pts[j]
+                        if (qx - x) * (qx - x) + (qy - y) * (qy - y) < r2:
+                            ok = False; break
+                if not ok: break
+            if ok:
+                add(x, y); break
+        else:
+            active[ai] = active[-1]; active.pop()
+    out = [(x1 + int(x), y1 + int(y)) for x, y in pts]
+    if len(_pset_cache) >= 8: _pset_cache.clear()
+    _pset_cache[key] = out
+    return out
@@ -0,0 +1,135 @@
+import math
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+# ===== レートカーブ =====
+# 段（間隔ms・持続秒・つなぎ方）を任意個並べ、最後に通常間隔（delay_ms）を normal_sec 秒（0=無制限）続ける。
+# つなぎ方 ramp は「その段の間隔から次の段（最後の段なら通常間隔）の間隔まで、持続秒かけてどう変えるか」:
+#   step   : 変えない（段の終わりで切り替え）
+#   linear : 直線的に
+#   exp    : 比率一定で（指数的に）
+# 通常の持続が終わったら end に従って先頭の段から繰り返す（loop）か停止（stop）。
+# duration_s（総時間）・budget（総回数）が 0 以外ならそこで停止。
+# 段の区間は compile 時に「時刻バケット → 段番号」の表と段ごとの係数にしておき、
+# at() は段数に関係なく表引き1回＋数回の演算で終わる。
+RAMPS = ("step", "linear", "exp")
+CURVE_ENDS = ("loop", "stop")
+
+LUT_MAX = 65536      # 表の最大長（段の合計が長いほどバケットが粗くなるが、境界は厳密に判定する）
+LUT_RES_S = 0.001    # バケット幅の下限
+
+_STEP, _LINEAR, _EXP = range(3)
+
+
+def parse_stages(text: str) -> List[Dict[str, Any]]:
+    """'50 5; 20 3 linear; …'（間隔ms 持続秒 [step|linear|exp]）→ [{"ms","sec","ramp"}]（不正な項目は無視）"""
+    out = []
+    for part in (text or "").replace("；", ";").split(";"):
+        t = part.replace(",", " ").replace("、", " ").split()
+        if len(t) not in (2, 3): continue
+        try:
+            ms = int(float(t[0])); sec = float(t[1])
+        except ValueError:
+            continue
+        ramp = t[2].lower() if len(t) == 3 else "step"
+        if ms < 1 or sec < 0 or ramp not in RAMPS: continue
+        out.append({"ms": ms, "sec": int(sec) if sec.is_integer() else sec, "ramp": ramp})
+    return out
+
+def format_stages(stages: List[Dict[str, Any]]) -> str:
+    return "; ".join(f"{s.get('ms', 1)} {s.get('sec', 0)}" + (f" {s['ramp']}" if s.get("ramp", "step") != "step" else "")
+                     for s in stages or [])
+
+def clean_stages(stages: Any) -> List[Dict[str, Any]]:
+    """設定ファイル・API から来た段のリストを正規化（壊れた項目は除く）"""
+    out = []
+    for s in stages if isinstance(stages, list) else []:
+        if not isinstance(s, dict): continue
+        try:
+            ms = max(1, int(s.get("ms", 0))); sec = max(0.0, float(s.get("sec", 0)))
+        except (TypeError, ValueError):
+            continue
+        ramp = s.get("ramp") if s.get("ramp") in RAMPS else "step"
+        out.append({"ms": ms, "sec": int(sec) if sec.is_integer() else sec, "ramp": ramp})
+    return out
+
+
+class RateCurve:
+    """コンパイル済みのレートカーブ（不変）。ClickPlan が持ち、ワーカーは at() を呼ぶだけ"""
+    __slots__ = ("stages", "delay_s", "normal_s", "end", "duration_s", "budget",
+                 "ramp_end", "cycle", "_inv_res", "_lut", "_ends", "_segs", "_n")
+
+    def __init__(self, stages: List[Dict[str, Any]], delay_ms: int, normal_sec: float = 0,
+                 end: str = "loop", duration_s: float = 0, budget: int = 0):
+        st = object.__setattr__
+        stages = clean_stages(stages)
+        st(self, "stages", tuple((s["ms"], float(s["sec"]), s["ramp"]) for s in stages))
+        st(self, "delay_s", max(1, int(delay_ms)) / 1000.0)
+        st(self, "normal_s", max(0.0, float(normal_sec or 0)))
+        st(self, "end", end if end in CURVE_ENDS else "loop")
+        st(self, "duration_s", max(0.0, float(duration_s or 0)))
+        st(self, "budget", max(0, int(budget or 0)))
+        st(self, "_n", len(self.stages))
+        # 段ごとの区間と係数: (段番号, 開始秒, 種類, 始点の間隔秒, 係数)
+        segs = []; ends = []; t = 0.0
+        for i, (ms, sec, ramp) in enumerate(self.stages):
+            if sec <= 0: continue
+            a = ms / 1000.0
+            b = self.stages[i + 1][0] / 1000.0 if i + 1 < len(self.stages) else self.delay_s
+            if ramp == "linear": seg = (i, t, _LINEAR, a, (b - a) / sec)
+            elif ramp == "exp":  seg = (i, t, _EXP, a, math.log(b / a) / sec)
+            else:                seg = (i, t, _STEP, a, 0.0)
+            segs.append(seg); t += sec; ends.append(t)
+        ends.append(math.inf)   # 番兵（段の終わりを越えた判定で止まる）
+        st(self, "_segs", tuple(segs)); st(self, "_ends", tuple(ends))
+        st(self, "ramp_end", t)
+        st(self, "cycle", t + self.normal_s if self.normal_s > 0 else math.inf)
+        # 時刻バケット → そのバケットの先頭で有効な段（区間の添字）
+        res = max(LUT_RES_S, t / LUT_MAX) if segs else 1.0
+        lut = array("H" if len(segs) < 65536 else "I")
+        j = 0
+        for k in range(int(t / res) + 1 if segs else 0):
+            while k * res >= ends[j]: j += 1
+            lut.append(min(j, max(0, len(segs) - 1)))
+        st(self, "_lut", lut); st(self, "_inv_res", 1.0 / res)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RateCurve is immutable")
+
+    def _key(self): return (self.stages, self.delay_s, self.normal_s, self.end, self.duration_s, self.budget)
+    def __eq__(self, other): return isinstance(other, RateCurve) and self._key() == other._key()
+    def __hash__(self): return hash(self._key())
+
+    @property
+    def phases(self) -> int:
+        """段の数（at() の段番号がこれと等しければ通常間隔）"""
+        return self._n
+
+    def at(self, elapsed: float) -> Tuple[int, Optional[float]]:
+        """経過秒 → (段番号, 間隔秒)。間隔 None は終了（総時間・stop の終わりに達した）"""
+        t = elapsed + 1e-6   # デッドライン累積の丸め誤差で境界ちょうどのティックが前の段に残らないように
+        if self.duration_s and t >= self.duration_s: return self._n, None
+        if t >= self.cycle:
+            if self.end == "stop": return self._n, None
+            t %= self.cycle
+        if t >= self.ramp_end: return self._n, self.delay_s
+        j = self._lut[int(t * self._inv_res)]
+        ends = self._ends
+        while t >= ends[j]: j += 1
+        i, t0, kind, a, k = self._segs[j]
+        if kind == _STEP: return i, a
+        if kind == _LINEAR: return i, a + k * (t - t0)
+        return i, a * math.exp(k * (t - t0))
+
+
+def stages_from_bursts(p: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """旧形式（段1/段2 の固定2段）→ 段のリスト。無効な段・持続0の段は除く"""
+    out = []
+    for n, ms_default in ((1, 50), (2, 20)):
+        try:
+            sec = int(p.get(f"burst{n}_sec", 0) or 0); ms = int(p.get(f"burst{n}_ms", ms_default) or ms_default)
+        except (TypeError, ValueError):
+            continue
+        if bool(p.get(f"burst{n}_enabled", sec > 0)) and sec > 0:
+            out.append({"ms": max(1, ms), "sec": sec, "ramp": "step"})
+    return out
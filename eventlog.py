@@ -0,0 +1,145 @@
+import itertools, json, os, threading, time, traceback
+from typing import Any, Dict, List, Optional
+
+# ===== イベントログ =====
+# 開始/停止・段の切り替え・ホットキーの成立・F12記録・例外などを1件ずつ記録する。
+# 記録する側（ワーカー・ディスパッチャ・GUI）は事前に確保したリングの1枠に (連番, 時刻, 種類, 項目) を入れるだけで、
+# ロックもファイル入出力もしない。書き出しは専用スレッドが FLUSH_S ごとにまとめて JSON Lines で追記し、
+# ファイルが MAX_BYTES を超えたら .1 → .2 … と回して BACKUPS 世代だけ残す。
+# 書き出しが追いつかずリングを一周されたぶんは捨てて dropped に数える（記録側は決して待たない）。
+# logs_dir を渡さなければメモリ上のリングだけ（tail() で直近を見る。ベンチ・テスト用）
+RING = 4096          # リングの枠数（2 の累乗に切り上げ）
+FLUSH_S = 0.5        # 書き出しの間隔（秒）
+MAX_BYTES = 1 << 20  # 1ファイルの上限
+BACKUPS = 3          # 回した古いファイルを残す数
+LOG_FILE = "[log]AutoClickerQtapp.log"
+
+
+def _stamp(t: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) + f".{int(t % 1 * 1000):03d}"
+
+def _where(ex: BaseException) -> str:
+    """例外が起きた場所（最後のフレーム）→ 'file.py:123 func'"""
+    tb = traceback.extract_tb(ex.__traceback__)
+    if not tb: return ""
+    f = tb[-1]
+    return f"{os.path.basename(f.filename)}:{f.lineno} {f.name}"
+
+
+class EventLog:
+    """固定長リングのイベントログ。event() はどのスレッドから呼んでもよく、待たない"""
+    def __init__(self, logs_dir: Optional[str] = None, ring: int = RING):
+        size = 1 << max(4, (max(1, ring) - 1).bit_length())
+        self._ring: List[Optional[tuple]] = [None] * size
+        self._mask = size - 1
+        self._seq = itertools.count()   # next() は GIL 下で原子的（複数スレッドから記録してよい）
+        self._head = 0                  # 記録済みの件数（戻らない。書き出し側は枠の連番で確かめる）
+        self._done = 0                  # 書き出し済みの連番
+        self.dropped = 0
+        self.path = os.path.join(logs_dir, LOG_FILE) if logs_dir else None
+        self._fh = None
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        if self.path:
+            self._thread = threading.Thread(target=self._run, name="eventlog", daemon=True)
+            self._thread.start()
+
+    # ===== 記録（どのスレッドからでも。枠に入れるだけ） =====
+    def event(self, kind: str, **fields: Any) -> None:
+        seq = next(self._seq)
+        self._ring[seq & self._mask] = (seq, time.time(), kind, fields)
+        if seq >= self._head: self._head = seq + 1   # 同時に記録した別スレッドより小さい連番で戻さない
+
+    def error(self, where: str, ex: BaseException, **fields: Any) -> None:
+        """握りつぶしていた例外の記録（発生箇所つき）"""
+        self.event("error", where=where, error=f"{type(ex).__name__}: {ex}", loc=_where(ex), **fields)
+
+    # ===== 読み出し =====
+    def tail(self, n: int = 100) -> List[Dict[str, Any]]:
+        """直近 n 件（古い順）"""
+        head = self._head; size = self._mask + 1
+        out = []
+        for seq in range(max(0, head - min(max(0, int(n)), size)), head):
+            e = self._ring[seq & self._mask]
+            if e is not None and e[0] == seq: out.append(self._record(e))
+        return out
+
+    def dump(self, path: str, n: int = 1000) -> int:
+        """直近 n 件をファイルへ書き出す（調査用）。書いた件数"""
+        rows = self.tail(n)
+        d = os.path.dirname(path)
+        if d: os.makedirs(d, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for r in rows: f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+        return len(rows)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"log_events": self._head, "log_dropped": self.dropped}
+
+    @staticmethod
+    def _record(e: tuple) -> Dict[str, Any]:
+        seq, t, kind, fields = e
+        return {"seq": seq, "at": _stamp(t), "ev": kind, **fields}
+
+    # ===== 書き出し（専用スレッド） =====
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(FLUSH_S)
+            self.flush()
+
+    def flush(self) -> int:
+        """溜まった分をファイルへ追記（書いた件数）。ファイルなしなら何もしない"""
+        if not self.path: return 0
+        with self._io_lock:
+            head = self._head; size = self._mask + 1
+            lost = 0
+            if head - self._done > size:   # 一周された（書き出しより記録が速い）
+                lost = head - size - self._done; self._done = head - size
+            lines = []
+            while self._done < head:
+                e = self._ring[self._done & self._mask]
+                if e is None or e[0] < self._done: break   # まだ書き込み途中の枠（次回に回す）
+                if e[0] > self._done:                      # 読む前に上書きされた
+                    lost += 1; self._done += 1; continue
+                lines.append(json.dumps(self._record(e), ensure_ascii=False, default=str))
+                self._done += 1
+            if lost:
+                self.dropped += lost
+                lines.insert(0, json.dumps({"at": _stamp(time.time()), "ev": "dropped", "n": lost}))
+            if not lines: return 0
+            try:
+                fh = self._open()
+                fh.write("\n".join(lines) + "\n"); fh.flush()
+                if fh.tell() >= MAX_BYTES: self._rotate()
+            except OSError:
+                self._close_file()   # 書けない（ディスク・権限）。次回に開き直す（この分は失う）
+            return len(lines)
+
+    def _open(self):
+        if self._fh is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fh = open(self.path, "a", encoding="utf-8")
+        return self._fh
+
+    def _rotate(self):
+        self._close_file()
+        for i in range(BACKUPS - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src): os.replace(src, f"{self.path}.{i + 1}")
+        if BACKUPS > 0: os.replace(self.path, f"{self.path}.1")
+        else: os.remove(self.path)
+
+    def _close_file(self):
+        if self._fh is not None:
+            try: self._fh.close()
+            except OSError: pass
+            self._fh = None
+
+    def close(self):
+        """残りを書き切って閉じる（何度呼んでもよい）"""
+        self._closed = True; self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread(): self._thread.join(2.0)
+        self.flush()
+        with self._io_lock: self._close_file()
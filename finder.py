@@ -0,0 +1,203 @@
+import base64, hashlib
+from typing import Any, Dict, List, Optional, Tuple
+try:
+    import numpy as np   # テンプレート探索に必要（無ければ常に「見つからない」）
+except ImportError:
+    np = None
+from capture import CaptureSource, Rect
+
+# ===== テンプレート探索（click_mode="template"） =====
+# プロファイルに小さな参照画像（グレースケール）を持たせ、探索領域の中で正規化相互相関（NCC）が最大の位置を探す。
+#   1. 前回見つかった位置のまわり（±LOCAL_R px）だけを取り込んで照合 → しきい値以上ならそれで終わり
+#   2. 外れたら探索領域全体を取り込み、ピラミッドの最も粗い段で全面照合（FFT）→ 上位 COARSE_TOP 候補を
+#      段ごとに ±REFINE_R px だけ細かく照合し直して原寸の位置を決める
+# テンプレート側の前処理（各段の縮小・平均を引いた画像・ノルム）は TemplateSpec を作るときに1回だけ、
+# FFT は探索画像の大きさごとに TemplateFinder が覚えて使い回す（計画が同じ間はティックをまたいで再利用）。
+LEVELS_MAX = 3       # 縮小の最大段数（1段ごとに 1/2）
+MIN_SIDE = 6         # 最も粗い段でもテンプレートの短辺がこれ以上残るように段数を決める
+LOCAL_R = 16         # 前回位置のまわりを探す幅(px)
+REFINE_R = 2         # 細かい段での照合範囲(px)
+COARSE_TOP = 3       # 粗い段から持ち帰る候補数
+FFT_CACHE = 16       # 覚えておく FFT の数（探索画像の大きさの種類）
+TEMPLATE_MAX = 256   # 参照画像の一辺の上限(px)（プロファイルに base64 で入るので大きくしすぎない）
+
+_GRAY = (0.299, 0.587, 0.114)
+
+
+def encode_image(w: int, h: int, gray: bytes) -> Dict[str, Any]:
+    """グレースケール画素列（w*h バイト、行優先）→ プロファイルに入れる dict"""
+    return {"w": int(w), "h": int(h), "gray": base64.b64encode(bytes(gray)).decode("ascii")}
+
+def decode_image(d: Any) -> Optional["np.ndarray"]:
+    """encode_image の dict → (h, w) float32。壊れていれば None"""
+    if np is None or not isinstance(d, dict): return None
+    try:
+        w = int(d["w"]); h = int(d["h"])
+        raw = base64.b64decode(d.get("gray") or "")
+    except (KeyError, TypeError, ValueError):
+        return None
+    if w < 1 or h < 1 or len(raw) != w * h: return None
+    return np.frombuffer(raw, dtype=np.uint8).reshape(h, w).astype(np.float32)
+
+def _down(a: "np.ndarray") -> "np.ndarray":
+    """2x2 平均で 1/2 に縮小（端の奇数行・列は捨てる）"""
+    h = a.shape[0] // 2 * 2; w = a.shape[1] // 2 * 2
+    return (a[0:h:2, 0:w:2] + a[1:h:2, 0:w:2] + a[0:h:2, 1:w:2] + a[1:h:2, 1:w:2]) * 0.25
+
+def _gray(frame: "np.ndarray") -> "np.ndarray":
+    if frame.ndim == 2: return frame.astype(np.float32)
+    return frame[:, :, :3].astype(np.float32) @ np.asarray(_GRAY, dtype=np.float32)
+
+
+class TemplateSpec:
+    """click_params から作る不変の探索定義。ClickPlan が持ち、実行ごとに finder() で探索状態を作る。
+    click_params: x1,y1,x2,y2（探索領域）, threshold（0〜1。既定 0.8）, image（encode_image の dict）"""
+    __slots__ = ("rect", "threshold", "size", "levels", "_tmpl", "_key")
+
+    def __init__(self, cp: Dict[str, Any]):
+        st = object.__setattr__
+        x1 = int(cp.get("x1", 0)); x2 = int(cp.get("x2", 0)); y1 = int(cp.get("y1", 0)); y2 = int(cp.get("y2", 0))
+        st(self, "rect", (max(0, min(x1, x2)), max(x1, x2), max(0, min(y1, y2)), max(y1, y2)))
+        st(self, "threshold", max(0.0, min(1.0, float(cp.get("threshold", 0.8)))))
+        img = cp.get("image") if isinstance(cp.get("image"), dict) else {}
+        t = decode_image(img)
+        # 段ごとの (平均を引いたテンプレート, ノルム)。平坦な画像（ノルム 0）は照合できないので持たない
+        tmpl: List[Tuple["np.ndarray", float]] = []
+        if t is not None:
+            a = t
+            for _ in range(LEVELS_MAX + 1):
+                z = a - a.mean()
+                n = float(np.sqrt((z * z).sum()))
+                if n < 1e-3: break
+                tmpl.append((z, n))
+                if min(a.shape) // 2 < MIN_SIDE: break
+                a = _down(a)
+        st(self, "_tmpl", tuple(tmpl))
+        st(self, "levels", len(tmpl))
+        st(self, "size", (t.shape[1], t.shape[0]) if t is not None else (0, 0))
+        digest = hashlib.sha1(str(img.get("gray", "")).encode("ascii", "replace")).hexdigest()
+        st(self, "_key", (self.rect, self.threshold, self.size, digest))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TemplateSpec is immutable")
+
+    def __eq__(self, other): return isinstance(other, TemplateSpec) and self._key == other._key
+    def __hash__(self): return hash(self._key)
+
+    @property
+    def ok(self) -> bool:
+        """照合できるテンプレートを持ち、探索領域がテンプレートより大きい"""
+        x1, x2, y1, y2 = self.rect; w, h = self.size
+        return self.levels > 0 and x2 - x1 + 1 >= w and y2 - y1 + 1 >= h
+
+    def finder(self, source: CaptureSource) -> "TemplateFinder":
+        return TemplateFinder(self, source)
+
+
+class TemplateFinder:
+    """ワーカー専有の探索状態（前回の位置・FFT のキャッシュ）。find() は取り込み1〜2回と照合"""
+    __slots__ = ("spec", "source", "last", "score", "local", "_fft")
+
+    def __init__(self, spec: TemplateSpec, source: CaptureSource):
+        self.spec = spec; self.source = source
+        self.last: Optional[Tuple[int, int]] = None   # 前回の一致位置（画面座標の左上）
+        self.score = 0.0; self.local = False          # 直近の結果（一致度・前回位置のまわりで見つかったか）
+        self._fft: Dict[tuple, "np.ndarray"] = {}
+
+    def find(self) -> Optional[Tuple[int, int]]:
+        """一致したテンプレートの中心（画面座標）。しきい値未満・取り込めないときは None"""
+        sp = self.spec
+        self.score = 0.0; self.local = False
+        if np is None or not sp.ok: return None
+        w, h = sp.size; x1, x2, y1, y2 = sp.rect
+        if self.last is not None:   # 1. 前回位置のまわりだけ
+            lx, ly = self.last
+            r = (max(x1, lx - LOCAL_R), min(x2, lx + w - 1 + LOCAL_R), max(y1, ly - LOCAL_R), min(y2, ly + h - 1 + LOCAL_R))
+            hit = self._search(r, full=False)
+            if hit is not None and hit[2] >= sp.threshold:
+                self.local = True
+                return self._accept(hit)
+        hit = self._search(sp.rect, full=True)   # 2. 領域全体（粗い段から）
+        if hit is not None and hit[2] >= sp.threshold:
+            return self._accept(hit)
+        self.last = None
+        if hit is not None: self.score = hit[2]
+        return None
+
+    def _accept(self, hit: Tuple[int, int, float]) -> Tuple[int, int]:
+        x, y, s = hit
+        self.last = (x, y); self.score = s
+        w, h = self.spec.size
+        return x + w // 2, y + h // 2
+
+    def _search(self, rect: Rect, full: bool) -> Optional[Tuple[int, int, float]]:
+        """rect を取り込んで照合 → (左上x, 左上y, 一致度)。full=False なら原寸だけで照合"""
+        frame = self.source.grab(rect)
+        if frame is None: return None
+        img = _gray(frame)
+        levels = self.spec.levels if full else 1
+        pyr = [img]
+        for _ in range(levels - 1):
+            if min(pyr[-1].shape) // 2 < 1: break
+            pyr.append(_down(pyr[-1]))
+        top = len(pyr) - 1
+        while top > 0 and (pyr[top].shape[0] < self.spec._tmpl[top][0].shape[0] or pyr[top].shape[1] < self.spec._tmpl[top][0].shape[1]):
+            top -= 1
+        sc = self._ncc(pyr[top], top)
+        if sc is None: return None
+        cands = _peaks(sc, COARSE_TOP if top > 0 else 1, self.spec._tmpl[top][0].shape)
+        best = None
+        for cy, cx in cands:
+            s = float(sc[cy, cx])
+            for lv in range(top - 1, -1, -1):   # 1段ずつ細かく: 位置を2倍して ±REFINE_R だけ照合し直す
+                cx, cy, s = self._refine(pyr[lv], lv, cx * 2, cy * 2)
+            if best is None or s > best[2]: best = (cx, cy, s)
+        if best is None: return None
+        return rect[0] + best[0], rect[2] + best[1], best[2]
+
+    def _refine(self, img: "np.ndarray", lv: int, x: int, y: int) -> Tuple[int, int, float]:
+        th, tw = self.spec._tmpl[lv][0].shape
+        H, W = img.shape
+        x0 = max(0, min(x - REFINE_R, W - tw)); y0 = max(0, min(y - REFINE_R, H - th))
+        x1 = min(W, x + REFINE_R + tw); y1 = min(H, y + REFINE_R + th)
+        sc = self._ncc(img[y0:y1, x0:x1], lv)
+        if sc is None: return x, y, 0.0
+        iy, ix = np.unravel_index(int(np.argmax(sc)), sc.shape)
+        return x0 + int(ix), y0 + int(iy), float(sc[iy, ix])
+
+    def _ncc(self, img: "np.ndarray", lv: int) -> Optional["np.ndarray"]:
+        """img の各位置（テンプレートが収まる範囲）での NCC。分子は FFT の相関、分母は積分画像の窓和"""
+        z, tn = self.spec._tmpl[lv]
+        th, tw = z.shape; H, W = img.shape
+        if H < th or W < tw: return None
+        key = (lv, H, W)
+        f = self._fft.get(key)
+        if f is None:   # テンプレートの FFT（共役）は探索画像の大きさごとに1回だけ
+            if len(self._fft) >= FFT_CACHE: self._fft.clear()
+            f = self._fft[key] = np.conj(np.fft.rfft2(z, s=(H, W)))
+        num = np.fft.irfft2(np.fft.rfft2(img) * f, s=(H, W))[:H - th + 1, :W - tw + 1]
+        a = img.astype(np.float64)
+        s1 = _box(a, th, tw); s2 = _box(a * a, th, tw)
+        var = np.maximum(s2 - s1 * s1 / (th * tw), 0.0)
+        den = np.sqrt(var) * tn
+        out = np.zeros_like(num)
+        np.divide(num, den, out=out, where=den > 1e-6 * tn)   # 平坦な窓は 0（一致とみなさない）
+        return out
+
+
+def _box(a: "np.ndarray", h: int, w: int) -> "np.ndarray":
+    """h×w の窓和（積分画像）。形は (H-h+1, W-w+1)"""
+    ii = np.zeros((a.shape[0] + 1, a.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(a, axis=0), axis=1, out=ii[1:, 1:])
+    return ii[h:, w:] - ii[:-h, w:] - ii[h:, :-w] + ii[:-h, :-w]
+
+def _peaks(sc: "np.ndarray", k: int, shape: Tuple[int, int]) -> List[Tuple[int, int]]:
+    """一致度の上位 k 点（テンプレートの半分の範囲内で重ならないように）→ [(y, x)]"""
+    s = sc.copy(); out = []
+    ry = max(1, shape[0] // 2); rx = max(1, shape[1] // 2)
+    for _ in range(k):
+        y, x = np.unravel_index(int(np.argmax(s)), s.shape)
+        if out and s[y, x] <= 0: break
+        out.append((int(y), int(x)))
+        s[max(0, y - ry):y + ry + 1, max(0, x - rx):x + rx + 1] = -np.inf
+    return out
@@ -1,15 +1,26 @@
-import os
-from PySide6.QtCore import Qt, QEvent, QTimer, QEasingCurve, QPropertyAnimation, QRect, Signal
-from PySide6.QtGui import QIcon, QColor, QKeySequence, QAction
+import os, time
+from functools import lru_cache
+from PySide6.QtCore import (Qt, QObject, QEvent, QTimer, QEasingCurve, QPropertyAnimation, QRect, Signal,
+                            QAbstractListModel, QModelIndex, QStringListModel)
+from PySide6.QtGui import QIcon, QColor, QKeySequence, QAction, QCursor, QGuiApplication, QImage
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QApplication, QStyle,
-    QGraphicsDropShadowEffect, QDialog, QTextBrowser, QSpinBox,
-    QRadioButton, QGroupBox, QButtonGroup, QComboBox, QLineEdit,
-    QMessageBox, QSystemTrayIcon, QMenu, QCheckBox
+    QGraphicsDropShadowEffect, QSpinBox,
+    QRadioButton, QGroupBox, QButtonGroup, QComboBox, QLineEdit, QCompleter,
+    QMessageBox, QSystemTrayIcon, QMenu, QCheckBox, QDoubleSpinBox, QPlainTextEdit
 )
-from utils import resource_path, brand_font_family, is_admin
-from processor import AutoClickEngine, HotkeySpec
-from config import AppConfig
+from utils import resource_path, brand_font_family, is_admin, screen_size, CONFIG_DIR, LOGS_DIR
+from processor import AutoClickEngine, EngineEvents, HotkeySpec
+from backends import create_backend
+from points import PointBuffer
+from coords import parse_rects, format_rects
+from curve import parse_stages, format_stages
+from finder import TEMPLATE_MAX, encode_image
+from macro import MacroError, check_macro
+from recorder import TrajectoryRecorder, record_count
+from config import AppConfig, ConfigWriter, ProfileMap
+from startup import TIMER
+from eventlog import EventLog
 
 # テーマ色
 COLORS_STOP = {"PRIMARY":"#4169e1","HOVER":"#7000e0","GLASS":"rgba(5,5,51,200)","PANEL":"#4f8fda","BORDER":"3px solid rgba(65,105,225,255)","STATUS_BG":"#004080"}
@@ -20,110 +31,113 @@ CLOSEBTN_COLOR, MINBTN_COLOR, MAXBTN_COLOR = "#FF0000", "#FFD600", "#00C853"
 RADIUS_WINDOW, RADIUS_CARD, RADIUS_PANEL, RADIUS_BUTTON, RADIUS_CLOSE = 18,16,10,8,6
 RESIZE_MARGIN, GAP, PAD, MENU_WIDTH = 8,12,16,600
 
-def build_qss(compact: bool, theme: dict) -> str:
+def build_qss(compact: bool) -> str:
+    """停止中の色を基本に、動作中の色は [running="true"] の規則として同じシートに入れておく
+    （開始/停止ではウィジェットのプロパティを変えるだけで、シートは当て直さない）"""
     grad = ("qlineargradient(x1:0,y1:0,x2:0,y2:1,stop:0 rgba(255,255,255,50), stop:0.5 rgba(200,220,255,25), stop:1 rgba(255,255,255,8))")
     fam = brand_font_family()
+    stop, run = COLORS_STOP, COLORS_RUN
     return f"""
     QWidget#bgRoot {{ background-color:{WINDOW_BG}; border-radius:{RADIUS_WINDOW}px; }}
-    QWidget#glassRoot {{ background-color:{theme['GLASS']}; border:{theme['BORDER']}; border-radius:{RADIUS_CARD}px; background-image:{'none' if compact else grad}; }}
+    QWidget#glassRoot {{ background-color:{stop['GLASS']}; border:{stop['BORDER']}; border-radius:{RADIUS_CARD}px; background-image:{'none' if compact else grad}; }}
+    QWidget#glassRoot[running="true"] {{ background-color:{run['GLASS']}; border:{run['BORDER']}; }}
     QLabel#titleLabel {{ color:#fff; font-weight:bold; font-size:14pt; }}
     QLabel, QRadioButton {{ color:{TEXT_COLOR}; font-family:"{fam}"; font-size:11pt; }}
-    QWidget.DarkPanel {{ background-color:{theme['PANEL']}; border:1px solid rgba(0,0,0,140); border-radius:{RADIUS_PANEL}px; padding:14px; }}
+    QWidget.DarkPanel {{ background-color:{stop['PANEL']}; border:1px solid rgba(0,0,0,140); border-radius:{RADIUS_PANEL}px; padding:14px; }}
+    QWidget.DarkPanel[running="true"] {{ background-color:{run['PANEL']}; }}
     QSpinBox, QLineEdit, QComboBox {{ background:#fffafa; color:#000; border:1px solid #777; border-radius:5px; padding:4px 8px; font-family:"{fam}"; font-size:11pt; min-width:86px; }}
     QGroupBox {{ color:{TEXT_COLOR}; font-size:11.2pt; font-weight:600; margin-top:6px; }}
     QGroupBox::title {{ subcontrol-origin: margin; left: 6px; padding: 2px 4px; color:{TEXT_COLOR}; }}
-    QPushButton {{ background-color:{theme['PRIMARY']}; color:#fff; border:none; border-radius:{RADIUS_BUTTON}px; padding:8px 14px; font-family:"{fam}"; font-size:11pt; }}
-    QPushButton:hover {{ background-color:{theme['HOVER']}; }}
+    QPushButton {{ background-color:{stop['PRIMARY']}; color:#fff; border:none; border-radius:{RADIUS_BUTTON}px; padding:8px 14px; font-family:"{fam}"; font-size:11pt; }}
+    QPushButton:hover {{ background-color:{stop['HOVER']}; }}
+    QPushButton[running="true"] {{ background-color:{run['PRIMARY']}; }}
+    QPushButton[running="true"]:hover {{ background-color:{run['HOVER']}; }}
     QPushButton#minBtn, QPushButton#maxBtn, QPushButton#closeBtn {{ background:transparent; padding:0; border-radius:{RADIUS_CLOSE}px; }}
     QPushButton#minBtn {{ color:{MINBTN_COLOR}; }} QPushButton#maxBtn {{ color:{MAXBTN_COLOR}; }} QPushButton#closeBtn {{ color:{CLOSEBTN_COLOR}; }}
     QPushButton#minBtn:hover, QPushButton#maxBtn:hover, QPushButton#closeBtn:hover {{ background:rgba(153,179,255,0.10); }}
     QTextBrowser#readmeText {{ color:#fffafa; background:#333; border-radius:{RADIUS_PANEL}px; padding:12px; font-family:"{fam}"; font-size:11.3pt; }}
     QLabel#banner {{ background:#8B0000; color:#fff; padding:8px 12px; border-radius:8px; font-size:10.8pt; }}
-    QWidget#menuPanel {{ background:{theme['GLASS']}; border:{theme['BORDER']}; border-top-right-radius:{RADIUS_CARD}px; border-bottom-right-radius:{RADIUS_CARD}px; background-image:{'none' if compact else grad}; }}
+    QWidget#menuPanel {{ background:{stop['GLASS']}; border:{stop['BORDER']}; border-top-right-radius:{RADIUS_CARD}px; border-bottom-right-radius:{RADIUS_CARD}px; background-image:{'none' if compact else grad}; }}
+    QWidget#menuPanel[running="true"] {{ background:{run['GLASS']}; border:{run['BORDER']}; }}
     QWidget#overlay {{ background:rgba(0,0,0,120); }}
     QLabel.menuCaption {{ color:#b8dcff; font-size:12pt; font-weight:700; }}
+    QLabel#statusLabel {{ background:{stop['STATUS_BG']}; color:#fff; padding:10px 12px; border-radius:8px; font-size:11pt; }}
+    QLabel#statusLabel[running="true"] {{ background:{run['STATUS_BG']}; }}
     """
 
+@lru_cache(maxsize=None)
+def theme_qss(compact: bool) -> str:
+    """最大化の有無ごとのスタイルシート（組み立ては各1回だけ）"""
+    return build_qss(compact)
+
+_THEMED_NAMES = ("glassRoot", "menuPanel", "statusLabel")
+
 def apply_drop_shadow(w: QWidget) -> QGraphicsDropShadowEffect:
     eff = QGraphicsDropShadowEffect(w); eff.setBlurRadius(28); eff.setOffset(0,3)
     c = QColor(0,0,0); c.setAlphaF(0.18); eff.setColor(c); w.setGraphicsEffect(eff); return eff
 
-README_MD = r"""
-# AutoClicker ©️2025 KisaragiIchigo
-
-## できること
-- 連打: **左クリック / 右クリック / 指定キー / キー列** の連打
-- バースト: **段1 / 段2** をチェックで有効化（例: 50ms→20ms→通常100ms）
-- クリック座標モード:
-  - **現在位置**（マウス追従）
-  - **固定座標**（X,Y指定）
-  - **ランダム矩形**（Xmin/Xmax, Ymin/Ymax 内でランダム）
-  - **記録操作**（**F12**で現在のカーソル座標を記録。記録順にループ再生）
-- ハンバーガーメニューを**開いている間はホットキー無効化**（誤作動防止）
-- プロファイル:
-  - 値変更のたび**自動保存**（現在選択名に上書き）
-  - **履歴10件**を保持（スナップショット）
-  - 最後に選んだ**プロファイルを次回起動時に復元**
-- 起動時最小化＆**トレイ常駐**
-- 権限チェック（管理者権限じゃない時に注意喚起）
-
-## 基本操作
-1. 上段の「プロファイル」で名前を選択/入力  
-   - **保存/上書**でプロファイル保存  
-   - **適用**でそのプロファイルの値を反映  
-2. 「連打ボタン」で **左/右/指定キー** を選ぶ  
-   - 指定キーはメニュー内「指定キー（単発）」で設定  
-   - **キー列**（例 `A,D,F8`）を入れると順番に送出  
-3. 「クリック座標」でモードを選択  
-   - **記録操作**を使うときは、狙いたい場所にマウスを置いて **F12** を押す → 座標が記録される（件数はメニューに表示）  
-   - 「記録クリア」で記録点を全消去  
-4. 「ディレイ/バースト」で持続と間隔を設定  
-   - 段1/段2はチェックを入れると有効化  
-5. **ホットキー**（デフォルト `Ctrl+Alt`）で開始/停止をトグル  
-   - メニュー内のホットキー欄をクリックして、好みの組み合わせを押すと更新される  
-   - メニューを開いている間は**常にミュート**されるから設定が安全
-
-## ちょいテク
-- **F12はミュート中でも座標記録**だけは受け付ける  
-- **キー列**は英数とFnキー（F1〜F24）に対応  
-- 記録操作モードは**記録順にループ**してクリック  
-- 設定・ログは実行フォルダ直下の `config/` と `logs/` に保存（exeでもOK）
-
-## トラブル対処
-- 連打が止まらない/誤爆する → メニューを開く（ホットキー無効）  
-- 権限不足っぽい → 管理者で再起動
-
-"""
-
-
-class ReadmeDialog(QDialog):
+class EngineBridge(QObject, EngineEvents):
+    """エンジンの通知（別スレッドから呼ばれる）を Qt シグナルにして UI スレッドへ渡す"""
+    state_changed = Signal(bool)
+    point_recorded = Signal(int, int)
+    metrics_updated = Signal(dict)
+
+    def on_state_changed(self, running: bool): self.state_changed.emit(running)
+    def on_point_recorded(self, x: int, y: int): self.point_recorded.emit(x, y)
+    def on_metrics(self, snap: dict): self.metrics_updated.emit(snap)
+
+
+class ProfileListModel(QAbstractListModel):
+    """プロファイル名の一覧（コンボボックス用）。行は FETCH_ROWS ずつ、一覧を下へスクロールしたときに足す
+    （数千件あっても最初に作る行は少ない）"""
+    FETCH_ROWS = 200
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.setWindowTitle("README ©️2025 KisaragiIchigo")
-        self.setWindowFlags(Qt.Dialog | Qt.FramelessWindowHint)
-        self.setAttribute(Qt.WA_TranslucentBackground)
-        self.resize(850, 600); self.setMinimumSize(850, 600)
-        outer = QVBoxLayout(self); outer.setContentsMargins(0,0,0,0)
-        bg = QWidget(); bg.setObjectName("bgRoot"); outer.addWidget(bg)
-        bgL = QVBoxLayout(bg); bgL.setContentsMargins(GAP,GAP,GAP,GAP)
-        card = QWidget(); card.setObjectName("glassRoot"); bgL.addWidget(card)
-        cardL = QVBoxLayout(card); cardL.setContentsMargins(PAD,PAD,PAD,PAD); cardL.setSpacing(GAP)
-        bar = QHBoxLayout(); title = QLabel("README"); title.setObjectName("titleLabel"); bar.addWidget(title); bar.addStretch(1)
-        btn_close = QPushButton("x"); btn_close.setObjectName("closeBtn"); btn_close.setFixedSize(28,28); btn_close.clicked.connect(self.accept)
-        bar.addWidget(btn_close); cardL.addLayout(bar)
-        viewer = QTextBrowser(); viewer.setObjectName("readmeText"); viewer.setMarkdown(README_MD); viewer.setOpenExternalLinks(True)
-        cardL.addWidget(viewer, 1)
-        self._shadow = apply_drop_shadow(card)
+        self._names: list = []; self._shown = 0
+
+    def set_names(self, names: list):
+        self.beginResetModel()
+        self._names = list(names); self._shown = min(len(self._names), self.FETCH_ROWS)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._shown
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self._shown: return None
+        if role in (Qt.DisplayRole, Qt.EditRole): return self._names[index.row()]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._shown < len(self._names)
+
+    def fetchMore(self, parent=QModelIndex()):
+        n = min(len(self._names) - self._shown, self.FETCH_ROWS)
+        if n <= 0: return
+        self.beginInsertRows(QModelIndex(), self._shown, self._shown + n - 1)
+        self._shown += n
+        self.endInsertRows()
+
 
 class MainWindow(QWidget):
     engine_state_changed = Signal(bool)
-    def __init__(self, start_minimized: bool = False):
+    def __init__(self, start_minimized: bool = False, cfg: dict | None = None):
         super().__init__()
+        self._painted = False; self._loading = False
+        self._n_stages = 0   # 段の数（段の欄が変わったときだけ数え直す。計測表示で毎回解析しない）
         self.setWindowTitle("AutoClicker ©️2025 KisaragiIchigo")
         self._resizing = False; self._moving = False
-        self._theme = COLORS_STOP
+        self._qss_compact: bool | None = None   # 今当てているシートの最大化の有無（変わったときだけ当て直す）
+        self._theme_running = False             # 今の配色（running プロパティの値）
         # 記録点（GUI側でも保持）
-        self._record_points: list[tuple[int,int]] = []
+        self._record_points = PointBuffer()   # 不変。追加・クリアのたびに差し替える
+        # 軌跡（記録ファイル）
+        self._traj_file = ""
+        self._tmpl_image: dict = {}   # 画像探索の参照画像（encode_image の dict）
+        self._traj_rec: TrajectoryRecorder | None = None
+        # 追加ジョブ（プロファイル形式の dict。主設定と同時に回す）
+        self._jobs: list[dict] = []
 
         # 参照ウィジェット（先宣言）
         self.ed_key_repeat: QLineEdit | None = None
@@ -131,6 +145,8 @@ class MainWindow(QWidget):
         self.ed_hotkey: QLineEdit | None = None
         self.chk_start_min: QCheckBox | None = None
         self.lbl_rec_count: QLabel | None = None
+        self.lbl_jobs: QLabel | None = None
+        self._hk_held: set = set(); self._hk_chord: list[str] = []   # ホットキー入力中の同時押し
 
         self.setWindowFlags(Qt.FramelessWindowHint)
         self.setAttribute(Qt.WA_TranslucentBackground)
@@ -164,82 +180,103 @@ class MainWindow(QWidget):
 
         # プロファイル
         row_pf = QHBoxLayout(); row_pf.addStretch(1); row_pf.addWidget(QLabel("プロファイル　:"))
-        self.cmb_profile = QComboBox(); self.cmb_profile.setEditable(True); row_pf.addWidget(self.cmb_profile, 2)
+        self.cmb_profile = QComboBox(); self.cmb_profile.setEditable(True)
+        self._profile_model = ProfileListModel(self.cmb_profile); self.cmb_profile.setModel(self._profile_model)
+        # 幅は内容から測らない（全行を読むことになる）。入力補完は別の文字列モデルで（一覧の行を全部作らせない）
+        self.cmb_profile.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLengthWithIcon); self.cmb_profile.setMinimumContentsLength(16)
+        self._profile_names_model = QStringListModel(self.cmb_profile)
+        comp = QCompleter(self._profile_names_model, self.cmb_profile); comp.setCaseSensitivity(Qt.CaseInsensitive)
+        self.cmb_profile.setCompleter(comp)
+        row_pf.addWidget(self.cmb_profile, 2)
+        self.ed_pf_filter = QLineEdit(); self.ed_pf_filter.setPlaceholderText("絞り込み"); self.ed_pf_filter.setClearButtonEnabled(True)
+        self.ed_pf_filter.setMaximumWidth(120); row_pf.addWidget(self.ed_pf_filter)
         self.btn_pf_apply = QPushButton("適用"); self.btn_pf_save = QPushButton("保存/上書"); self.btn_pf_del = QPushButton("削除")
         row_pf.addWidget(self.btn_pf_apply); row_pf.addWidget(self.btn_pf_save); row_pf.addWidget(self.btn_pf_del); row_pf.addStretch(1)
         pl.addLayout(row_pf)
 
         # 連打ボタン
         gb_btn = QGroupBox("連打ボタン"); gbl = QHBoxLayout(gb_btn)
-        self.rb_left = QRadioButton("左クリック"); self.rb_right = QRadioButton("右クリック"); self.rb_key = QRadioButton("指定キー/キー列")
+        self.rb_left = QRadioButton("左クリック"); self.rb_right = QRadioButton("右クリック"); self.rb_key = QRadioButton("指定キー/キー列"); self.rb_macro = QRadioButton("マクロ")
         self.rb_left.setChecked(True)
-        self._btn_group = QButtonGroup(gb_btn); [self._btn_group.addButton(rb) for rb in (self.rb_left,self.rb_right,self.rb_key)]
-        gbl.addStretch(1); gbl.addWidget(self.rb_left); gbl.addWidget(self.rb_right); gbl.addWidget(self.rb_key); gbl.addStretch(1)
+        self._btn_group = QButtonGroup(gb_btn); [self._btn_group.addButton(rb) for rb in (self.rb_left,self.rb_right,self.rb_key,self.rb_macro)]
+        gbl.addStretch(1); gbl.addWidget(self.rb_left); gbl.addWidget(self.rb_right); gbl.addWidget(self.rb_key); gbl.addWidget(self.rb_macro); gbl.addStretch(1)
         pl.addWidget(gb_btn)
 
         # クリック座標
         gb_pos = QGroupBox("クリック座標"); gp = QHBoxLayout(gb_pos)
-        self.rb_pos_follow = QRadioButton("現在位置"); self.rb_pos_fixed = QRadioButton("固定座標"); self.rb_pos_rand = QRadioButton("ランダム矩形"); self.rb_pos_rec = QRadioButton("記録操作")
+        self.rb_pos_follow = QRadioButton("現在位置"); self.rb_pos_fixed = QRadioButton("固定座標"); self.rb_pos_rand = QRadioButton("ランダム矩形"); self.rb_pos_rec = QRadioButton("記録操作"); self.rb_pos_traj = QRadioButton("軌跡再生"); self.rb_pos_tmpl = QRadioButton("画像探索")
         self.rb_pos_follow.setChecked(True)
-        self._pos_group = QButtonGroup(gb_pos); [self._pos_group.addButton(rb) for rb in (self.rb_pos_follow,self.rb_pos_fixed,self.rb_pos_rand,self.rb_pos_rec)]
-        gp.addStretch(1); gp.addWidget(self.rb_pos_follow); gp.addWidget(self.rb_pos_fixed); gp.addWidget(self.rb_pos_rand); gp.addWidget(self.rb_pos_rec); gp.addStretch(1)
+        self._pos_group = QButtonGroup(gb_pos); [self._pos_group.addButton(rb) for rb in (self.rb_pos_follow,self.rb_pos_fixed,self.rb_pos_rand,self.rb_pos_rec,self.rb_pos_traj,self.rb_pos_tmpl)]
+        gp.addStretch(1); gp.addWidget(self.rb_pos_follow); gp.addWidget(self.rb_pos_fixed); gp.addWidget(self.rb_pos_rand); gp.addWidget(self.rb_pos_rec); gp.addWidget(self.rb_pos_traj); gp.addWidget(self.rb_pos_tmpl); gp.addStretch(1)
         pl.addWidget(gb_pos)
 
-        # ディレイ/バースト
+        # ディレイ/レートカーブ
         gb_burst = QGroupBox("ディレイ/バースト"); gl = QVBoxLayout(gb_burst)
-        row_dur = QHBoxLayout(); row_dur.addStretch(1)
-        row_dur.addWidget(QLabel("通常持続(秒)")); self.spin_norm_sec = QSpinBox(); self.spin_norm_sec.setRange(0,86400); self.spin_norm_sec.setValue(0); row_dur.addWidget(self.spin_norm_sec)
-        row_dur.addSpacing(12); self.chk_b1 = QCheckBox("段１有効"); row_dur.addWidget(self.chk_b1)
-        row_dur.addWidget(QLabel("段１持続(秒)")); self.spin_b1_sec = QSpinBox(); self.spin_b1_sec.setRange(0,120); self.spin_b1_sec.setValue(0); row_dur.addWidget(self.spin_b1_sec)
-        row_dur.addSpacing(12); self.chk_b2 = QCheckBox("段２有効"); row_dur.addWidget(self.chk_b2)
-        row_dur.addWidget(QLabel("段２持続(秒)")); self.spin_b2_sec = QSpinBox(); self.spin_b2_sec.setRange(0,120); self.spin_b2_sec.setValue(0); row_dur.addWidget(self.spin_b2_sec)
-        row_dur.addStretch(1); gl.addLayout(row_dur)
         row_ms = QHBoxLayout(); row_ms.addStretch(1)
         row_ms.addWidget(QLabel("通常間隔(ms)")); self.spin_delay = QSpinBox(); self.spin_delay.setRange(1,10000); self.spin_delay.setValue(100); row_ms.addWidget(self.spin_delay)
-        row_ms.addSpacing(12); row_ms.addWidget(QLabel("段１間隔(ms)")); self.spin_b1_ms = QSpinBox(); self.spin_b1_ms.setRange(1,10000); self.spin_b1_ms.setValue(50); row_ms.addWidget(self.spin_b1_ms)
-        row_ms.addSpacing(12); row_ms.addWidget(QLabel("段２間隔(ms)")); self.spin_b2_ms = QSpinBox(); self.spin_b2_ms.setRange(1,10000); self.spin_b2_ms.setValue(20); row_ms.addWidget(self.spin_b2_ms)
+        row_ms.addSpacing(12); row_ms.addWidget(QLabel("通常持続(秒)")); self.spin_norm_sec = QSpinBox(); self.spin_norm_sec.setRange(0,86400); self.spin_norm_sec.setValue(0); row_ms.addWidget(self.spin_norm_sec)
+        row_ms.addSpacing(12); row_ms.addWidget(QLabel("持続後"))
+        self.cmb_curve_end = QComboBox()
+        for label, key in (("段から繰り返す", "loop"), ("停止", "stop")): self.cmb_curve_end.addItem(label, key)
+        row_ms.addWidget(self.cmb_curve_end)
         row_ms.addStretch(1); gl.addLayout(row_ms)
+        row_st = QHBoxLayout()
+        row_st.addWidget(QLabel("段"))
+        self.ed_stages = QLineEdit(); self.ed_stages.setPlaceholderText("間隔ms 持続秒 [linear|exp]; … 例 50 5; 20 3 linear（最後の段は通常間隔へつなぐ）")
+        row_st.addWidget(self.ed_stages, 1)
+        self.lbl_stages = QLabel(""); row_st.addWidget(self.lbl_stages)
+        gl.addLayout(row_st)
+        row_lim = QHBoxLayout(); row_lim.addStretch(1)
+        row_lim.addWidget(QLabel("総時間(秒)")); self.spin_duration = QSpinBox(); self.spin_duration.setRange(0,86400); self.spin_duration.setValue(0); row_lim.addWidget(self.spin_duration)
+        row_lim.addSpacing(12); row_lim.addWidget(QLabel("回数上限")); self.spin_budget = QSpinBox(); self.spin_budget.setRange(0,2_000_000_000); self.spin_budget.setValue(0); row_lim.addWidget(self.spin_budget)
+        row_lim.addWidget(QLabel("（0=無制限）"))
+        row_lim.addStretch(1); gl.addLayout(row_lim)
         pl.addWidget(gb_burst)
 
         # ステータス
         box_status = QGroupBox("") ; bs = QHBoxLayout(box_status)
-        self.lbl_status = QLabel("停止中"); bs.addStretch(1); bs.addWidget(self.lbl_status); bs.addStretch(1)
+        self.lbl_status = QLabel("停止中"); self.lbl_status.setObjectName("statusLabel")
+        bs.addStretch(1); bs.addWidget(self.lbl_status); bs.addStretch(1)
         pl.addWidget(box_status)
 
         main.addWidget(panel)
         self.resize(860, 560); self.setMinimumSize(50, 50)
 
-        # エンジン
-        self.engine = AutoClickEngine()
-        self.engine.state_changed.connect(self._on_engine_state)
-        self.engine.point_recorded.connect(self._on_point_recorded)  # ★ F12受信
+        # 設定（起動スクリプトで読み込み済みならそれを使う。以後の保存は ConfigWriter がまとめて裏で書く）
+        self.cfg = cfg if cfg is not None else AppConfig.load()
+        self._writer = ConfigWriter()
+
+        # エンジン（キーボードフックは最初の描画のあとで開始）
+        self._bridge = EngineBridge(self)
+        self.engine = AutoClickEngine(create_backend(self.cfg.get("input_backend", "pynput"), screen_size()),
+                                      hooks=False, events=self._bridge, log=EventLog(LOGS_DIR))
+        AppConfig.attach_log(self.engine.log)
+        self._bridge.state_changed.connect(self._on_engine_state)
+        self._bridge.point_recorded.connect(self._on_point_recorded)  # ★ F12受信
+        self._bridge.metrics_updated.connect(self._on_metrics)
 
         # メニュー
         self._init_menu()
 
-        # 設定ロード
-        self.cfg = AppConfig.load()
         self._load_from_config()
+        self._update_stages_label()   # 読み込み時は textChanged をまだつないでいない
 
         # イベント束ね
-        for w in (self.spin_norm_sec, self.spin_b1_sec, self.spin_b2_sec, self.spin_delay, self.spin_b1_ms, self.spin_b2_ms):
+        for w in (self.spin_norm_sec, self.spin_delay, self.spin_duration, self.spin_budget):
             w.valueChanged.connect(self._on_ui_changed)
-        for c in (self.chk_b1, self.chk_b2):
-            c.stateChanged.connect(self._on_ui_changed)
+        self.cmb_curve_end.currentIndexChanged.connect(self._on_ui_changed)
+        self.ed_stages.textChanged.connect(self._on_stages_changed)
         self._btn_group.buttonClicked.connect(self._on_ui_changed)
         self._pos_group.buttonClicked.connect(self._on_ui_changed)
         self.btn_pf_apply.clicked.connect(self._apply_profile)
         self.btn_pf_save.clicked.connect(self._save_profile)
         self.btn_pf_del.clicked.connect(self._delete_profile)
         self.cmb_profile.currentTextChanged.connect(self._on_profile_changed)
+        self.ed_pf_filter.textChanged.connect(self._on_profile_filter)
 
         # 背景でドラッグ/リサイズ
         self.bg.setMouseTracking(True); self.bg.installEventFilter(self)
 
-        # UI定期
-        self._ui_timer = QTimer(self); self._ui_timer.setInterval(250)
-        self._ui_timer.timeout.connect(self._refresh_status_style); self._ui_timer.start()
-
         # トレイ
         self._init_tray()
         if self.cfg.get("start_minimized", False) and start_minimized and QSystemTrayIcon.isSystemTrayAvailable():
@@ -247,6 +284,19 @@ class MainWindow(QWidget):
             self.tray.showMessage("AutoClicker", "バックグラウンドで待機中（ホットキーで開始/停止）")
 
         self._apply_theme(False)
+        QTimer.singleShot(1000, self._start_hooks)   # 描画されないまま（トレイ常駐など）でもフックは開始する
+
+    def paintEvent(self, e):
+        super().paintEvent(e)
+        if not self._painted:
+            self._painted = True
+            TIMER.mark("first_paint")
+            QTimer.singleShot(0, self._start_hooks)
+
+    def _start_hooks(self):
+        if self.engine.start_hooks():
+            TIMER.mark("hotkeys_ready")
+        TIMER.save_when("first_paint", "hotkeys_ready", logs_dir=LOGS_DIR)
 
     # ===== メニュー =====
     def _init_menu(self):
@@ -268,6 +318,13 @@ class MainWindow(QWidget):
         v.addWidget(self.ed_key_sequence)
         self.ed_key_sequence.textChanged.connect(self._on_ui_changed)
 
+        # マクロ（連打ボタン「マクロ」で実行。1行1命令、書式は ReadMe 参照）
+        v.addWidget(QLabel("マクロ（例: loop 3 / click left 100 200 / wait 50 / end / chord ctrl+s）"))
+        self.ed_macro = QPlainTextEdit(); self.ed_macro.setPlaceholderText("click\nwait 100\nkey A B\nhold SHIFT 300")
+        self.ed_macro.setFixedHeight(110); v.addWidget(self.ed_macro)
+        self.lbl_macro = QLabel(""); v.addWidget(self.lbl_macro)
+        self.ed_macro.textChanged.connect(self._on_macro_changed)
+
         # クリック座標XY＋記録
         v.addWidget(QLabel("クリック座標のXY設定"))
         row_fix = QHBoxLayout()
@@ -282,6 +339,32 @@ class MainWindow(QWidget):
         row_rand2.addWidget(QLabel("ランダム Ymin:")); self.spin_ry1 = QSpinBox(); self.spin_ry1.setRange(0,99999); row_rand2.addWidget(self.spin_ry1)
         row_rand2.addWidget(QLabel("Ymax:")); self.spin_ry2 = QSpinBox(); self.spin_ry2.setRange(0,99999); self.spin_ry2.setValue(100); row_rand2.addWidget(self.spin_ry2)
         v.addLayout(row_rand2)
+        row_dist = QHBoxLayout(); row_dist.addWidget(QLabel("分布"))
+        self.cmb_dist = QComboBox()
+        for label, key in (("一様", "uniform"), ("ガウス", "gaussian"), ("ポアソン", "poisson"), ("複数矩形", "multi_rect")): self.cmb_dist.addItem(label, key)
+        row_dist.addWidget(self.cmb_dist)
+        row_dist.addWidget(QLabel("σ")); self.spin_sigma = QSpinBox(); self.spin_sigma.setRange(0, 99999); self.spin_sigma.setToolTip("0=矩形の1/4"); row_dist.addWidget(self.spin_sigma)
+        row_dist.addWidget(QLabel("最小間隔")); self.spin_min_dist = QSpinBox(); self.spin_min_dist.setRange(2, 9999); self.spin_min_dist.setValue(8); row_dist.addWidget(self.spin_min_dist)
+        row_dist.addWidget(QLabel("seed")); self.spin_seed = QSpinBox(); self.spin_seed.setRange(0, 2**31 - 1); self.spin_seed.setToolTip("0=毎回ランダム"); row_dist.addWidget(self.spin_seed)
+        v.addLayout(row_dist)
+        self.ed_rects = QLineEdit(); self.ed_rects.setPlaceholderText("複数矩形: x1,y1,x2,y2,重み; … 例 0,0,100,100,3; 500,500,600,550,1")
+        v.addWidget(self.ed_rects)
+        self.cmb_dist.currentIndexChanged.connect(self._on_ui_changed)
+        for w in (self.spin_sigma, self.spin_min_dist, self.spin_seed): w.valueChanged.connect(self._on_ui_changed)
+        self.ed_rects.editingFinished.connect(self._on_ui_changed)
+
+        # 画像探索（参照画像を探索領域から探して、その中心をクリック）
+        row_tmpl = QHBoxLayout()
+        self.ed_tmpl_rect = QLineEdit(); self.ed_tmpl_rect.setPlaceholderText("探索領域 x1,y1,x2,y2（狭いほど速い）"); row_tmpl.addWidget(self.ed_tmpl_rect, 1)
+        row_tmpl.addWidget(QLabel("しきい値")); self.spin_tmpl_thr = QDoubleSpinBox(); self.spin_tmpl_thr.setRange(0.3, 1.0)
+        self.spin_tmpl_thr.setSingleStep(0.05); self.spin_tmpl_thr.setValue(0.8); row_tmpl.addWidget(self.spin_tmpl_thr)
+        v.addLayout(row_tmpl)
+        row_tmpl2 = QHBoxLayout()
+        self.ed_tmpl_src = QLineEdit(); self.ed_tmpl_src.setPlaceholderText(f"画像にする範囲 x1,y1,x2,y2（一辺{TEMPLATE_MAX}pxまで）"); row_tmpl2.addWidget(self.ed_tmpl_src, 1)
+        btn_tmpl = QPushButton("画像を取り込む"); btn_tmpl.clicked.connect(self._grab_template); row_tmpl2.addWidget(btn_tmpl)
+        self.lbl_tmpl = QLabel("画像: なし"); row_tmpl2.addWidget(self.lbl_tmpl)
+        v.addLayout(row_tmpl2)
+        self.ed_tmpl_rect.editingFinished.connect(self._on_ui_changed); self.spin_tmpl_thr.valueChanged.connect(self._on_ui_changed)
 
         # 記録操作の状況
         row_rec = QHBoxLayout()
@@ -291,13 +374,70 @@ class MainWindow(QWidget):
         row_rec.addWidget(self.lbl_rec_count); row_rec.addStretch(1); row_rec.addWidget(btn_rec_clear)
         v.addLayout(row_rec)
 
+        # 記録点の最適化（近接点の統合 / 巡回順 / 軌跡の間引き）
+        row_opt = QHBoxLayout()
+        row_opt.addWidget(QLabel("統合(px)")); self.spin_opt_merge = QSpinBox(); self.spin_opt_merge.setRange(0, 500); self.spin_opt_merge.setValue(3); row_opt.addWidget(self.spin_opt_merge)
+        self.chk_opt_route = QCheckBox("巡回順"); row_opt.addWidget(self.chk_opt_route)
+        row_opt.addWidget(QLabel("間引き(px)")); self.spin_opt_rdp = QSpinBox(); self.spin_opt_rdp.setRange(0, 500); row_opt.addWidget(self.spin_opt_rdp)
+        btn_opt = QPushButton("記録点を最適化"); btn_opt.clicked.connect(self._optimize_record_points)
+        row_opt.addStretch(1); row_opt.addWidget(btn_opt)
+        v.addLayout(row_opt)
+
+        # 軌跡記録（移動・クリック・キーを時刻付きで記録 → 「軌跡再生」で同じ間隔で再生）
+        row_traj = QHBoxLayout()
+        self.btn_traj = QPushButton("軌跡記録 開始"); self.btn_traj.clicked.connect(self._toggle_traj_recording)
+        self.lbl_traj = QLabel("軌跡: なし")
+        row_traj.addWidget(self.btn_traj); row_traj.addWidget(self.lbl_traj); row_traj.addStretch(1)
+        row_traj.addWidget(QLabel("速度x")); self.spin_traj_speed = QDoubleSpinBox(); self.spin_traj_speed.setRange(0.1, 10.0)
+        self.spin_traj_speed.setSingleStep(0.1); self.spin_traj_speed.setValue(1.0); row_traj.addWidget(self.spin_traj_speed)
+        self.chk_traj_loop = QCheckBox("ループ"); self.chk_traj_loop.setChecked(True); row_traj.addWidget(self.chk_traj_loop)
+        self.spin_traj_speed.valueChanged.connect(self._on_ui_changed); self.chk_traj_loop.stateChanged.connect(self._on_ui_changed)
+        v.addLayout(row_traj)
+
+        # 追加ジョブ（今の設定を複製して、主設定と同時に別間隔で回す）
+        row_jobs = QHBoxLayout()
+        self.lbl_jobs = QLabel("追加ジョブ: 0件")
+        btn_job_add = QPushButton("今の設定をジョブに追加"); btn_job_add.clicked.connect(self._add_job)
+        btn_job_clear = QPushButton("ジョブ消去"); btn_job_clear.clicked.connect(self._clear_jobs)
+        row_jobs.addWidget(self.lbl_jobs); row_jobs.addStretch(1); row_jobs.addWidget(btn_job_add); row_jobs.addWidget(btn_job_clear)
+        v.addLayout(row_jobs)
+
+        # 画面トリガー（領域が変わった・指定色になったときだけ発火。発火後は通常間隔だけ休む）
+        row_trig = QHBoxLayout(); row_trig.addWidget(QLabel("画面トリガー"))
+        self.cmb_trigger = QComboBox()
+        for label, key in (("なし（タイマー）", "none"), ("領域の変化", "change"), ("色の一致", "color")): self.cmb_trigger.addItem(label, key)
+        row_trig.addWidget(self.cmb_trigger)
+        row_trig.addWidget(QLabel("監視(ms)")); self.spin_trig_ms = QSpinBox(); self.spin_trig_ms.setRange(1, 1000); self.spin_trig_ms.setValue(10); row_trig.addWidget(self.spin_trig_ms)
+        row_trig.addStretch(1); v.addLayout(row_trig)
+        row_trig2 = QHBoxLayout()
+        self.ed_trig_rect = QLineEdit(); self.ed_trig_rect.setPlaceholderText("領域 x1,y1,x2,y2（小さいほど速い）"); row_trig2.addWidget(self.ed_trig_rect, 1)
+        self.ed_trig_color = QLineEdit(); self.ed_trig_color.setPlaceholderText("#RRGGBB"); self.ed_trig_color.setFixedWidth(80); row_trig2.addWidget(self.ed_trig_color)
+        row_trig2.addWidget(QLabel("許容差")); self.spin_trig_tol = QSpinBox(); self.spin_trig_tol.setRange(0, 255); self.spin_trig_tol.setValue(24); row_trig2.addWidget(self.spin_trig_tol)
+        row_trig2.addWidget(QLabel("割合%")); self.spin_trig_ratio = QDoubleSpinBox(); self.spin_trig_ratio.setRange(0.1, 100.0); self.spin_trig_ratio.setValue(1.0); row_trig2.addWidget(self.spin_trig_ratio)
+        v.addLayout(row_trig2)
+        self.cmb_trigger.currentIndexChanged.connect(self._on_ui_changed)
+        for w in (self.spin_trig_ms, self.spin_trig_tol, self.spin_trig_ratio): w.valueChanged.connect(self._on_ui_changed)
+        for w in (self.ed_trig_rect, self.ed_trig_color): w.editingFinished.connect(self._on_ui_changed)
+
         # ホットキー
         v.addSpacing(6); v.addWidget(QLabel("ホットキー（開始/停止トグル）"))
         self.ed_hotkey = QLineEdit(); self.ed_hotkey.setPlaceholderText("ここをクリックして組み合わせを押す（例: Ctrl+Alt）")
         self.ed_hotkey.setReadOnly(True); self.ed_hotkey.installEventFilter(self); v.addWidget(self.ed_hotkey)
 
+        # タイミング補正（遅れたティックの扱い）
+        row_tp = QHBoxLayout(); row_tp.addWidget(QLabel("遅延時の補正"))
+        self.cmb_timing = QComboBox()
+        for label, key in (("取り戻す", "catchup"), ("飛ばす", "skip"), ("リセット", "reset")): self.cmb_timing.addItem(label, key)
+        self.cmb_timing.setCurrentIndex(1); self.cmb_timing.currentIndexChanged.connect(self._on_ui_changed)
+        row_tp.addWidget(self.cmb_timing); row_tp.addStretch(1); v.addLayout(row_tp)
+
         self.chk_start_min = QCheckBox("起動時に最小化してトレイに常駐"); v.addWidget(self.chk_start_min)
 
+        # イベントログ（logs/ に常時記録。調査用に直近分だけ別ファイルへ書き出せる）
+        row_log = QHBoxLayout(); row_log.addWidget(QLabel("イベントログ")); row_log.addStretch(1)
+        btn_log = QPushButton("直近の記録を書き出す"); btn_log.clicked.connect(self._dump_event_log); row_log.addWidget(btn_log)
+        v.addLayout(row_log)
+
         v.addStretch(1); btn_close = QPushButton("閉じる"); btn_close.clicked.connect(lambda: self._toggle_menu(False)); v.addWidget(btn_close)
 
         self.menu_anim = QPropertyAnimation(self.menuPanel, b"geometry", self)
@@ -330,15 +470,24 @@ class MainWindow(QWidget):
         if not QSystemTrayIcon.isSystemTrayAvailable(): self.tray = None; return
         icon_file = resource_path(os.path.join("assets", "AutoClicker.ico"))
         self.tray = QSystemTrayIcon(QIcon(icon_file) if os.path.exists(icon_file) else self.style().standardIcon(QStyle.SP_ComputerIcon), self)
-        menu = QMenu()
-        act_show   = QAction("ウィンドウを表示", self, triggered=lambda: (self.showNormal(), self.activateWindow()))
-        act_toggle = QAction("開始/停止をトグル", self, triggered=self.engine.toggle)
-        act_quit   = QAction("終了", self, triggered=self._quit)
-        menu.addAction(act_show); menu.addAction(act_toggle); menu.addSeparator(); menu.addAction(act_quit)
-        self.tray.setContextMenu(menu); self.tray.setToolTip("AutoClicker")
-        self.tray.activated.connect(lambda r: (self.showNormal(), self.activateWindow()) if r==QSystemTrayIcon.Trigger else None)
+        self._tray_menu: QMenu | None = None   # 右クリックされたときに初めて作る
+        self.tray.setToolTip("AutoClicker")
+        self.tray.activated.connect(self._on_tray_activated)
         self.tray.show()
 
+    def _on_tray_activated(self, reason):
+        if reason == QSystemTrayIcon.Trigger:
+            self.showNormal(); self.activateWindow()
+        elif reason == QSystemTrayIcon.Context:
+            if self._tray_menu is None:
+                menu = QMenu(self)
+                menu.addAction(QAction("ウィンドウを表示", self, triggered=lambda: (self.showNormal(), self.activateWindow())))
+                menu.addAction(QAction("開始/停止をトグル", self, triggered=self.engine.toggle))
+                menu.addSeparator()
+                menu.addAction(QAction("終了", self, triggered=self._quit))
+                self._tray_menu = menu
+            self._tray_menu.popup(QCursor.pos())
+
     def _quit(self):
         try:
             self._save_to_config(); self.engine.shutdown()
@@ -377,18 +526,28 @@ class MainWindow(QWidget):
         if obj is self.ed_hotkey:
             if e.type() == QEvent.FocusIn:
                 self.engine.set_hotkey_muted(True)
+                self._hk_held = set(); self._hk_chord = []
                 self.ed_hotkey.setText("（入力待ち…）"); return False
             if e.type() == QEvent.KeyPress:
+                if e.isAutoRepeat(): return True
                 mods = []
                 if e.modifiers() & Qt.ControlModifier: mods.append("Ctrl")
                 if e.modifiers() & Qt.AltModifier:     mods.append("Alt")
                 if e.modifiers() & Qt.ShiftModifier:   mods.append("Shift")
                 key_txt = QKeySequence(e.key()).toString()
-                spec = "+".join(mods + ([key_txt] if key_txt and e.key() not in (Qt.Key_Control,Qt.Key_Shift,Qt.Key_Alt) else [])) or "Ctrl+Alt"
+                if key_txt and e.key() not in (Qt.Key_Control,Qt.Key_Shift,Qt.Key_Alt):
+                    # 同時に押されているキーはコード（A+S など）としてまとめる。全部離したら次は新しい組み合わせ
+                    if not self._hk_held: self._hk_chord = []
+                    self._hk_held.add(e.key())
+                    if key_txt not in self._hk_chord: self._hk_chord.append(key_txt)
+                spec = "+".join(mods + self._hk_chord) or "Ctrl+Alt"
                 self.ed_hotkey.setText(spec)
                 hk = HotkeySpec.from_string(spec)
                 if hk: self.engine.update_hotkey(hk)
                 return True
+            if e.type() == QEvent.KeyRelease:
+                if not e.isAutoRepeat(): self._hk_held.discard(e.key())
+                return True
             if e.type() == QEvent.FocusOut:
                 self.engine.set_hotkey_muted(self._menu_visible)  # メニューが開いていれば引き続きミュート
                 return False
@@ -399,12 +558,15 @@ class MainWindow(QWidget):
     def _current_button(self) -> str:
         if self.rb_left.isChecked():  return "left"
         if self.rb_right.isChecked(): return "right"
+        if self.rb_macro.isChecked(): return "macro"
         return "key"
 
     def _click_pos_mode(self):
         if self.rb_pos_fixed.isChecked():   return "fixed"
         if self.rb_pos_rand.isChecked():    return "random_rect"
         if self.rb_pos_rec.isChecked():     return "recorded"
+        if self.rb_pos_traj.isChecked():    return "trajectory"
+        if self.rb_pos_tmpl.isChecked():    return "template"
         return "follow"
 
     def _gather_click_pos_params(self):
@@ -414,47 +576,171 @@ class MainWindow(QWidget):
         if mode == "random_rect":
             x1,x2 = sorted([self.spin_rx1.value(), self.spin_rx2.value()])
             y1,y2 = sorted([self.spin_ry1.value(), self.spin_ry2.value()])
-            return ("random_rect", {"x1": x1, "x2": x2, "y1": y1, "y2": y2})
+            return ("random_rect", {"x1": x1, "x2": x2, "y1": y1, "y2": y2,
+                                    "dist": self.cmb_dist.currentData() or "uniform", "sigma": self.spin_sigma.value(),
+                                    "min_dist": self.spin_min_dist.value(), "seed": self.spin_seed.value() or None,
+                                    "rects": parse_rects(self.ed_rects.text())})
         if mode == "recorded":
             return ("recorded", {})
+        if mode == "trajectory":
+            return ("trajectory", {"file": self._traj_file, "speed": round(self.spin_traj_speed.value(), 2),
+                                   "loop": self.chk_traj_loop.isChecked()})
+        if mode == "template":
+            r = (parse_rects(self.ed_tmpl_rect.text()) or [{"x1": 0, "y1": 0, "x2": 0, "y2": 0}])[0]
+            return ("template", {"x1": r["x1"], "y1": r["y1"], "x2": r["x2"], "y2": r["y2"],
+                                 "threshold": round(self.spin_tmpl_thr.value(), 2), "image": self._tmpl_image})
         return ("follow", {})
 
     def _push_params(self):
         mode, params = self._gather_click_pos_params()
         seq_text = (self.ed_key_sequence.text().strip() if self.ed_key_sequence else "")
         key_seq = [t.strip() for t in seq_text.split(",") if t.strip()] if seq_text else []
+        try:
+            self._set_engine_params(mode, params, key_seq)
+        except MacroError as ex:   # 壊れたマクロは送らない（直前の計画のまま）
+            self.lbl_macro.setText(f"⚠ {ex}")
+
+    def _set_engine_params(self, mode, params, key_seq):
         self.engine.set_params(
             button=self._current_button(),
             delay_ms=self.spin_delay.value(),
-            burst1_enabled=self.chk_b1.isChecked(),
-            burst1_sec=self.spin_b1_sec.value(),
-            burst1_ms=self.spin_b1_ms.value(),
-            burst2_enabled=self.chk_b2.isChecked(),
-            burst2_sec=self.spin_b2_sec.value(),
-            burst2_ms=self.spin_b2_ms.value(),
+            stages=parse_stages(self.ed_stages.text()),
             normal_sec=self.spin_norm_sec.value(),
+            curve_end=self.cmb_curve_end.currentData() or "loop",
+            duration_s=self.spin_duration.value(),
+            budget=self.spin_budget.value(),
+            trigger=self._trigger_params(),
             click_mode=mode,
             click_params=params,
             key_to_repeat=(self.ed_key_repeat.text().strip() or None),
             key_sequence=key_seq,
-            recorded_points=list(self._record_points)
+            recorded_points=self._record_points,
+            timing_policy=self.cmb_timing.currentData() or "skip",
+            macro=self.ed_macro.toPlainText()
         )
 
+    def _trigger_params(self) -> dict:
+        kind = self.cmb_trigger.currentData() or "none"
+        if kind == "none": return {}
+        r = (parse_rects(self.ed_trig_rect.text()) or [{"x1": 0, "y1": 0, "x2": 31, "y2": 31}])[0]
+        return {"type": kind, "x1": r["x1"], "y1": r["y1"], "x2": r["x2"], "y2": r["y2"],
+                "color": self.ed_trig_color.text().strip() or "#ffffff", "tol": self.spin_trig_tol.value(),
+                "ratio": self.spin_trig_ratio.value() / 100.0, "interval_ms": self.spin_trig_ms.value()}
+
+    def _on_stages_changed(self):
+        self._update_stages_label()
+        self._on_ui_changed()
+
+    def _update_stages_label(self):
+        stages = parse_stages(self.ed_stages.text())
+        self._n_stages = len(stages)
+        total = sum(s["sec"] for s in stages)
+        self.lbl_stages.setText(f"{len(stages)}段（{total:g}秒）" if stages else "")
+
+    def _on_macro_changed(self):
+        src = self.ed_macro.toPlainText()
+        err = check_macro(src)
+        self.lbl_macro.setText(f"⚠ {err}" if err else (f"OK（{sum(1 for l in src.splitlines() if l.split('#', 1)[0].strip())}行）" if src.strip() else ""))
+        self._on_ui_changed()
+
     # ===== 記録（F12） =====
     def _on_point_recorded(self, x: int, y: int):
-        self._record_points.append((int(x), int(y)))
+        self._record_points = self._record_points.appended(x, y)
         if self.lbl_rec_count:
             self.lbl_rec_count.setText(f"記録済み: {len(self._record_points)}件")
         # 記録操作が未選択ならヒント的に切り替えはしない（ユーザー主導でOK）
         self._push_params()
-        self._auto_save_current(snapshot_only=True)
+        self._auto_save_current()
 
     def _clear_record_points(self):
-        self._record_points.clear()
+        self._record_points = PointBuffer()
         if self.lbl_rec_count:
             self.lbl_rec_count.setText("記録済み: 0件")
         self._push_params()
-        self._auto_save_current(snapshot_only=True)
+        self._auto_save_current()
+
+    def _dump_event_log(self):
+        path = os.path.join(LOGS_DIR, time.strftime("events_%Y%m%d_%H%M%S.jsonl"))
+        try:
+            n = self.engine.log.dump(path)
+        except OSError as ex:
+            QMessageBox.warning(self, "イベントログ", f"書き出せませんでした: {ex}"); return
+        QMessageBox.information(self, "イベントログ", f"直近 {n} 件を書き出したよ。\n{path}")
+
+    def _optimize_record_points(self):
+        before = len(self._record_points)
+        if before < 2: return
+        self._record_points = self._record_points.optimized(
+            merge_tol=self.spin_opt_merge.value(), reorder=self.chk_opt_route.isChecked(), rdp_eps=self.spin_opt_rdp.value())
+        if self.lbl_rec_count:
+            self.lbl_rec_count.setText(f"記録済み: {len(self._record_points)}件（最適化前 {before}件）")
+        self._push_params()
+        self._auto_save_current()
+
+    # ===== 追加ジョブ =====
+    def _add_job(self):
+        job = self._snapshot_profile(); job.pop("jobs", None)
+        if job["click_mode"] == "trajectory":
+            QMessageBox.information(self, "追加ジョブ", "軌跡再生はジョブに追加できません（主設定でのみ使えます）"); return
+        job["recorded_points"] = job["recorded_points"].to_list()
+        self._jobs = self._jobs + [job]
+        self._push_jobs()
+        self._auto_save_current()
+
+    def _clear_jobs(self):
+        self._jobs = []
+        self._push_jobs()
+        self._auto_save_current()
+
+    def _push_jobs(self):
+        self.engine.set_jobs(self._jobs)
+        if self.lbl_jobs: self.lbl_jobs.setText(f"追加ジョブ: {len(self._jobs)}件")
+
+    # ===== 軌跡記録 =====
+    def _toggle_traj_recording(self):
+        if self._traj_rec is None:
+            path = os.path.join(CONFIG_DIR, "trajectories", time.strftime("traj_%Y%m%d_%H%M%S.actr"))
+            self._traj_rec = TrajectoryRecorder(path)
+            try:
+                self._traj_rec.start()
+            except Exception as ex:
+                self._traj_rec = None
+                QMessageBox.warning(self, "軌跡記録", f"記録を開始できませんでした: {ex}"); return
+            self.btn_traj.setText("軌跡記録 停止"); self.lbl_traj.setText("軌跡: 記録中…")
+            return
+        rec, self._traj_rec = self._traj_rec, None
+        rec.stop()
+        self._traj_file = rec.path
+        self.btn_traj.setText("軌跡記録 開始"); self._update_traj_label()
+        self._on_ui_changed()
+
+    def _update_traj_label(self):
+        if not self._traj_file or not os.path.exists(self._traj_file):
+            self.lbl_traj.setText("軌跡: なし"); return
+        self.lbl_traj.setText(f"軌跡: {os.path.basename(self._traj_file)}（{record_count(self._traj_file)}件）")
+
+    def _grab_template(self):
+        """指定範囲の画面をグレースケールで取り込み、参照画像にする（Qt の画面取り込みなので mss は不要）"""
+        r = parse_rects(self.ed_tmpl_src.text())
+        if not r:
+            QMessageBox.warning(self, "画像探索", "画像にする範囲を x1,y1,x2,y2 で入力してください"); return
+        x1, x2 = sorted((r[0]["x1"], r[0]["x2"])); y1, y2 = sorted((r[0]["y1"], r[0]["y2"]))
+        w = x2 - x1 + 1; h = y2 - y1 + 1
+        if w > TEMPLATE_MAX or h > TEMPLATE_MAX:
+            QMessageBox.warning(self, "画像探索", f"範囲が大きすぎます（一辺{TEMPLATE_MAX}pxまで）"); return
+        img = QGuiApplication.primaryScreen().grabWindow(0, x1, y1, w, h).toImage()
+        if img.isNull():
+            QMessageBox.warning(self, "画像探索", "画面を取り込めませんでした"); return
+        if img.width() != w or img.height() != h: img = img.scaled(w, h)   # 高DPIでは物理画素で返るので論理サイズへ
+        img = img.convertToFormat(QImage.Format_Grayscale8)
+        bpl = img.bytesPerLine(); raw = bytes(img.constBits())
+        self._tmpl_image = encode_image(w, h, b"".join(raw[y * bpl:y * bpl + w] for y in range(h)))
+        self._update_tmpl_label()
+        self._on_ui_changed()
+
+    def _update_tmpl_label(self):
+        im = self._tmpl_image
+        self.lbl_tmpl.setText(f"画像: {im.get('w')}×{im.get('h')}" if im.get("gray") else "画像: なし")
 
     # ===== プロファイル =====
     def _apply_profile(self):
@@ -464,17 +750,17 @@ class MainWindow(QWidget):
         if p:
             self._load_profile(p)
             self.cfg["last_profile"] = name
-            AppConfig.save(self.cfg)
+            self._writer.mark_dirty(self.cfg)
 
     def _save_profile(self):
         name = (self.cmb_profile.currentText() or "NewProfile").strip()
         if not name:
             QMessageBox.warning(self, "保存", "プロファイル名を入力してね。"); return
         p = self._snapshot_profile()
-        self.cfg.setdefault("profiles", {})[name] = p
+        self._profiles()[name] = p
         self.cfg["last_profile"] = name
         self.cfg = AppConfig.push_history(self.cfg, name, p)
-        AppConfig.save(self.cfg)
+        self._writer.mark_dirty(self.cfg)
         self._refresh_profile_list(select=name)
         QMessageBox.information(self, "保存", f"プロファイル '{name}' を保存したよ。")
 
@@ -485,56 +771,69 @@ class MainWindow(QWidget):
         if name in profiles:
             profiles.pop(name)
             if self.cfg.get("last_profile") == name: self.cfg["last_profile"] = None
-            AppConfig.save(self.cfg)
+            self._writer.mark_dirty(self.cfg)
             self._refresh_profile_list()
 
     def _on_profile_changed(self, _txt: str):
         name = (self.cmb_profile.currentText() or "").strip()
         if name and name in (self.cfg.get("profiles") or {}):
             self.cfg["last_profile"] = name
-            AppConfig.save(self.cfg)
+            self._writer.mark_dirty(self.cfg)
 
     def _snapshot_profile(self) -> dict:
         mode, params = self._gather_click_pos_params()
         return {
             "button": self._current_button(),
             "delay_ms": int(self.spin_delay.value()),
-            "burst1_enabled": bool(self.chk_b1.isChecked()),
-            "burst1_sec": int(self.spin_b1_sec.value()),
-            "burst1_ms":  int(self.spin_b1_ms.value()),
-            "burst2_enabled": bool(self.chk_b2.isChecked()),
-            "burst2_sec": int(self.spin_b2_sec.value()),
-            "burst2_ms":  int(self.spin_b2_ms.value()),
+            "stages": parse_stages(self.ed_stages.text()),
             "normal_sec": int(self.spin_norm_sec.value()),
+            "curve_end": self.cmb_curve_end.currentData() or "loop",
+            "duration_s": int(self.spin_duration.value()),
+            "budget": int(self.spin_budget.value()),
+            "trigger": self._trigger_params(),
+            "timing_policy": self.cmb_timing.currentData() or "skip",
             "click_mode": mode,
             "click_params": params,
             "key_to_repeat": (self.ed_key_repeat.text().strip() or None),
             "key_sequence": [t.strip() for t in (self.ed_key_sequence.text().split(",") if self.ed_key_sequence else []) if t.strip()],
-            "recorded_points": list(self._record_points)
+            "macro": self.ed_macro.toPlainText(),
+            "recorded_points": self._record_points,
+            "jobs": list(self._jobs)
         }
 
-    def _auto_save_current(self, snapshot_only: bool=False):
-        """値変更のたびに現在プロファイルへ上書き＆履歴追加（最大10件）"""
+    def _auto_save_current(self):
+        """値変更のたびに現在プロファイルへ上書き＆履歴追加（最大300件）"""
         name = (self.cmb_profile.currentText() or "").strip() or "NewProfile"
         p = self._snapshot_profile()
-        self.cfg.setdefault("profiles", {})[name] = p
+        self._profiles()[name] = p
         self.cfg["last_profile"] = name
         self.cfg = AppConfig.push_history(self.cfg, name, p)
-        if not snapshot_only:
-            AppConfig.save(self.cfg)
-        else:
-            # 履歴だけでも保存しておく
-            AppConfig.save(self.cfg)
+        self._writer.mark_dirty(self.cfg)
 
     def _load_profile(self, p: dict):
+        self._loading = True
+        try:
+            self._fill_profile(p)
+        finally:
+            self._loading = False
+        self._push_jobs()
+        self._push_params()
+
+    def _fill_profile(self, p: dict):
         btn = p.get("button","left")
-        self.rb_left.setChecked(btn=="left"); self.rb_right.setChecked(btn=="right"); self.rb_key.setChecked(btn=="key")
+        self.rb_left.setChecked(btn=="left"); self.rb_right.setChecked(btn=="right"); self.rb_key.setChecked(btn=="key"); self.rb_macro.setChecked(btn=="macro")
         self.spin_delay.setValue(int(p.get("delay_ms",100)))
-        self.chk_b1.setChecked(bool(p.get("burst1_enabled", False)))
-        self.spin_b1_sec.setValue(int(p.get("burst1_sec",0))); self.spin_b1_ms.setValue(int(p.get("burst1_ms",50)))
-        self.chk_b2.setChecked(bool(p.get("burst2_enabled", False)))
-        self.spin_b2_sec.setValue(int(p.get("burst2_sec",0))); self.spin_b2_ms.setValue(int(p.get("burst2_ms",20)))
+        self.ed_stages.setText(format_stages(p.get("stages") or []))
         self.spin_norm_sec.setValue(int(p.get("normal_sec",0)))
+        ci = self.cmb_curve_end.findData(p.get("curve_end", "loop")); self.cmb_curve_end.setCurrentIndex(max(0, ci))
+        self.spin_duration.setValue(int(p.get("duration_s",0))); self.spin_budget.setValue(int(p.get("budget",0)))
+        tr = p.get("trigger") or {}
+        ti = self.cmb_trigger.findData(tr.get("type", "none")); self.cmb_trigger.setCurrentIndex(max(0, ti))
+        self.ed_trig_rect.setText(f"{tr['x1']},{tr['y1']},{tr['x2']},{tr['y2']}" if all(k in tr for k in ("x1", "y1", "x2", "y2")) else "")
+        self.ed_trig_color.setText(str(tr.get("color", "")))
+        self.spin_trig_tol.setValue(int(tr.get("tol", 24))); self.spin_trig_ratio.setValue(float(tr.get("ratio", 0.01)) * 100.0)
+        self.spin_trig_ms.setValue(int(tr.get("interval_ms", 10)))
+        ti = self.cmb_timing.findData(p.get("timing_policy", "skip")); self.cmb_timing.setCurrentIndex(ti if ti >= 0 else 1)
         # 座標
         mode = p.get("click_mode","follow"); cp = p.get("click_params",{})
         if mode=="fixed":
@@ -543,8 +842,18 @@ class MainWindow(QWidget):
             self.rb_pos_rand.setChecked(True)
             self.spin_rx1.setValue(int(cp.get("x1",0))); self.spin_rx2.setValue(int(cp.get("x2",100)))
             self.spin_ry1.setValue(int(cp.get("y1",0))); self.spin_ry2.setValue(int(cp.get("y2",100)))
+            di = self.cmb_dist.findData(cp.get("dist", "uniform")); self.cmb_dist.setCurrentIndex(max(0, di))
+            self.spin_sigma.setValue(int(cp.get("sigma", 0) or 0)); self.spin_min_dist.setValue(int(cp.get("min_dist", 8) or 8))
+            self.spin_seed.setValue(int(cp.get("seed") or 0)); self.ed_rects.setText(format_rects(cp.get("rects") or []))
         elif mode=="recorded":
             self.rb_pos_rec.setChecked(True)
+        elif mode=="trajectory":
+            self.rb_pos_traj.setChecked(True)
+            self.spin_traj_speed.setValue(float(cp.get("speed", 1.0))); self.chk_traj_loop.setChecked(bool(cp.get("loop", True)))
+        elif mode=="template":
+            self.rb_pos_tmpl.setChecked(True)
+            self.ed_tmpl_rect.setText(f"{cp.get('x1',0)},{cp.get('y1',0)},{cp.get('x2',0)},{cp.get('y2',0)}")
+            self.spin_tmpl_thr.setValue(float(cp.get("threshold", 0.8)))
         else:
             self.rb_pos_follow.setChecked(True)
         # キー/キー列
@@ -552,43 +861,94 @@ class MainWindow(QWidget):
             self.ed_key_repeat.setText(p.get("key_to_repeat") or "")
         if self.ed_key_sequence is not None:
             self.ed_key_sequence.setText(",".join(p.get("key_sequence", [])))
+        self.ed_macro.blockSignals(True); self.ed_macro.setPlainText(p.get("macro") or ""); self.ed_macro.blockSignals(False)
+        err = check_macro(self.ed_macro.toPlainText()); self.lbl_macro.setText(f"⚠ {err}" if err else "")
+        self._traj_file = str(cp.get("file") or "") if mode=="trajectory" else self._traj_file
+        self._update_traj_label()
+        self._tmpl_image = dict(cp.get("image") or {}) if mode=="template" else self._tmpl_image
+        self._update_tmpl_label()
         # 記録点
-        self._record_points = [(int(x),int(y)) for (x,y) in p.get("recorded_points", [])]
+        self._record_points = PointBuffer.coerce(p.get("recorded_points"))
         if self.lbl_rec_count:
             self.lbl_rec_count.setText(f"記録済み: {len(self._record_points)}件")
-        self._push_params()
+        self._jobs = [j for j in (p.get("jobs") or []) if isinstance(j, dict)]
+
+    def _profile_names(self) -> list:
+        """絞り込み欄に合う名前（名前順）"""
+        profiles = self.cfg.get("profiles") or {}
+        like = self.ed_pf_filter.text().strip()
+        if isinstance(profiles, ProfileMap): return profiles.names(like)
+        return sorted(n for n in profiles if like.casefold() in n.casefold())
+
+    def _profiles(self):
+        """設定のプロファイル一覧（無い・壊れていればストアにつながったものを作る）"""
+        profiles = self.cfg.get("profiles")
+        if not isinstance(profiles, (dict, ProfileMap)): profiles = self.cfg["profiles"] = AppConfig.profile_map()
+        return profiles
 
     def _refresh_profile_list(self, select: str|None=None):
-        self.cmb_profile.blockSignals(True); self.cmb_profile.clear()
-        names = sorted((self.cfg.get("profiles") or {}).keys()); self.cmb_profile.addItems(names)
+        self.cmb_profile.blockSignals(True)
+        names = self._profile_names(); self._profile_model.set_names(names)
+        profiles = self.cfg.get("profiles") or {}
+        self._profile_names_model.setStringList(list(profiles))
         candidate = select or self.cfg.get("last_profile")
-        if candidate and candidate in names: self.cmb_profile.setCurrentText(candidate)
+        if candidate and candidate in profiles: self.cmb_profile.setCurrentText(candidate)
         elif names: self.cmb_profile.setCurrentText(names[0])
         else: self.cmb_profile.setEditText("")
         self.cmb_profile.blockSignals(False)
 
+    def _on_profile_filter(self, _txt: str):
+        # 一覧だけ絞り込む（入力中のプロファイル名・読み込み済みの設定はそのまま）
+        self.cmb_profile.blockSignals(True)
+        cur = self.cmb_profile.currentText()
+        self._profile_model.set_names(self._profile_names())
+        self.cmb_profile.setEditText(cur)
+        self.cmb_profile.blockSignals(False)
+
     # ===== 値変更ハンドラ =====
     def _on_ui_changed(self, *_):
+        if self._loading: return   # プロファイル読み込み中の連鎖（保存・履歴追加）は最後にまとめて1回
         self._push_params()
         self._auto_save_current()
 
     # ===== 状態/テーマ =====
     def _on_engine_state(self, running: bool):
         self.lbl_status.setText("動作中" if running else "停止中")
-        self._apply_status_style(running)
         self._apply_theme(running)
 
-    def _apply_status_style(self, running: bool):
-        bg = (COLORS_RUN if running else COLORS_STOP)["STATUS_BG"]
-        self.lbl_status.setStyleSheet(f"QLabel{{background:{bg};color:#fff;padding:10px 12px;border-radius:8px;font-size:11pt;}}")
-
     def _apply_theme(self, running: bool):
-        theme = COLORS_RUN if running else COLORS_STOP
-        self.setStyleSheet(build_qss(self.isMaximized(), theme))
-        if hasattr(self, "shadow"): self.shadow.setEnabled(not self.isMaximized())
-
-    def _refresh_status_style(self):
-        self._apply_status_style(self.engine.is_running())
+        """状態が本当に変わったときだけ見た目を更新する。
+        最大化の切替: 作り置きのシートを当て直す（setStyleSheet は子ウィジェット全体を再適用するので重い）
+        開始/停止: 色の変わるウィジェットだけ running プロパティを変えて再適用"""
+        compact = self.isMaximized()
+        if compact != self._qss_compact:
+            self._qss_compact = compact
+            self.setStyleSheet(theme_qss(compact))
+            if hasattr(self, "shadow"): self.shadow.setEnabled(not compact)
+        if running != self._theme_running:
+            self._theme_running = running
+            for w in self.findChildren(QWidget):
+                if isinstance(w, QPushButton) or w.objectName() in _THEMED_NAMES or w.property("class") == "DarkPanel":
+                    w.setProperty("running", running)
+                    st = w.style(); st.unpolish(w); st.polish(w)
+
+    def _on_metrics(self, snap: dict):
+        """エンジンからの計測値（間引き済み）をステータスに表示"""
+        if not self.engine.is_running(): return
+        phase = snap.get("phase", 0)
+        label = f"段{phase + 1}" if phase < self._n_stages else "通常"
+        if snap.get("trigger_polls"):
+            txt = (f"監視中  発火 {snap.get('trigger_fires', 0)}回  "
+                   f"反応 p50 {snap.get('trigger_react_p50_us', 0) / 1000:.2f}ms / p99 {snap.get('trigger_react_p99_us', 0) / 1000:.2f}ms")
+        else:
+            txt = (f"動作中  {snap.get('rate_per_s', 0):.1f}回/秒（{label}）  "
+                   f"ジッタ p50 {snap.get('jitter_p50_ms', 0):.2f}ms / p99 {snap.get('jitter_p99_ms', 0):.2f}ms")
+        if snap.get("find_searches"):
+            txt += (f"  画像 {snap.get('find_hits', 0)}/{snap['find_searches']}件一致"
+                    f"（探索 p50 {snap.get('find_p50_us', 0) / 1000:.2f}ms）")
+        if self._jobs: txt += f"  ＋ジョブ{len(self._jobs)}件"
+        if snap.get("errors"): txt += f"  エラー {snap['errors']}件"
+        self.lbl_status.setText(txt)
 
     # ===== ウィンドウ制御 =====
     def _toggle_max_restore(self): self.showNormal() if self.isMaximized() else self.showMaximized()
@@ -620,44 +980,50 @@ class MainWindow(QWidget):
         if "B" in self._resize_edges: h = max(minh, h+dy)
         self.setGeometry(x,y,w,h)
 
-    def _open_readme(self): ReadmeDialog(self).exec()
+    def _open_readme(self):
+        from readme import ReadmeDialog   # めったに開かないので初回だけ読み込む
+        ReadmeDialog(self).exec()
 
     # ===== 設定 =====
     def _load_from_config(self):
         profiles = self.cfg.get("profiles")
-        if not isinstance(profiles, dict) or not profiles:
-            self.cfg["profiles"] = {
+        if not isinstance(profiles, (dict, ProfileMap)) or not profiles:
+            if not isinstance(profiles, (dict, ProfileMap)): profiles = self.cfg["profiles"] = AppConfig.profile_map()
+            profiles.update({
                 "デフォルト(左100ms)": {
                     "button":"left","delay_ms":100,
-                    "burst1_enabled": False, "burst1_sec":0, "burst1_ms":50,
-                    "burst2_enabled": False, "burst2_sec":0, "burst2_ms":20,
-                    "normal_sec":0,
+                    "stages": [], "normal_sec":0, "curve_end":"loop", "timing_policy":"skip",
                     "click_mode":"follow","click_params":{},
                     "key_to_repeat":None, "key_sequence":[],
-                    "recorded_points":[]
+                    "recorded_points":PointBuffer(), "jobs":[]
                 }
-            }
+            })
             self.cfg["last_profile"] = "デフォルト(左100ms)"
-            AppConfig.save(self.cfg)
-            profiles = self.cfg["profiles"]
+            self._writer.mark_dirty(self.cfg)
 
         self._refresh_profile_list(select=self.cfg.get("last_profile"))
         sel = self.cmb_profile.currentText().strip()
-        self._load_profile(profiles.get(sel, next(iter(profiles.values()))))
+        self._load_profile(profiles[sel] if sel in profiles else next(iter(profiles.values())))
 
         spec = self.cfg.get("hotkey", "Ctrl+Alt")
         self.ed_hotkey.setText(spec)
-        hk = HotkeySpec.from_string(spec)
-        if hk: self.engine.update_hotkey(hk)
+        hks = HotkeySpec.parse_many(spec)   # 'Ctrl+Alt, F9' のように複数も可
+        if hks: self.engine.set_hotkeys(hks)
         self.chk_start_min.setChecked(bool(self.cfg.get("start_minimized", False)))
         self._push_params()
 
     def _save_to_config(self):
-        self.cfg["hotkey"] = self.ed_hotkey.text().strip() or "Ctrl+Alt"
-        self.cfg["start_minimized"] = bool(self.chk_start_min.isChecked())
+        if self._traj_rec is not None:  # 記録中なら書き切って閉じる
+            self._traj_rec.stop(); self._traj_rec = None
         cur = (self.cmb_profile.currentText() or "").strip()
-        if cur: self.cfg["last_profile"] = cur
-        AppConfig.save(self.cfg)
+        changed = False
+        for k, v in (("hotkey", self.ed_hotkey.text().strip() or "Ctrl+Alt"),
+                     ("start_minimized", bool(self.chk_start_min.isChecked())),
+                     ("last_profile", cur or self.cfg.get("last_profile"))):
+            if self.cfg.get(k) != v:
+                self.cfg[k] = v; changed = True
+        if changed: self._writer.mark_dirty(self.cfg)
+        self._writer.close()  # 保留中の変更を同期的に書き切る（変更が無ければ書かない）
 
     def closeEvent(self, e):
         try:
@@ -0,0 +1,146 @@
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+# ===== ホットキー =====
+# キーは「正規化ID」（'CTRL' / 'ALT' / 'SHIFT' / 'F8' / 'A' / 'ENTER' …。左右の修飾は同一視）で扱う。
+# 押下状態は ID ごとに割り当てたビットの OR（int）で持ち、ホットキーの成立は (pressed & mask) == mask の1回で判定する。
+# フックの1イベントあたりの処理は「キー→ID」の辞書引きと、そのキーを含むホットキーだけの判定。
+
+_MODS = {"ctrl": "CTRL", "ctrl_l": "CTRL", "ctrl_r": "CTRL",
+         "alt": "ALT", "alt_l": "ALT", "alt_r": "ALT",
+         "shift": "SHIFT", "shift_l": "SHIFT", "shift_r": "SHIFT",
+         "cmd": "CMD", "cmd_l": "CMD", "cmd_r": "CMD"}
+
+def _is_main_key(s: str) -> bool:
+    return s.isalnum() and (len(s) == 1 or (s[0] == "F" and s[1:].isdigit()))
+
+@dataclass(frozen=True)
+class HotkeySpec:
+    ctrl: bool = True
+    alt: bool = True
+    shift: bool = False
+    key: Optional[str] = None  # 'A', 'F8', None=修飾のみ（keys の先頭）
+    keys: Tuple[str, ...] = ()  # 同時押しするキー全部（'A+S' のようなコード）
+
+    @staticmethod
+    def from_string(spec: str) -> Optional["HotkeySpec"]:
+        if not spec: return None
+        parts = [p.strip() for p in spec.replace("＋","+").split("+") if p.strip()]
+        ctrl = any(p.lower()=="ctrl" for p in parts)
+        alt  = any(p.lower()=="alt" for p in parts)
+        shift= any(p.lower()=="shift" for p in parts)
+        main = [p.upper() for p in parts if p.lower() not in ("ctrl","alt","shift")]
+        if any(not _is_main_key(k) for k in main):
+            return None
+        main = list(dict.fromkeys(main))
+        if not (ctrl or alt or shift or main): return None
+        return HotkeySpec(ctrl=ctrl, alt=alt, shift=shift, key=main[0] if main else None, keys=tuple(main))
+
+    @staticmethod
+    def parse_many(text: str) -> List["HotkeySpec"]:
+        """'Ctrl+Alt, F9' のようにカンマ区切りで複数（不正なものは除く）"""
+        out = []
+        for part in (text or "").replace("、", ",").split(","):
+            hk = HotkeySpec.from_string(part)
+            if hk and hk not in out: out.append(hk)
+        return out
+
+    def ids(self) -> FrozenSet[str]:
+        """成立に必要な正規化IDの集合"""
+        s = set(self.keys or ((self.key,) if self.key else ()))
+        if self.ctrl: s.add("CTRL")
+        if self.alt: s.add("ALT")
+        if self.shift: s.add("SHIFT")
+        return frozenset(s)
+
+def canonical(key) -> Optional[str]:
+    """pynput のキー → 正規化ID（対応しないキーは None）"""
+    name = getattr(key, "name", None)
+    if name:
+        return _MODS.get(name) or name.upper()
+    ch = getattr(key, "char", None)
+    if ch and ch.isprintable() and not ch.isspace():
+        return ch.upper()
+    # Ctrl 併用時などは char が制御文字になるので仮想キーコードから
+    vk = getattr(key, "vk", None)
+    if vk is not None:
+        if 0x30 <= vk <= 0x39 or 0x41 <= vk <= 0x5A: return chr(vk)
+        return f"VK{vk}"
+    return None
+
+
+class _Entry:
+    __slots__ = ("mask", "callback", "always", "active")
+    def __init__(self, mask: int, callback: Callable[[], None], always: bool):
+        self.mask = mask; self.callback = callback; self.always = always; self.active = False
+
+
+class HotkeyMatcher:
+    """複数ホットキーの同時監視。press()/release()/reset() は1つのスレッド（エンジンのディスパッチャ）からのみ呼ぶ。
+    登録の差し替え（set）は別スレッドからでもよい（索引を作ってから参照を入れ替える）"""
+
+    def __init__(self):
+        self._bits: Dict[str, int] = {}       # 正規化ID → ビット
+        self._cache: Dict[object, int] = {}   # pynput キー → ビット（0=未対応キー）
+        self._reg_lock = threading.Lock()
+        self._index: Dict[int, Tuple[_Entry, ...]] = {}   # ビット → そのキーを含むホットキー
+        self._pressed = 0
+
+    def _bit(self, cid: str) -> int:
+        b = self._bits.get(cid)
+        if b is None:
+            b = self._bits[cid] = 1 << len(self._bits)
+        return b
+
+    def set(self, entries: List[Tuple[FrozenSet[str], Callable[[], None], bool]]):
+        """[(IDの集合, コールバック, ミュート中も有効か)] で登録を丸ごと差し替える"""
+        with self._reg_lock:
+            index: Dict[int, List[_Entry]] = {}
+            for ids, cb, always in entries:
+                if not ids: continue
+                mask = 0
+                for cid in ids: mask |= self._bit(cid)
+                e = _Entry(mask, cb, always)
+                e.active = (self._pressed & mask) == mask   # 押しっぱなしのまま差し替えても誤発火しない
+                for cid in ids: index.setdefault(self._bits[cid], []).append(e)
+            self._index = {b: tuple(es) for b, es in index.items()}
+
+    def reset(self):
+        """押下状態を忘れる（ミュート切替時など）"""
+        self._pressed = 0
+        for es in self._index.values():
+            for e in es: e.active = False
+
+    def key_bit(self, key) -> int:
+        b = self._cache.get(key)
+        if b is None:
+            cid = canonical(key)
+            with self._reg_lock:
+                b = self._bit(cid) if cid else 0
+            try:
+                self._cache[key] = b
+            except TypeError:   # ハッシュ不能なキー（通常は無い）
+                pass
+        return b
+
+    def press(self, key, muted: bool = False):
+        b = self.key_bit(key)
+        if not b: return
+        cur = self._pressed | b
+        if not muted: self._pressed = cur
+        for e in self._index.get(b, ()):
+            if muted and not e.always: continue
+            now = (cur & e.mask) == e.mask
+            if now and not e.active:
+                e.active = True
+                e.callback()
+            else:
+                e.active = now
+
+    def release(self, key, muted: bool = False):
+        b = self.key_bit(key)
+        if not b: return
+        self._pressed &= ~b
+        for e in self._index.get(b, ()):
+            e.active = False
@@ -0,0 +1,253 @@
+import random
+from typing import List, Optional, Tuple
+from backends import InputBackend
+
+# ===== マクロ言語 =====
+# 1行1命令。# 以降はコメント（# キーは送れない）。命令名・キー名は大文字小文字を区別しない
+#   click [left|right|middle] [x y]   クリック（座標があれば移動してから）
+#   down / up [ボタン] [x y]          押しっぱなし / 離す
+#   move x y                          移動
+#   key K [K ...]                     キーを順に1回ずつ押す
+#   press K / release K               キーを押しっぱなし / 離す
+#   chord ctrl+shift+A                同時押し（順に押して逆順に離す）
+#   hold K ms                         K を ms だけ押し続ける
+#   wait ms | wait 1.5s | wait 80-120 待つ（範囲なら一様ランダム）
+#   loop [N] … end                    N回（省略で無限）繰り返す
+#   if 条件 … [else …] end            条件: chance P（P%）/ elapsed < 秒 / elapsed >= 秒 / every N（N周ごと）
+#   stop                              実行を停止
+# マクロの最後まで来たら、その段の間隔（通常間隔など）だけ待って先頭から繰り返す。
+# set_params のときに1回だけ解析し、キー・ボタンを解決済みの平坦な命令列 (op, a, b) にする。
+
+MOVE, CLICK, DOWN, UP, PRESS, RELEASE, TAP, WAIT, WAITR, SETC, LOOP, JUMP, IF, STOP = range(14)
+C_CHANCE, C_ELAPSED_LT, C_ELAPSED_GE, C_EVERY = range(4)
+
+END = -1.0     # step(): 最後まで実行した
+HALT = -2.0    # step(): stop 命令
+MAX_OPS_PER_STEP = 100000   # 待ちの無いループでも停止要求を見られるように、この命令数で一旦戻る
+
+KEY_NAMES = frozenset(("shift", "shift_r", "ctrl", "ctrl_r", "alt", "alt_r", "alt_gr", "cmd", "cmd_r",
+                       "enter", "esc", "tab", "space", "backspace", "delete", "insert", "home", "end",
+                       "page_up", "page_down", "up", "down", "left", "right", "caps_lock", "menu",
+                       "print_screen", "scroll_lock", "pause", "num_lock"))
+_BUTTONS = ("left", "right", "middle")
+
+
+class MacroError(ValueError):
+    """マクロの構文エラー（line は1始まり）"""
+    def __init__(self, line: int, msg: str):
+        super().__init__(f"{line}行目: {msg}")
+        self.line = line; self.msg = msg
+
+
+class MacroProgram:
+    """コンパイル済みマクロ（不変）。同じソースなら等しい（計画の差し替えで実行位置を失わないように）"""
+    __slots__ = ("source", "code", "slots")
+
+    def __init__(self, source: str, code: List[tuple], slots: int):
+        st = object.__setattr__
+        st(self, "source", source); st(self, "code", tuple(code)); st(self, "slots", slots)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MacroProgram is immutable")
+
+    def __eq__(self, other): return isinstance(other, MacroProgram) and self.source == other.source
+    def __hash__(self): return hash(self.source)
+    def __len__(self) -> int: return len(self.code)
+
+
+def _num(s: str, ln: int, what: str) -> float:
+    try:
+        v = float(s)
+    except ValueError:
+        raise MacroError(ln, f"{what}は数値で指定してください: {s}") from None
+    if v < 0: raise MacroError(ln, f"{what}は0以上で指定してください: {s}")
+    return v
+
+def _ms(s: str, ln: int) -> float:
+    """'100' → 0.1 / '1.5s' → 1.5（秒で返す）"""
+    low = s.lower()
+    if low.endswith("ms"): return _num(low[:-2], ln, "時間") / 1000.0
+    if low.endswith("s"):  return _num(low[:-1], ln, "時間")
+    return _num(low, ln, "時間") / 1000.0
+
+def _xy(args: List[str], ln: int) -> Tuple[int, int]:
+    if len(args) != 2: raise MacroError(ln, "座標は x y の2つで指定してください")
+    try:
+        return int(args[0]), int(args[1])
+    except ValueError:
+        raise MacroError(ln, f"座標は整数で指定してください: {' '.join(args)}") from None
+
+def _key(io: InputBackend, s: str, ln: int):
+    low = s.lower()
+    ok = len(s) == 1 and s.isprintable() and not s.isspace()
+    ok = ok or low in KEY_NAMES or (low[:1] == "f" and low[1:].isdigit() and 1 <= int(low[1:]) <= 24)
+    k = io.resolve_key(s) if ok else None
+    if k is None: raise MacroError(ln, f"不明なキー: {s}")
+    return k
+
+def compile_macro(source: str, io: Optional[InputBackend] = None) -> MacroProgram:
+    """ソース → MacroProgram。io を省略すると構文チェックのみ（キーは文字列のまま）"""
+    io = io or InputBackend()
+    buttons = {b: io.resolve_button(b) for b in _BUTTONS}
+    code: List[tuple] = []
+    stack: List[tuple] = []   # ("loop", 行, 先頭pc, slot) / ("if"|"else", 行, 書き換えるpc)
+    slots = 0
+
+    def button_and_xy(args, ln):
+        btn = buttons["left"]
+        if args and args[0].lower() in buttons:
+            btn = buttons[args[0].lower()]; args = args[1:]
+        if args:
+            code.append((MOVE, *_xy(args, ln)))
+        return btn
+
+    for ln, raw in enumerate((source or "").splitlines(), 1):
+        line = raw.split("#", 1)[0].strip()
+        if not line: continue
+        t = line.split(); cmd = t[0].lower(); args = t[1:]
+        if cmd == "click":
+            code.append((CLICK, button_and_xy(args, ln), 0))
+        elif cmd in ("down", "up"):
+            code.append((DOWN if cmd == "down" else UP, button_and_xy(args, ln), 0))
+        elif cmd == "move":
+            code.append((MOVE, *_xy(args, ln)))
+        elif cmd == "key":
+            if not args: raise MacroError(ln, "key の後にキーを指定してください")
+            code.extend((TAP, _key(io, a, ln), 0) for a in args)
+        elif cmd in ("press", "release"):
+            if len(args) != 1: raise MacroError(ln, f"{cmd} にはキーを1つ指定してください")
+            code.append((PRESS if cmd == "press" else RELEASE, _key(io, args[0], ln), 0))
+        elif cmd == "chord":
+            if len(args) != 1: raise MacroError(ln, "chord は ctrl+shift+A のように + でつないで指定してください")
+            keys = [_key(io, a, ln) for a in args[0].split("+") if a]
+            if not keys: raise MacroError(ln, "chord にキーがありません")
+            code.extend((PRESS, k, 0) for k in keys)
+            code.extend((RELEASE, k, 0) for k in reversed(keys))
+        elif cmd == "hold":
+            if len(args) != 2: raise MacroError(ln, "hold はキーと時間(ms)を指定してください")
+            k = _key(io, args[0], ln)
+            code += [(PRESS, k, 0), (WAIT, _ms(args[1], ln), 0), (RELEASE, k, 0)]
+        elif cmd == "wait":
+            if len(args) != 1: raise MacroError(ln, "wait には時間を1つ指定してください（例: wait 100 / wait 80-120）")
+            lo, sep, hi = args[0].partition("-")
+            if sep:
+                a, b = _ms(lo, ln), _ms(hi, ln)
+                code.append((WAITR, min(a, b), abs(b - a)))
+            else:
+                code.append((WAIT, _ms(lo, ln), 0))
+        elif cmd == "loop":
+            if len(args) > 1: raise MacroError(ln, "loop の回数は1つだけ指定してください")
+            if args:
+                n = int(_num(args[0], ln, "回数"))
+                if n < 1: raise MacroError(ln, "loop の回数は1以上で指定してください")
+                slot = slots; slots += 1
+                code.append((SETC, slot, n))
+            else:
+                slot = -1
+            stack.append(("loop", ln, len(code), slot))
+        elif cmd == "if":
+            cond = _cond(args, ln)
+            stack.append(("if", ln, len(code)))
+            code.append((IF, cond, -1))
+        elif cmd == "else":
+            if not stack or stack[-1][0] != "if": raise MacroError(ln, "対応する if の無い else です")
+            _, _, at = stack.pop()
+            stack.append(("else", ln, len(code)))
+            code.append((JUMP, -1, 0))
+            code[at] = (IF, code[at][1], len(code))
+        elif cmd == "end":
+            if not stack: raise MacroError(ln, "対応する loop / if の無い end です")
+            blk = stack.pop()
+            if blk[0] == "loop":
+                _, _, start, slot = blk
+                code.append((LOOP, slot, start) if slot >= 0 else (JUMP, start, 0))
+            elif blk[0] == "if":
+                code[blk[2]] = (IF, code[blk[2]][1], len(code))
+            else:
+                code[blk[2]] = (JUMP, len(code), 0)
+        elif cmd == "stop":
+            code.append((STOP, 0, 0))
+        else:
+            raise MacroError(ln, f"不明な命令: {t[0]}")
+    if stack:
+        raise MacroError(stack[-1][1], f"{stack[-1][0] if stack[-1][0] != 'else' else 'if'} に対応する end がありません")
+    return MacroProgram(source or "", code, slots)
+
+def _cond(args: List[str], ln: int) -> tuple:
+    a = [x.lower() for x in args]
+    if len(a) == 2 and a[0] == "chance":
+        return (C_CHANCE, _num(a[1].rstrip("%"), ln, "確率"))
+    if len(a) == 2 and a[0] == "every":
+        n = int(_num(a[1], ln, "周期"))
+        if n < 1: raise MacroError(ln, "every は1以上で指定してください")
+        return (C_EVERY, n)
+    if len(a) == 3 and a[0] == "elapsed" and a[1] in ("<", ">="):
+        return (C_ELAPSED_LT if a[1] == "<" else C_ELAPSED_GE, _num(a[2].rstrip("s"), ln, "秒"))
+    raise MacroError(ln, "条件は chance P / every N / elapsed < 秒 / elapsed >= 秒 のいずれかです")
+
+def check_macro(source: str) -> Optional[MacroError]:
+    """GUI用の検証。問題なければ None"""
+    try:
+        compile_macro(source)
+    except MacroError as ex:
+        return ex
+    return None
+
+
+class MacroVM:
+    """ワーカー専有の実行状態（命令位置・ループカウンタ・周回数・押したままのキー/ボタン）。
+    step() は次の待ちまで命令を実行し、待ち秒数を返す（待ちはスケジューラのデッドラインで行う）。
+    hold の途中や press/down のまま止まったときは、エンジンが release_all() で離す"""
+    __slots__ = ("code", "pc", "regs", "passes", "_rnd", "keys_down", "buttons_down")
+
+    def __init__(self, prog: MacroProgram):
+        self.code = prog.code; self.pc = 0
+        self.regs = [0] * prog.slots; self.passes = 0
+        self._rnd = random.random
+        self.keys_down: dict = {}; self.buttons_down: dict = {}   # 押した順（離すときは逆順）
+
+    def release_all(self, io: InputBackend) -> int:
+        """押したままのキー・ボタンを全部離す（離した数）"""
+        n = len(self.keys_down) + len(self.buttons_down)
+        if not n: return 0
+        for k in reversed(list(self.keys_down)): io.release(k)
+        for b in reversed(list(self.buttons_down)): io.mouse_up(b)
+        self.keys_down.clear(); self.buttons_down.clear()
+        io.submit()
+        return n
+
+    def step(self, io: InputBackend, elapsed: float) -> float:
+        code = self.code; n = len(code); pc = self.pc; regs = self.regs
+        budget = MAX_OPS_PER_STEP
+        while pc < n:
+            op, a, b = code[pc]; pc += 1
+            if op == WAIT:
+                self.pc = pc; return a
+            if op == CLICK: io.click(a)
+            elif op == TAP: io.tap(a)
+            elif op == MOVE: io.move(a, b)
+            elif op == PRESS: io.press(a); self.keys_down[a] = None
+            elif op == RELEASE: io.release(a); self.keys_down.pop(a, None)
+            elif op == DOWN: io.mouse_down(a); self.buttons_down[a] = None
+            elif op == UP: io.mouse_up(a); self.buttons_down.pop(a, None)
+            elif op == LOOP:
+                regs[a] -= 1
+                if regs[a] > 0: pc = b
+            elif op == SETC: regs[a] = b
+            elif op == JUMP: pc = a
+            elif op == IF:
+                c, arg = a
+                if c == C_CHANCE: ok = self._rnd() * 100.0 < arg
+                elif c == C_ELAPSED_LT: ok = elapsed < arg
+                elif c == C_ELAPSED_GE: ok = elapsed >= arg
+                else: ok = self.passes % arg == 0
+                if not ok: pc = b
+            elif op == WAITR:
+                self.pc = pc; return a + self._rnd() * b
+            elif op == STOP:
+                self.pc = pc; return HALT
+            budget -= 1
+            if budget <= 0:
+                self.pc = pc; return 0.0
+        self.pc = 0; self.passes += 1
+        return END
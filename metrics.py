@@ -0,0 +1,168 @@
+import time
+from array import array
+from typing import Dict, Any
+
+# 遅れ(ms)ヒストグラムのバケット上限。最後のバケットは上限なし
+LATE_BUCKETS_MS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0)
+RING_SIZE = 512       # 直近の実間隔を保持する件数（レート・ジッタ算出用）
+HOOK_RING = 1024      # キーボードフックの所要時間・遅延を保持する件数
+TRIGGER_RING = 1024   # トリガーの取り込み時間・反応遅延を保持する件数
+FIND_RING = 1024      # テンプレート探索の所要時間を保持する件数
+
+def _pct(sorted_vals, q: float) -> float:
+    if not sorted_vals: return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * (len(sorted_vals) - 1) + 0.5))]
+
+class EngineMetrics:
+    """ワーカースレッドだけが書き込むカウンタ群。ロックは取らない。
+    読み手（GUIなど）は snapshot() で値をまとめて取り出す（多少ずれても表示用なので許容）"""
+    __slots__ = ("actions", "errors", "missed", "phase", "target_s", "last_late_s",
+                 "late_hist", "_ivals", "_targets", "_ri", "_rn", "_last_t", "started")
+
+    def __init__(self):
+        self._ivals = array("d", bytes(8 * RING_SIZE))
+        self._targets = array("d", bytes(8 * RING_SIZE))
+        self.late_hist = [0] * (len(LATE_BUCKETS_MS) + 1)
+        self.reset()
+
+    def reset(self):
+        self.actions = 0; self.errors = 0; self.missed = 0
+        self.phase = 0; self.target_s = 0.0; self.last_late_s = 0.0
+        self._ri = 0; self._rn = 0; self._last_t = 0.0
+        self.started = time.perf_counter()
+        for i in range(len(self.late_hist)): self.late_hist[i] = 0
+
+    def record(self, t: float, target_s: float, late_s: float, phase: int):
+        """1アクション発火ごとに呼ぶ（t=発火時刻, target_s=この段の目標間隔）"""
+        if self._last_t:
+            i = self._ri
+            self._ivals[i] = t - self._last_t; self._targets[i] = self.target_s or target_s
+            self._ri = (i + 1) % RING_SIZE
+            if self._rn < RING_SIZE: self._rn += 1
+        self._last_t = t
+        self.actions += 1; self.phase = phase; self.target_s = target_s; self.last_late_s = late_s
+        ms = late_s * 1000.0; b = 0
+        for lim in LATE_BUCKETS_MS:
+            if ms <= lim: break
+            b += 1
+        self.late_hist[b] += 1
+
+    def error(self): self.errors += 1
+    def count(self): self.actions += 1   # 間隔の概念がない発火（軌跡再生など）
+
+    def snapshot(self) -> Dict[str, Any]:
+        n = self._rn
+        ivals = self._ivals[:n] if n < RING_SIZE else array("d", self._ivals)
+        tgts = self._targets[:n] if n < RING_SIZE else array("d", self._targets)
+        span = sum(ivals)
+        jit = sorted(abs(a - b) * 1000.0 for a, b in zip(ivals, tgts))
+        return {
+            "actions": self.actions, "errors": self.errors, "missed": self.missed,
+            "phase": self.phase,
+            "rate_per_s": (n / span) if span > 0 else 0.0,
+            "target_ms": self.target_s * 1000.0,
+            "actual_ms": (span / n * 1000.0) if n else 0.0,
+            "late_ms": self.last_late_s * 1000.0,
+            "jitter_p50_ms": _pct(jit, .5), "jitter_p99_ms": _pct(jit, .99),
+            "jitter_max_ms": jit[-1] if jit else 0.0,
+            "late_hist": list(self.late_hist), "late_buckets_ms": LATE_BUCKETS_MS,
+            "uptime_s": time.perf_counter() - self.started,
+        }
+
+
+class HookMetrics:
+    """キーボードフックの計測（ns）。cb = OSフックのコールバック所要時間、lag = 積んでからディスパッチャが処理し終えるまで。
+    record() はフックのスレッド、lag() はディスパッチャのスレッドだけが書く（ロックなし）"""
+    __slots__ = ("events", "cb_max_ns", "lag_max_ns", "_cb", "_lag", "_li")
+
+    def __init__(self):
+        self._cb = array("q", bytes(8 * HOOK_RING))
+        self._lag = array("q", bytes(8 * HOOK_RING))
+        self.events = 0; self._li = 0
+        self.cb_max_ns = 0; self.lag_max_ns = 0
+
+    def record(self, ns: int):
+        self._cb[self.events % HOOK_RING] = ns
+        self.events += 1
+        if ns > self.cb_max_ns: self.cb_max_ns = ns
+
+    def lag(self, ns: int):
+        self._lag[self._li % HOOK_RING] = ns
+        self._li += 1
+        if ns > self.lag_max_ns: self.lag_max_ns = ns
+
+    def snapshot(self) -> Dict[str, Any]:
+        cb = sorted(self._cb[:min(self.events, HOOK_RING)])
+        lag = sorted(self._lag[:min(self._li, HOOK_RING)])
+        return {
+            "hook_events": self.events,
+            "hook_cb_p50_us": _pct(cb, .5) / 1000.0, "hook_cb_p99_us": _pct(cb, .99) / 1000.0,
+            "hook_cb_max_us": self.cb_max_ns / 1000.0,
+            "hook_lag_p50_us": _pct(lag, .5) / 1000.0, "hook_lag_p99_us": _pct(lag, .99) / 1000.0,
+            "hook_lag_max_us": self.lag_max_ns / 1000.0,
+        }
+
+
+class TriggerMetrics:
+    """画面トリガーの計測（ns）。poll = 取り込み＋判定の所要時間、react = 発火した取り込みの開始から操作を送り終えるまで
+    （実際の画面変化からの遅延は、これに最大で監視間隔1回分が加わる）。ワーカーだけが書く"""
+    __slots__ = ("polls", "fires", "poll_max_ns", "react_max_ns", "_poll", "_react")
+
+    def __init__(self):
+        self._poll = array("q", bytes(8 * TRIGGER_RING))
+        self._react = array("q", bytes(8 * TRIGGER_RING))
+        self.polls = 0; self.fires = 0
+        self.poll_max_ns = 0; self.react_max_ns = 0
+
+    def reset(self): self.__init__()
+
+    def poll(self, ns: int):
+        self._poll[self.polls % TRIGGER_RING] = ns
+        self.polls += 1
+        if ns > self.poll_max_ns: self.poll_max_ns = ns
+
+    def react(self, ns: int):
+        self._react[self.fires % TRIGGER_RING] = ns
+        self.fires += 1
+        if ns > self.react_max_ns: self.react_max_ns = ns
+
+    def snapshot(self) -> Dict[str, Any]:
+        if not self.polls: return {}
+        poll = sorted(self._poll[:min(self.polls, TRIGGER_RING)])
+        react = sorted(self._react[:min(self.fires, TRIGGER_RING)])
+        return {
+            "trigger_polls": self.polls, "trigger_fires": self.fires,
+            "trigger_poll_p50_us": _pct(poll, .5) / 1000.0, "trigger_poll_p99_us": _pct(poll, .99) / 1000.0,
+            "trigger_react_p50_us": _pct(react, .5) / 1000.0, "trigger_react_p99_us": _pct(react, .99) / 1000.0,
+            "trigger_react_max_us": self.react_max_ns / 1000.0,
+        }
+
+
+class FinderMetrics:
+    """テンプレート探索の計測（ns）。find = 取り込み＋照合の所要時間（見つからなかった回も含む）。
+    local は前回位置のまわりだけで見つかった回数（多いほど速い経路で済んでいる）。ワーカーだけが書く"""
+    __slots__ = ("searches", "hits", "local", "find_max_ns", "score", "_find")
+
+    def __init__(self):
+        self._find = array("q", bytes(8 * FIND_RING))
+        self.searches = 0; self.hits = 0; self.local = 0
+        self.find_max_ns = 0; self.score = 0.0
+
+    def reset(self): self.__init__()
+
+    def find(self, ns: int, hit: bool, local: bool, score: float):
+        self._find[self.searches % FIND_RING] = ns
+        self.searches += 1; self.score = score
+        if hit: self.hits += 1
+        if local: self.local += 1
+        if ns > self.find_max_ns: self.find_max_ns = ns
+
+    def snapshot(self) -> Dict[str, Any]:
+        if not self.searches: return {}
+        f = sorted(self._find[:min(self.searches, FIND_RING)])
+        return {
+            "find_searches": self.searches, "find_hits": self.hits, "find_local": self.local,
+            "find_score": round(self.score, 3),
+            "find_p50_us": _pct(f, .5) / 1000.0, "find_p99_us": _pct(f, .99) / 1000.0,
+            "find_max_us": self.find_max_ns / 1000.0,
+        }
@@ -0,0 +1,408 @@
+import math, mmap, os, struct, sys, time, weakref, zlib
+from array import array
+from typing import Dict, List, Optional
+try:
+    import numpy as np   # あれば最適化を高速化（無くても動く）
+except ImportError:
+    np = None
+
+class PointBuffer:
+    """(x, y) の列を int32 で詰めて持つ不変バッファ（1点8バイト）。
+    中身は array('i') か、サイドカーファイルを mmap したビュー。変更系は新しいバッファを返す"""
+    __slots__ = ("_xy", "_key", "__weakref__")
+
+    def __init__(self, data=None):
+        if data is None:
+            self._xy = array("i")
+        elif isinstance(data, (array, memoryview)):
+            self._xy = data            # 所有権ごと受け取る（呼び出し側は以後触らない）
+        else:
+            xy = array("i")
+            for x, y in data: xy.append(int(x)); xy.append(int(y))
+            self._xy = xy
+        self._key: Optional[str] = None
+
+    @staticmethod
+    def coerce(v) -> "PointBuffer":
+        """PointBuffer / [(x,y), ...] / None を PointBuffer に"""
+        if isinstance(v, PointBuffer): return v
+        return PointBuffer(v or None)
+
+    def __len__(self) -> int: return len(self._xy) >> 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1: return PointBuffer([self[j] for j in range(start, stop, step)])
+            xy = array("i"); xy.frombytes(self._bytes()[8 * start:8 * max(start, stop)])
+            return PointBuffer(xy)
+        xy = self._xy
+        if i < 0: i += len(xy) >> 1
+        return (xy[2 * i], xy[2 * i + 1])
+
+    def __iter__(self):
+        xy = self._xy; it = iter(xy)
+        return zip(it, it)
+
+    def __eq__(self, other) -> bool:
+        if self is other: return True
+        if isinstance(other, PointBuffer):
+            return len(self._xy) == len(other._xy) and self._bytes() == other._bytes()
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(a == tuple(b) for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str: return f"PointBuffer({len(self)} points)"
+
+    def _bytes(self) -> memoryview:
+        return memoryview(self._xy).cast("B")
+
+    def tobytes(self) -> bytes: return bytes(self._bytes())
+
+    def to_list(self) -> list: return list(self)
+
+    def _copy(self) -> array:
+        xy = array("i"); xy.frombytes(self._bytes()); return xy
+
+    def appended(self, x: int, y: int) -> "PointBuffer":
+        xy = self._copy()
+        xy.append(int(x)); xy.append(int(y))
+        return PointBuffer(xy)
+
+    def extended(self, pts) -> "PointBuffer":
+        """複数点をまとめて追加（コピーは1回）"""
+        xy = self._copy()
+        for x, y in pts: xy.append(int(x)); xy.append(int(y))
+        return PointBuffer(xy)
+
+    # --- 最適化（新しいバッファを返す） ---
+    def merged(self, tol: float) -> "PointBuffer": return merge_close(self, tol)
+    def reordered(self, two_opt: bool = True, budget_s: float = 0.3) -> "PointBuffer": return reorder_route(self, two_opt, budget_s)
+    def simplified(self, eps: float) -> "PointBuffer": return simplify_rdp(self, eps)
+    def optimized(self, merge_tol: float = 0, reorder: bool = False, rdp_eps: float = 0) -> "PointBuffer":
+        """近接点の統合 → 巡回順の最適化 → 軌跡の間引き（0/False の工程は飛ばす）"""
+        pb = self
+        if merge_tol > 0: pb = pb.merged(merge_tol)
+        if reorder: pb = pb.reordered()
+        if rdp_eps > 0: pb = pb.simplified(rdp_eps)
+        return pb
+
+    @property
+    def key(self) -> str:
+        """内容から決まるID（サイドカー内の重複排除・参照に使う）"""
+        if self._key is None:
+            self._key = f"{len(self)}-{zlib.crc32(self._bytes()):08x}"
+        return self._key
+
+    @property
+    def mapped(self) -> bool: return isinstance(self._xy, memoryview)
+
+    def _detach(self):
+        """mmap ビューをメモリ上の配列に写し替える（サイドカーを書き換える前に呼ぶ）"""
+        if isinstance(self._xy, memoryview):
+            self._xy = self._copy()
+
+
+# ===== 記録点の最適化 =====
+def _xy_lists(pb: PointBuffer):
+    xy = pb._xy
+    return list(xy[0::2]), list(xy[1::2])
+
+def _from_xy(xs, ys, order=None) -> PointBuffer:
+    out = array("i", bytes(8 * (len(order) if order is not None else len(xs))))
+    if order is None:
+        out[0::2] = array("i", xs); out[1::2] = array("i", ys)
+    else:
+        out[0::2] = array("i", [xs[i] for i in order]); out[1::2] = array("i", [ys[i] for i in order])
+    return PointBuffer(out)
+
+def merge_close(pb: PointBuffer, tol: float) -> PointBuffer:
+    """距離 tol 以内の点を1つにまとめる（最初に現れた点を残す）。格子ハッシュで O(n)"""
+    n = len(pb)
+    if n < 2 or tol <= 0: return pb
+    xs, ys = _xy_lists(pb)
+    cs = float(tol); t2 = tol * tol
+    K = 1 << 24; OFF = 1 << 22   # セル (cx, cy) → 整数キー（タプルを作らない）
+    keys = [(int(x // cs) + OFF) * K + int(y // cs) + OFF for x, y in zip(xs, ys)]
+    offs = [dx * K + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+    grid: Dict[int, List[int]] = {}; get = grid.get
+    keep: List[int] = []
+    for i in range(n):
+        x = xs[i]; y = ys[i]; key = keys[i]
+        for o in offs:
+            cell = get(key + o)
+            if cell:
+                for j in cell:
+                    dx = xs[j] - x; dy = ys[j] - y
+                    if dx * dx + dy * dy <= t2: break
+                else:
+                    continue
+                break   # 近い点あり → 捨てる
+        else:
+            keep.append(i)
+            cell = get(key)
+            if cell is None: grid[key] = [i]
+            else: cell.append(i)
+    if len(keep) == n: return pb
+    return _from_xy(xs, ys, keep)
+
+NN_EXACT_MAX = 20000   # これを超える点数では最近傍法の代わりにヒルベルト曲線順を初期解にする
+
+def reorder_route(pb: PointBuffer, two_opt: bool = True, budget_s: float = 0.3) -> PointBuffer:
+    """移動距離が短くなるよう訪問順を並べ替える（最近傍法 → 2-opt）。始点は元の先頭点。
+    NN_EXACT_MAX 点を超える場合は初期解をヒルベルト曲線順にする（最近傍法は O(n√n) で遅いため）。
+    2-opt は近傍窓に限定し、budget_s 秒で打ち切る（大規模でも時間が読める）"""
+    n = len(pb)
+    if n < 3: return pb
+    xs, ys = _xy_lists(pb)
+    if n <= NN_EXACT_MAX:
+        order = _nearest_neighbour(xs, ys)
+    else:
+        order = _hilbert_order(xs, ys)
+        k = order.index(0); order = order[k:] + order[:k]   # 先頭点から始める
+    if two_opt and n >= 4:
+        _two_opt(xs, ys, order, time.perf_counter() + max(0.0, budget_s))
+    return _from_xy(xs, ys, order)
+
+def _nearest_neighbour(xs, ys) -> List[int]:
+    """格子で近傍を絞った最近傍法（点0から開始）"""
+    n = len(xs)
+    minx, maxx, miny, maxy = min(xs), max(xs), min(ys), max(ys)
+    cs = max(1.0, math.sqrt(max(1, (maxx - minx + 1) * (maxy - miny + 1)) / n) * 1.5)   # 1セル2点程度
+    gw = int((maxx - minx) // cs) + 1; gh = int((maxy - miny) // cs) + 1
+    cxs = [int((x - minx) // cs) for x in xs]; cys = [int((y - miny) // cs) for y in ys]
+    cells: List[List[int]] = [[] for _ in range(gw * gh)]
+    for i in range(n): cells[cxs[i] * gh + cys[i]].append(i)
+    cells[cxs[0] * gh + cys[0]].remove(0)
+    order = [0]; cur = 0; rmax = gw + gh
+    for _ in range(n - 1):
+        x = xs[cur]; y = ys[cur]; cx = cxs[cur]; cy = cys[cur]
+        best = -1; bd = float("inf"); r = 0
+        while True:
+            # 中心セルから距離 r のリング上のセルだけを見る
+            x0 = max(0, cx - r); x1 = min(gw - 1, cx + r)
+            y0 = max(0, cy - r); y1 = min(gh - 1, cy + r)
+            for gx in range(x0, x1 + 1):
+                base = gx * gh
+                if gx == cx - r or gx == cx + r:
+                    idxs = range(base + y0, base + y1 + 1)
+                else:
+                    idxs = [base + gy for gy in (cy - r, cy + r) if 0 <= gy < gh]
+                for ci in idxs:
+                    for j in cells[ci]:
+                        dx = xs[j] - x; dy = ys[j] - y; d = dx * dx + dy * dy
+                        if d < bd: bd = d; best = j
+            # 次のリングはどれも r*cs 以上離れている → 今の最良で確定
+            if best >= 0 and (r * cs) ** 2 >= bd: break
+            r += 1
+            if r > rmax: break
+        cells[cxs[best] * gh + cys[best]].remove(best); order.append(best); cur = best
+    return order
+
+def _hilbert_order(xs, ys) -> List[int]:
+    """ヒルベルト曲線上の位置で並べた添字列（近い点が近い順番になる）"""
+    if np is not None:
+        x = np.asarray(xs, dtype=np.int64); y = np.asarray(ys, dtype=np.int64)
+        x = x - x.min(); y = y - y.min()
+        s = 1 << max(0, int(max(x.max(), y.max(), 1)).bit_length() - 1)
+        d = np.zeros(len(x), dtype=np.int64)
+        while s > 0:
+            rx = (x & s) > 0; ry = (y & s) > 0
+            d += s * s * ((3 * rx) ^ ry)
+            flip = ~ry & rx
+            x = np.where(flip, s - 1 - x, x); y = np.where(flip, s - 1 - y, y)
+            x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+            s >>= 1
+        return np.argsort(d, kind="stable").tolist()
+    minx = min(xs); miny = min(ys)
+    top = 1 << max(0, max(max(xs) - minx, max(ys) - miny, 1).bit_length() - 1)
+    def hkey(x, y):
+        d = 0; s = top
+        while s > 0:
+            rx = 1 if x & s else 0; ry = 1 if y & s else 0
+            d += s * s * ((3 * rx) ^ ry)
+            if not ry:
+                if rx: x = s - 1 - x; y = s - 1 - y
+                x, y = y, x
+            s >>= 1
+        return d
+    keys = [hkey(x - minx, y - miny) for x, y in zip(xs, ys)]
+    return sorted(range(len(xs)), key=keys.__getitem__)
+
+def _two_opt(xs, ys, order: List[int], deadline: float, window: int = 8) -> None:
+    """近傍窓つき 2-opt（その場で order を書き換える）"""
+    n = len(order)
+    def d(a, b):
+        dx = xs[a] - xs[b]; dy = ys[a] - ys[b]
+        return math.sqrt(dx * dx + dy * dy)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 2):
+            if (i & 255) == 0 and time.perf_counter() > deadline: return
+            a = order[i]; b = order[i + 1]; dab = d(a, b)
+            for j in range(i + 2, min(n - 1, i + window)):
+                c = order[j]; e = order[j + 1]
+                if d(a, c) + d(b, e) < dab + d(c, e) - 1e-9:
+                    order[i + 1:j + 1] = order[i + 1:j + 1][::-1]
+                    improved = True
+                    b = order[i + 1]; dab = d(a, b)
+
+def simplify_rdp(pb: PointBuffer, eps: float) -> PointBuffer:
+    """Ramer–Douglas–Peucker で軌跡を間引く（線分から eps 以内の中間点を落とす）。端点は残す"""
+    n = len(pb)
+    if n < 3 or eps <= 0: return pb
+    if np is not None: return _simplify_rdp_np(pb, eps)
+    xs, ys = _xy_lists(pb)
+    keep = bytearray(n); keep[0] = keep[n - 1] = 1
+    stack = [(0, n - 1)]
+    e2 = eps * eps
+    while stack:
+        s, e = stack.pop()
+        if e - s < 2: continue
+        x0 = xs[s]; y0 = ys[s]; dx = xs[e] - x0; dy = ys[e] - y0
+        L2 = dx * dx + dy * dy
+        if L2 == 0:   # 始点=終点: 点との距離
+            ds = [(xs[k] - x0) ** 2 + (ys[k] - y0) ** 2 for k in range(s + 1, e)]
+            lim = e2
+        else:         # 直線との距離²×L2（割り算を1回にまとめる）
+            ds = [abs(dy * (xs[k] - x0) - dx * (ys[k] - y0)) for k in range(s + 1, e)]
+            lim = eps * math.sqrt(L2)
+        m = max(ds)
+        if m > lim:
+            k = s + 1 + ds.index(m)
+            keep[k] = 1
+            stack.append((s, k)); stack.append((k, e))
+    order = [i for i in range(n) if keep[i]]
+    if len(order) == n: return pb
+    return _from_xy(xs, ys, order)
+
+
+def _simplify_rdp_np(pb: PointBuffer, eps: float) -> PointBuffer:
+    a = np.frombuffer(pb._bytes(), dtype=np.int32).reshape(-1, 2).astype(np.float64)
+    n = len(a)
+    keep = np.zeros(n, dtype=bool); keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        s, e = stack.pop()
+        if e - s < 2: continue
+        p0 = a[s]; seg = a[e] - p0; mid = a[s + 1:e] - p0
+        L = math.hypot(seg[0], seg[1])
+        if L == 0:
+            ds = np.hypot(mid[:, 0], mid[:, 1]); lim = eps
+        else:
+            ds = np.abs(seg[1] * mid[:, 0] - seg[0] * mid[:, 1]); lim = eps * L
+        k = int(ds.argmax())
+        if ds[k] > lim:
+            k += s + 1; keep[k] = True
+            stack.append((s, k)); stack.append((k, e))
+    if keep.all(): return pb
+    out = array("i"); out.frombytes(np.ascontiguousarray(a[keep].astype(np.int32)).tobytes())
+    return PointBuffer(out)
+
+
+# ===== サイドカーファイル（記録点のバイナリ保存） =====
+# [b"ACPT"][u32 version][u32 count] + count×([u16 keylen][key][u64 offset][u32 npoints]) + データ(int32 LE, 8バイト境界)
+_MAGIC = b"ACPT"; _VERSION = 1
+MMAP_MIN_BYTES = 1 << 20   # これ以上のファイルは読み込まずに mmap する
+
+class PointSidecar:
+    """記録点サイドカーの読み書き。読み込んだ大きなファイルは mmap のまま PointBuffer に渡す"""
+    def __init__(self, path: str):
+        self.path = path
+        self._mm: Optional[mmap.mmap] = None
+        self._file = None
+        self._views: list = []      # mmap ビューを持つ PointBuffer（弱参照）
+        self.keys: frozenset = frozenset()
+
+    def load(self) -> Dict[str, PointBuffer]:
+        pending = self.path + ".new"
+        if os.path.exists(pending):   # 前回は置き換えられずに別名へ書いた（Windows で mmap が掴まれていた）
+            try: os.replace(pending, self.path)
+            except OSError: pass
+        if not os.path.exists(self.path): return {}
+        f = open(self.path, "rb")
+        size = os.fstat(f.fileno()).st_size
+        if size < 12:
+            f.close(); return {}
+        use_mmap = size >= MMAP_MIN_BYTES and sys.byteorder == "little"
+        if use_mmap:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            buf = memoryview(mm)
+        else:
+            buf = memoryview(f.read()); f.close(); mm = None
+        if bytes(buf[:4]) != _MAGIC:
+            buf.release()
+            if mm is not None: mm.close(); f.close()
+            return {}
+        _ver, count = struct.unpack_from("<II", buf, 4)
+        pos = 12; out: Dict[str, PointBuffer] = {}
+        for _ in range(count):
+            (klen,) = struct.unpack_from("<H", buf, pos); pos += 2
+            key = bytes(buf[pos:pos + klen]).decode("utf-8"); pos += klen
+            off, n = struct.unpack_from("<QI", buf, pos); pos += 12
+            raw = buf[off:off + 8 * n]
+            if use_mmap:
+                pb = PointBuffer(raw.cast("i")); self._views.append(weakref.ref(pb))
+            else:
+                xy = array("i"); xy.frombytes(raw)
+                if sys.byteorder != "little": xy.byteswap()
+                pb = PointBuffer(xy)
+            pb._key = key
+            out[key] = pb
+        if use_mmap:
+            self._mm, self._file = mm, f
+        self.keys = frozenset(out)
+        return out
+
+    def save(self, buffers: Dict[str, PointBuffer]) -> None:
+        """buffers の内容で丸ごと書き直す（一時ファイル→rename）。キー集合が前回と同じなら何もしない"""
+        if frozenset(buffers) == self.keys and os.path.exists(self.path): return
+        items = sorted(buffers.items())
+        head = bytearray(_MAGIC + struct.pack("<II", _VERSION, len(items)))
+        table_len = sum(2 + len(k.encode("utf-8")) + 12 for k, _ in items)
+        off = (len(head) + table_len + 7) & ~7
+        chunks = []
+        for k, pb in items:
+            kb = k.encode("utf-8")
+            head += struct.pack("<H", len(kb)) + kb + struct.pack("<QI", off, len(pb))
+            data = pb._bytes()
+            if sys.byteorder != "little":
+                a = array("i", pb._xy); a.byteswap(); data = memoryview(a).cast("B")
+            chunks.append((off, data)); off = (off + len(data) + 7) & ~7
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(head)
+            for o, data in chunks:
+                f.seek(o); f.write(data)
+            f.flush(); os.fsync(f.fileno())
+        chunks.clear(); data = None   # mmap のビューを手放してから閉じる
+        pending = self.path + ".new"
+        released = self._release()
+        try:
+            os.replace(tmp, self.path)
+        except OSError:
+            if released: raise
+            # まだ mmap が閉じられず置き換えられない（Windows）。別名に置いておき、次に load() するときに入れ替える
+            os.replace(tmp, pending)
+        else:
+            if os.path.exists(pending): os.remove(pending)   # 古い保留分で上書きしないように
+        self.keys = frozenset(buffers)
+
+    def _release(self) -> bool:
+        """mmap を閉じる前に、生きているビューをメモリへ写す。閉じられたら True"""
+        if self._file is not None:
+            self._file.close(); self._file = None   # mmap は自分でハンドルを持つので先に閉じてよい
+        if self._mm is None: return True
+        for ref in self._views:
+            pb = ref()
+            if pb is not None: pb._detach()
+        self._views = []
+        try:
+            self._mm.close()
+        except BufferError:
+            return False  # まだ誰かがビューを掴んでいる（POSIX ならこのまま置き換えて問題ない）
+        self._mm = None
+        return True
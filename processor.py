@@ -1,140 +1,268 @@
-import threading, time, random
-from dataclasses import dataclass
-from typing import Optional, Set, Dict, Any, List
-from pynput import mouse, keyboard
-from PySide6.QtCore import QObject, Signal
-
-@dataclass(frozen=True)
-class HotkeySpec:
-    ctrl: bool = True
-    alt: bool = True
-    shift: bool = False
-    key: Optional[str] = None  # 'A', 'F8', None=修飾のみ
+import os, queue, threading, time
+from typing import Optional, Dict, Any, List
+from scheduler import DeadlineScheduler, TimerHeap, TIMING_POLICIES, sleep_until
+from backends import InputBackend, create_backend
+from metrics import EngineMetrics, FinderMetrics, HookMetrics, TriggerMetrics
+from points import PointBuffer
+from coords import CoordSpec
+from macro import MacroError, MacroVM, compile_macro, END, HALT
+from recorder import record_count, replay
+from hotkeys import HotkeySpec, HotkeyMatcher
+from curve import RateCurve
+from capture import CaptureSource, TriggerSpec, create_capture
+from finder import TemplateSpec
+from eventlog import EventLog
 
-    @staticmethod
-    def from_string(spec: str) -> Optional["HotkeySpec"]:
-        if not spec: return None
-        parts = [p.strip() for p in spec.replace("＋","+").split("+") if p.strip()]
-        ctrl = any(p.lower()=="ctrl" for p in parts)
-        alt  = any(p.lower()=="alt" for p in parts)
-        shift= any(p.lower()=="shift" for p in parts)
-        main = [p for p in parts if p.lower() not in ("ctrl","alt","shift")]
-        key = main[0].upper() if main else None
-        if key and not (key.isalnum() or (len(key)>=2 and key[0]=="F" and key[1:].isdigit())):
-            return None
-        return HotkeySpec(ctrl=ctrl, alt=alt, shift=shift, key=key)
-
-    def matches(self, pressed: Set[object]) -> bool:
-        def any_pressed(*cands): return any(k in pressed for k in cands if k is not None)
-        # 修飾（左右どちらでもOK）
-        if self.ctrl  and not any_pressed(keyboard.Key.ctrl_l, keyboard.Key.ctrl_r, getattr(keyboard.Key, "ctrl", None)):   return False
-        if self.alt   and not any_pressed(keyboard.Key.alt_l,  keyboard.Key.alt_r,  getattr(keyboard.Key, "alt",  None)):  return False
-        if self.shift and not any_pressed(getattr(keyboard.Key, "shift_l", keyboard.Key.shift),
-                                          getattr(keyboard.Key, "shift_r", keyboard.Key.shift),
-                                          keyboard.Key.shift):                                                                return False
-        if self.key is None: return True
-        # 文字
-        for k in list(pressed):
-            try:
-                if isinstance(k, keyboard.KeyCode) and k.char and k.char.upper()==self.key:
-                    return True
-            except Exception:
-                pass
-        # Fキー
-        if self.key.startswith("F"):
-            try:
-                n = int(self.key[1:]); fkey = getattr(keyboard.Key, f"f{n}", None)
-                if fkey and fkey in pressed: return True
-            except Exception:
-                pass
-        return False
-
-class AutoClickEngine(QObject):
-    state_changed = Signal(bool)            # True=開始, False=停止
-    point_recorded = Signal(int, int)       # F12記録時 (x, y)
-
-    def __init__(self):
-        super().__init__()
-        self._lock = threading.RLock()
-        self._running = False
+# ClickPlan の引数と既定値（ジョブ dict・プロファイル dict から組み立てるとき用）
+_PLAN_DEFAULTS: Dict[str, Any] = {
+    "button": "left", "delay_ms": 100,
+    "stages": [], "normal_sec": 0, "curve_end": "loop", "duration_s": 0, "budget": 0,
+    "click_mode": "follow", "click_params": {},
+    "key_to_repeat": None, "key_sequence": [], "recorded_points": [], "timing_policy": "skip",
+    "macro": "", "trigger": {},
+}
+PLAN_KEYS = tuple(_PLAN_DEFAULTS)   # set_params の引数名
 
-        # 連打ターゲット
-        self._button = "left"        # 'left'|'right'|'key'
-        self._delay_ms = 100
-        self._key_to_repeat: Optional[str] = None
-        self._key_sequence: List[str] = []
-        self._seq_idx = 0
+def plan_params(d: Dict[str, Any]) -> Dict[str, Any]:
+    """プロファイル形式の dict → set_params の引数（足りない項目は既定値、余分な項目は無視）"""
+    kw = dict(_PLAN_DEFAULTS)
+    kw.update({k: d[k] for k in _PLAN_DEFAULTS if k in d})
+    return kw
 
-        # バースト
-        self._b1_enabled = False; self._b1_sec = 0; self._b1_ms = 50
-        self._b2_enabled = False; self._b2_sec = 0; self._b2_ms = 20
-        self._normal_sec = 0  # 0=無限
+class ClickPlan:
+    """set_params がコンパイルする不変の実行計画。
+    ワーカーは公開済みの構成（AutoClickEngine._current）の参照を1回読むだけで、ロックもコピーも不要"""
+    __slots__ = ("button", "btn", "keys", "macro", "mode", "fixed_xy", "coords", "template", "points",
+                 "traj_file", "traj_speed", "traj_loop",
+                 "curve", "trigger", "policy")
 
+    def __init__(self, io: InputBackend, *, button: str, delay_ms: int,
+                 stages: List[Dict[str, Any]], normal_sec: float, curve_end: str = "loop",
+                 duration_s: float = 0, budget: int = 0,
+                 click_mode: str, click_params: Dict[str, Any],
+                 key_to_repeat: Optional[str], key_sequence: List[str],
+                 recorded_points: "PointBuffer | List[tuple[int,int]]", timing_policy: str = "skip",
+                 macro: str = "", trigger: Optional[Dict[str, Any]] = None):
+        st = object.__setattr__
+        button = button if button in ("left","right","key","macro") else "left"
+        st(self, "button", button)
+        st(self, "btn", io.resolve_button(button))
+        # キー列（空なら単発キー）→ 送出オブジェクトに解決済み
+        norm = []
+        for t in key_sequence or []:
+            s = str(t).strip().upper()
+            if s and (s.isalnum() or (s.startswith("F") and s[1:].isdigit())):
+                norm.append(s)
+        keys = [k for k in (io.resolve_key(s) for s in (norm or [key_to_repeat])) if k is not None]
+        st(self, "keys", tuple(keys))
+        # マクロ（ここで1回だけコンパイル。構文エラーは MacroError で呼び出し側へ）
+        st(self, "macro", compile_macro(macro, io) if button == "macro" else None)
         # 座標
-        self._click_mode = "follow"  # 'follow'|'fixed'|'random_rect'|'recorded'
-        self._click_params: Dict[str, Any] = {}
-        self._record_points: List[tuple[int,int]] = []
-        self._rec_idx = 0
+        mode = click_mode if click_mode in ("follow","fixed","random_rect","recorded","trajectory","template") else "follow"
+        cp = click_params or {}
+        st(self, "mode", mode)
+        st(self, "fixed_xy", (int(cp.get("x", 0)), int(cp.get("y", 0))))
+        st(self, "coords", CoordSpec(cp) if mode == "random_rect" else None)   # 分布（座標列は実行ごとに生成）
+        st(self, "template", TemplateSpec(cp) if mode == "template" else None)   # 参照画像の各段は前処理済み
+        st(self, "points", PointBuffer.coerce(recorded_points))   # 不変なので共有（コピーしない）
+        # 軌跡再生（記録時の間隔どおり）
+        st(self, "traj_file", str(cp.get("file") or ""))
+        st(self, "traj_speed", max(0.01, float(cp.get("speed", 1.0) or 1.0)))
+        st(self, "traj_loop", bool(cp.get("loop", True)))
+        # 間隔のカーブ（段→通常→ループ/停止）。段の区間は表にコンパイル済み
+        st(self, "curve", RateCurve(stages, delay_ms, normal_sec, curve_end, duration_s, budget))
+        # 画面トリガー（あれば監視間隔で領域を見て、変化・色一致のときだけ発火。発火後は段の間隔だけ休む）
+        tr = TriggerSpec(trigger or {})
+        st(self, "trigger", tr if tr.kind != "none" else None)
+        st(self, "policy", timing_policy if timing_policy in TIMING_POLICIES else "skip")
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ClickPlan is immutable")
+
+    @classmethod
+    def from_dict(cls, io: InputBackend, d: Dict[str, Any]) -> "ClickPlan":
+        """プロファイル形式の dict から作る（足りない項目は既定値、余分な項目は無視）"""
+        return cls(io, **plan_params(d))
+
+    def at(self, elapsed: float) -> "tuple[int, float | None]":
+        """経過秒 → (段番号, 間隔秒)。段番号は 0..段数-1 が段、段数が通常。間隔 None は終了"""
+        return self.curve.at(elapsed)
+
+class _JobState:
+    """ワーカー専有の1ジョブ分の実行状態（計画・デッドライン・カーソル）"""
+    __slots__ = ("index", "plan", "sched", "t0", "seq_idx", "rec_idx", "coords", "vm", "watch", "finder", "fired", "done", "phase")
+
+    def __init__(self, index: int, plan: ClickPlan, t0: float):
+        self.index = index; self.plan = plan; self.t0 = t0
+        self.sched = DeadlineScheduler(plan.policy); self.sched.start(t0)
+        self.seq_idx = 0; self.rec_idx = 0; self.fired = 0; self.done = False
+        self.phase = -1     # 直近の段番号（切り替わりをイベントログへ）
+        self.watch = None   # TriggerWatcher（取り込み元はエンジンが持つので、最初の監視で作る）
+        self.finder = None  # TemplateFinder（同上。最初の探索で作る）
+        self.coords = plan.coords.stream() if plan.coords is not None else None
+        self.vm = MacroVM(plan.macro) if plan.macro is not None else None
+
+    def rebind(self, plan: ClickPlan):
+        """計画の差し替え。キーが変わればキー列は先頭から、記録点の位置は範囲内に収める。
+        分布が同じなら座標列もそのまま続ける（seed 指定時の再現性を保つ）"""
+        if plan.keys != self.plan.keys: self.seq_idx = 0
+        self.rec_idx = self.rec_idx % len(plan.points) if plan.points else 0
+        if plan.coords != self.plan.coords:
+            self.coords = plan.coords.stream() if plan.coords is not None else None
+        if plan.template != self.plan.template: self.finder = None
+        if plan.macro != self.plan.macro:
+            self.vm = MacroVM(plan.macro) if plan.macro is not None else None
+        self.plan = plan; self.sched.policy = plan.policy
+
+class EngineEvents:
+    """エンジンからの通知先（必要なものだけ上書きする）。
+    ワーカー・ディスパッチャのスレッドから直接呼ばれるので、重い処理や UI 操作はしないこと
+    （GUI は Qt のシグナルへ中継して UI スレッドで受ける）"""
+    def on_state_changed(self, running: bool) -> None: pass           # True=開始, False=停止
+    def on_point_recorded(self, x: int, y: int) -> None: pass         # F12記録時 (x, y)
+    def on_metrics(self, snap: Dict[str, Any]) -> None: pass          # 計測スナップショット（最大 1/PUBLISH_S 回/秒）
+
+
+class AutoClickEngine:
+    PUBLISH_S = 0.25
+
+    def __init__(self, backend: Optional[InputBackend] = None, hooks: bool = True,
+                 events: Optional[EngineEvents] = None, capture: Optional[CaptureSource] = None,
+                 log: Optional[EventLog] = None):
+        self.events = events or EngineEvents()
+        self.log = log or EventLog()   # 既定はメモリ上のリングだけ（GUI/CLI は logs/ へ書き出すものを渡す）
+        self._capture = capture   # 画面トリガー・テンプレート探索の取り込み元（None なら初回に create_capture）
+        self._lock = threading.RLock()
+        self._running = False
 
-        # 入出力
-        self._mouse = mouse.Controller()
-        self._keybd = keyboard.Controller()
+        # 実行計画（set_params で丸ごと差し替え。カーソル位置はワーカー側で保持）
+        # 追加ジョブは _jobs（不変タプル）。主ジョブ _plan と合わせて1本のワーカーがヒープで回す
+        self._io = backend or create_backend()
+        self._plan = ClickPlan.from_dict(self._io, {})
+        self._jobs: tuple = ()
+        # ワーカーが読む構成（開始時刻, (主ジョブ, 追加ジョブ…)）。書く側がロック内で丸ごと作り直して差し替え、
+        # ワーカーは参照を1回読んで前回と is で比べるだけ（毎回のロック・タプル作成なし）
+        self._t0 = time.perf_counter()
+        self._current: tuple = (self._t0, (self._plan,))
 
-        # ホットキー
-        self._hotkey = HotkeySpec()
-        self._pressed: Set[object] = set()
-        self._combo_active = False
-        self._hotkey_muted = False  # ミュート（GUIのメニュー中など）
+        # 計測（ワーカーのみ書き込み）
+        self.metrics = EngineMetrics()
+        self.trigger_metrics = TriggerMetrics()
+        self.finder_metrics = FinderMetrics()
+
+        # ホットキー（開始/停止は複数登録可。F12 の座標記録はミュート中も有効）
+        self._hotkeys: List[HotkeySpec] = [HotkeySpec()]
+        self._matcher = HotkeyMatcher()
+        self._register_hotkeys()
+        # フックのコールバックは時刻付きで積むだけ。判定・トグル・F12記録はディスパッチャが行う
+        # ミュート（GUIのメニュー中など）の切替も同じキューで送る（押下状態に触るのはディスパッチャだけ）
+        self.hook_metrics = HookMetrics()
+        self._events: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="hotkey-dispatch", daemon=True)
+        self._dispatcher.start()
 
         self._worker_thread: Optional[threading.Thread] = None
-        self._kb_listener = keyboard.Listener(on_press=self._on_press, on_release=self._on_release)
-        self._kb_listener.daemon = True
-        self._kb_listener.start()
+        self._wake = threading.Event()   # 停止時にセット（待機中のワーカーを即起こす）
+        self._kb_listener = None
+        if hooks: self.start_hooks()
 
     # ===== 公開API =====
     def set_params(self, *, button: str, delay_ms: int,
-                   burst1_enabled: bool, burst1_sec: int, burst1_ms: int,
-                   burst2_enabled: bool, burst2_sec: int, burst2_ms: int,
-                   normal_sec: int,
+                   stages: List[Dict[str, Any]], normal_sec: float,
                    click_mode: str, click_params: Dict[str, Any],
                    key_to_repeat: Optional[str],
                    key_sequence: List[str],
-                   recorded_points: List[tuple[int,int]]):
+                   recorded_points: "PointBuffer | List[tuple[int,int]]",
+                   timing_policy: str = "skip", macro: str = "",
+                   curve_end: str = "loop", duration_s: float = 0, budget: int = 0,
+                   trigger: Optional[Dict[str, Any]] = None):
+        """実行計画を差し替える。マクロに構文エラーがあれば MacroError（計画はそのまま）"""
+        plan = ClickPlan(self._io, button=button, delay_ms=delay_ms,
+                         stages=stages, normal_sec=normal_sec, curve_end=curve_end,
+                         duration_s=duration_s, budget=budget, click_mode=click_mode, click_params=click_params,
+                         key_to_repeat=key_to_repeat, key_sequence=key_sequence,
+                         recorded_points=recorded_points, timing_policy=timing_policy, macro=macro,
+                         trigger=trigger)
         with self._lock:
-            self._button = button if button in ("left","right","key") else "left"
-            self._delay_ms = max(1, int(delay_ms))
-            self._b1_enabled = bool(burst1_enabled); self._b1_sec = max(0, int(burst1_sec)); self._b1_ms = max(1, int(burst1_ms))
-            self._b2_enabled = bool(burst2_enabled); self._b2_sec = max(0, int(burst2_sec)); self._b2_ms = max(1, int(burst2_ms))
-            self._normal_sec = max(0, int(normal_sec))
-            self._click_mode = click_mode if click_mode in ("follow","fixed","random_rect","recorded") else "follow"
-            self._click_params = dict(click_params or {})
-            # 記録点
-            self._record_points = [(int(x),int(y)) for (x,y) in (recorded_points or [])]
-            if not self._record_points:
-                self._rec_idx = 0
-            else:
-                self._rec_idx %= len(self._record_points)
-            # キー列
-            norm = []
-            for t in key_sequence or []:
-                s = str(t).strip().upper()
-                if not s: continue
-                if s.isalnum() or (s.startswith("F") and s[1:].isdigit()):
-                    norm.append(s)
-            self._key_sequence = norm
-            self._seq_idx = 0
-            self._key_to_repeat = (key_to_repeat.upper() if key_to_repeat else None)
+            self._plan = plan; self._publish()
+
+    def set_jobs(self, jobs: List[Dict[str, Any]]):
+        """主ジョブと並行して回す追加ジョブ（プロファイル形式の dict のリスト）。
+        各ジョブは独自の間隔・段・座標・キーを持ち、ホットキーで主ジョブと一緒に開始/停止する。
+        軌跡再生は主ジョブ専用なので、追加ジョブでは無視する。マクロが壊れているジョブも飛ばす"""
+        plans = []
+        for j in jobs or []:
+            if not isinstance(j, dict): continue
+            try:
+                p = ClickPlan.from_dict(self._io, j)
+            except MacroError:
+                continue
+            if p.mode != "trajectory": plans.append(p)
+        with self._lock:
+            self._jobs = tuple(plans); self._publish()
+        self._kick()
+
+    def set_profile(self, p: Dict[str, Any]):
+        """プロファイル dict（AppConfig の profiles の値）をそのまま計画・追加ジョブにする。
+        マクロに構文エラーがあれば MacroError（計画はそのまま）"""
+        plan = ClickPlan.from_dict(self._io, p)
+        with self._lock:
+            self._plan = plan; self._publish()
+        self.set_jobs(p.get("jobs") or [])
+
+    def set_capture(self, source: Optional[CaptureSource]):
+        """画面トリガー・テンプレート探索の取り込み元を差し替える（テストでは SyntheticCapture）。次の開始から使われる"""
+        self._capture = source
+
+    def _capture_source(self) -> CaptureSource:
+        if self._capture is None: self._capture = create_capture()
+        return self._capture
+
+    def _publish(self):
+        """ワーカーへ構成を公開（ロック内で呼ぶ）。新しいタプルに差し替えるので、ワーカーは is で変更を知る"""
+        self._current = (self._t0, (self._plan,) + self._jobs)
+
+    def job_count(self) -> int:
+        return 1 + len(self._jobs)
+
+    def start_hooks(self) -> bool:
+        """キーボードフックを開始（何度呼んでもよい）。GUIは起動を速くするため最初の描画のあとで呼ぶ。
+        pynput が使えない環境（ディスプレイ無しなど）では False で、ホットキー無しで動く"""
+        with self._lock:
+            if self._kb_listener is not None: return True
+            try:
+                from pynput import keyboard
+            except Exception as ex:
+                self.log.error("hooks", ex); return False
+            self._kb_listener = keyboard.Listener(on_press=self._on_press, on_release=self._on_release)
+            self._kb_listener.daemon = True
+            self._kb_listener.start()
+        return True
 
     def update_hotkey(self, spec: HotkeySpec):
+        self.set_hotkeys([spec])
+
+    def set_hotkeys(self, specs: List[HotkeySpec]):
+        """開始/停止トグルのホットキーをまとめて差し替える（どれを押してもトグル）"""
         with self._lock:
-            self._hotkey = spec
-            self._combo_active = False
+            self._hotkeys = [s for s in specs if s is not None]
+            self._register_hotkeys()
+
+    def _register_hotkeys(self):
+        entries = [(hk.ids(), self._toggle, False) for hk in self._hotkeys]
+        entries.append((frozenset(("F12",)), self._record_point, True))
+        self._matcher.set([(ids, self._logged(ids, fn), always) for ids, fn, always in entries])
+
+    def _logged(self, ids, fn):
+        """ホットキー成立をイベントログに残してから fn を呼ぶコールバック"""
+        keys = "+".join(sorted(ids)); log = self.log
+        def cb():
+            log.event("hotkey", keys=keys); fn()
+        return cb
 
     def set_hotkey_muted(self, muted: bool):
-        with self._lock:
-            self._hotkey_muted = bool(muted)
-            self._combo_active = False
-            self._pressed.clear()
+        """ミュートを切り替えて押下状態を忘れる（ディスパッチャが前後のキー入力と順番どおりに処理する）"""
+        self._events.put((time.perf_counter_ns(), None, bool(muted)))
 
     def is_running(self) -> bool:
         with self._lock: return self._running
@@ -143,43 +271,64 @@ class AutoClickEngine(QObject):
 
     def shutdown(self):
         with self._lock: self._running = False
+        self._wake.set()
         try:
             if self._kb_listener: self._kb_listener.stop()
-        except Exception:
-            pass
+        except Exception as ex:
+            self.log.error("shutdown", ex)
+        self._events.put(None)
+        self._io.close()
+        self.log.close()
 
     # ===== キーボードフック =====
+    # OS の入力フック内で動くので、ここでは何もしない（ロックも取らない）。所要時間は hook_metrics へ
     def _on_press(self, key):
-        try:
-            # F12記録はミュート中でも受け付ける
-            if key == keyboard.Key.f12:
-                pos = self._mouse.position
-                self.point_recorded.emit(int(pos[0]), int(pos[1]))
-                return
-            with self._lock:
-                if self._hotkey_muted:
-                    return
-                self._pressed.add(key)
-                hk = self._hotkey
-            now_active = hk.matches(self._pressed) if hk else False
-            if now_active and not self._combo_active:
-                self._toggle()
-            self._combo_active = now_active
-        except Exception:
-            pass
+        t = time.perf_counter_ns()
+        self._events.put((t, True, key))
+        self.hook_metrics.record(time.perf_counter_ns() - t)
 
     def _on_release(self, key):
-        try:
-            with self._lock:
-                if self._hotkey_muted:
-                    return
-                self._pressed.discard(key)
-                hk = self._hotkey
-            self._combo_active = hk.matches(self._pressed) if hk else False
-        except Exception:
-            self._combo_active = False
+        t = time.perf_counter_ns()
+        self._events.put((t, False, key))
+        self.hook_metrics.record(time.perf_counter_ns() - t)
+
+    def _dispatch(self):
+        q = self._events; hm = self.hook_metrics; m = self._matcher; log = self.log
+        muted = False
+        while True:
+            item = q.get()
+            if item is None: return
+            t, down, key = item
+            if down is None:   # ミュート切替（key が新しい値）
+                muted = key; m.reset(); continue
+            try:
+                if down: m.press(key, muted)
+                else:    m.release(key, muted)
+            except Exception as ex:
+                log.error("hotkey", ex, key=str(key))
+            hm.lag(time.perf_counter_ns() - t)
+
+    def _record_point(self):
+        pos = self._io.position()
+        self.log.event("record", x=int(pos[0]), y=int(pos[1]))
+        self.events.on_point_recorded(int(pos[0]), int(pos[1]))
 
     # ===== 実行制御 =====
+    def _kick(self):
+        """待機中のワーカーを起こしてジョブ構成を読み直させる（長い間隔の待ちで新ジョブが遅れないように）"""
+        with self._lock:
+            if self._running and self._plan.mode != "trajectory":
+                self._wake.set()
+
+    def _finish(self):
+        """ワーカー自身が終了条件に達したときの停止"""
+        with self._lock:
+            if not self._running: return
+            self._running = False
+        self._wake.set()
+        self.log.event("state", running=False, reason="end")
+        self.events.on_state_changed(False)
+
     def _toggle(self):
         start_thread = False
         with self._lock:
@@ -187,74 +336,190 @@ class AutoClickEngine(QObject):
             running = self._running
             start_thread = running and (self._worker_thread is None or not self._worker_thread.is_alive())
             if running:
-                self._seq_idx = 0
-                self._rec_idx = 0
-                self._t0 = time.perf_counter()
-        self.state_changed.emit(running)
+                self._t0 = time.perf_counter(); self._publish()
+                self._wake.clear()
+            else:
+                self._wake.set()
+        p = self._plan
+        if running: self.log.event("state", running=True, mode=p.mode, button=p.button, jobs=1 + len(self._jobs))
+        else: self.log.event("state", running=False, reason="toggle")
+        self.events.on_state_changed(running)
         if start_thread:
             self._worker_thread = threading.Thread(target=self._loop, daemon=True)
             self._worker_thread.start()
 
     def _loop(self):
-        while self.is_running():
-            try:
+        heap = TimerHeap(); states: List[_JobState] = []
+        t0 = None; seen = None; plans: tuple = ()
+        m = self.metrics; tm = self.trigger_metrics; log = self.log; pub_at = 0.0
+        def publish(now: float):
+            # 計測は時刻で間引いて公開（発火しない待ち・トリガーの外れ・探索の外れでも止まらないように）
+            nonlocal pub_at
+            if now - pub_at >= self.PUBLISH_S:
+                pub_at = now; m.missed = sum(s.sched.missed for s in states)
+                self.events.on_metrics(self._snapshot())
+        while self._running:   # bool の読み出しは原子的（ロック不要）
+            cur = self._current
+            if cur is not seen:   # 開始・計画・ジョブ構成のどれかが変わった
+                seen = cur; start, plans = cur
+                if t0 != start:  # (再)開始: デッドラインとカーソルを初期化
+                    self._release_held(states)
+                    t0 = start; states = []; m.reset(); tm.reset(); self.finder_metrics.reset()
+                if plans[0].mode == "trajectory":
+                    self._release_held(states)
+                else:  # 状態を引き継いでヒープを組み直す。消えるジョブ・マクロが変わるジョブが押したままのものは先に離す
+                    self._release_held([s for i, s in enumerate(states) if i >= len(plans) or s.plan.macro != plans[i].macro])
+                    states = self._rebind(states, plans, t0)
+                    heap.clear()
+                    for st in states:
+                        if not st.done: heap.push(st.sched.deadline, st)
+            if plans[0].mode == "trajectory":
+                self._run_trajectory(plans[0]); continue
+            deadline, st = heap.peek()
+            if not sleep_until(deadline, self._wake):
                 with self._lock:
-                    button = self._button; delay_ms = self._delay_ms
-                    b1_en, b1_sec, b1_ms = self._b1_enabled, self._b1_sec, self._b1_ms
-                    b2_en, b2_sec, b2_ms = self._b2_enabled, self._b2_sec, self._b2_ms
-                    mode = self._click_mode; cp = dict(self._click_params)
-                    seq = list(self._key_sequence); idx = self._seq_idx
-                    key_single = self._key_to_repeat
-                    rec_pts = list(self._record_points); rec_idx = self._rec_idx
-
-                now = time.perf_counter()
-                elapsed = now - getattr(self, "_t0", now)
-                # 遅延選択（段1→段2→通常）
-                if b1_en and elapsed < b1_sec:      use_delay = b1_ms
-                elif b1_en and b2_en and elapsed < (b1_sec + b2_sec): use_delay = b2_ms
-                elif (not b1_en) and b2_en and elapsed < b2_sec:     use_delay = b2_ms
-                else:                                               use_delay = delay_ms
-
-                # クリック位置
-                if mode == "fixed":
-                    x = int(cp.get("x", 0)); y = int(cp.get("y", 0)); self._mouse.position = (x, y)
-                elif mode == "random_rect":
-                    x1 = int(cp.get("x1", 0)); x2 = int(cp.get("x2", 100))
-                    y1 = int(cp.get("y1", 0)); y2 = int(cp.get("y2", 100))
-                    if x1 > x2: x1, x2 = x2, x1
-                    if y1 > y2: y1, y2 = y2, y1
-                    self._mouse.position = (random.randint(x1, x2), random.randint(y1, y2))
-                elif mode == "recorded" and rec_pts:
-                    x, y = rec_pts[rec_idx]
-                    self._mouse.position = (int(x), int(y))
-                    with self._lock:
-                        self._rec_idx = (rec_idx + 1) % len(rec_pts)
-
-                # 発火
-                if button == "key":
-                    if seq:
-                        self._send_key(seq[idx])
-                        with self._lock:
-                            self._seq_idx = (self._seq_idx + 1) % len(seq)
-                    else:
-                        self._send_key(key_single)
-                else:
-                    btn = mouse.Button.left if button == "left" else mouse.Button.right
-                    self._mouse.click(btn)
-
-                time.sleep(max(0.001, use_delay/1000.0))
-            except Exception:
-                time.sleep(0.1)
-
-    def _send_key(self, spec: Optional[str]):
-        if not spec: return
-        s = spec.upper()
+                    if self._running: self._wake.clear()   # 停止でなければ構成変更の通知
+                publish(time.perf_counter()); continue
+            sched = st.sched
+            try:
+                sched.arrived()
+                trig = st.plan.trigger
+                if trig is not None:   # 画面トリガー: 取り込んで判定し、外れなら次の監視へ
+                    w = st.watch
+                    if w is None or w.spec != trig:
+                        w = st.watch = trig.watcher(self._capture_source())
+                    t_cap = time.perf_counter_ns()
+                    hit = w.poll()
+                    tm.poll(time.perf_counter_ns() - t_cap)
+                    if not hit:
+                        sched.advance(trig.interval_s); heap.replace(sched.deadline, st)
+                        publish(time.perf_counter()); continue
+                phase, use_delay, acted = self._fire(st)
+                if phase != st.phase:
+                    st.phase = phase
+                    log.event("phase", job=st.index, phase=phase,
+                              interval_ms=round(use_delay * 1000.0, 3) if use_delay is not None else None)
+                if use_delay is not None and not acted:   # 操作なし（探索の外れ）: 次の間隔へ進めるだけ
+                    sched.advance(use_delay); heap.replace(sched.deadline, st)
+                    publish(time.perf_counter()); continue
+                if use_delay is not None:
+                    st.fired += 1
+                    if trig is not None:
+                        tm.react(time.perf_counter_ns() - t_cap); w.rearm()
+                    now = time.perf_counter()
+                    # 間隔・ジッタは主ジョブで測る（ジョブが混ざると間隔の意味がなくなる。トリガーの発火は回数だけ）
+                    if st.index == 0 and trig is None: m.record(now, use_delay, sched.late_s, phase)
+                    else: m.count()
+                    publish(now)
+                    budget = st.plan.curve.budget
+                    if not budget or st.fired < budget:
+                        sched.advance(use_delay)
+                        heap.replace(sched.deadline, st)
+                        continue
+                # ジョブの終わり（マクロの stop・カーブの終わり・回数上限）。主ジョブなら全体を止める
+                if st.index == 0: self._finish()
+                else: st.done = True; heap.pop(); self._release_held((st,))
+            except Exception as ex:   # 注入の失敗など。記録して少し待ち、構成から組み直す
+                m.error(); log.error("loop", ex, job=st.index)
+                self._release_held((st,))
+                time.sleep(0.1); sched.start(); seen = None
+        self._release_held(states)   # 停止: hold の途中・press/down のままでも OS に押しっぱなしを残さない
+        m.missed = sum(s.sched.missed for s in states)
+        self.events.on_metrics(self._snapshot())
+
+    def _release_held(self, states):
+        """マクロが押したままにしたキー・ボタンを離す（停止・例外・構成変更のとき）"""
+        for st in states:
+            if st.vm is None: continue
+            try:
+                n = st.vm.release_all(self._io)
+                if n: self.log.event("released", job=st.index, n=n)
+            except Exception as ex:
+                self.log.error("release", ex, job=st.index)
+
+    @staticmethod
+    def _rebind(states: List[_JobState], plans: tuple, t0: float) -> List[_JobState]:
+        """同じ位置のジョブは状態（デッドライン・カーソル）を引き継ぐ。途中で増えたジョブは今から開始"""
+        start = t0 if not states else time.perf_counter()
+        out = []
+        for i, p in enumerate(plans):
+            if i < len(states):
+                st = states[i]
+                if st.plan is not p: st.rebind(p)
+            else:
+                st = _JobState(i, p, start)
+            out.append(st)
+        return out
+
+    def _fire(self, st: _JobState) -> "tuple[int, float | None, bool]":
+        """1ジョブ分の1アクション。戻り値は (段番号, 次までの間隔秒, 操作したか)。間隔 None は停止要求。
+        操作していない（テンプレートが見つからない）ときは回数・計測・回数上限に数えず、間隔だけ進める"""
+        p = st.plan
+        # 経過はデッドライン基準（実行遅れで段の切替がずれない）
+        elapsed = st.sched.deadline - st.t0
+        phase, use_delay = p.at(elapsed)
+        if use_delay is None: return phase, None, False   # 総時間・stop の終わり（発火しない）
+        io = self._io
+
+        # マクロ: 次の wait まで実行（座標モードは使わない）。最後まで来たら段の間隔だけ空けて先頭から
+        if st.vm is not None:
+            w = st.vm.step(io, elapsed)
+            io.submit()
+            if w == HALT: return phase, None, False
+            return phase, (use_delay if w == END else w), True
+
+        # クリック位置
+        mode = p.mode
+        if mode == "fixed":
+            io.move(*p.fixed_xy)
+        elif mode == "random_rect":
+            io.move(*st.coords.next())
+        elif mode == "template":
+            # 参照画像を探してその中心へ。見つからなければこの回は操作しない（次の間隔で探し直す）
+            f = st.finder
+            if f is None: f = st.finder = p.template.finder(self._capture_source())
+            t = time.perf_counter_ns()
+            xy = f.find()
+            self.finder_metrics.find(time.perf_counter_ns() - t, xy is not None, f.local, f.score)
+            if xy is None: return phase, use_delay, False
+            io.move(*xy)
+        elif mode == "recorded" and p.points:
+            io.move(*p.points[st.rec_idx])
+            st.rec_idx += 1
+            if st.rec_idx >= len(p.points): st.rec_idx = 0
+
+        # 発火
+        if p.button == "key":
+            if p.keys:
+                io.tap(p.keys[st.seq_idx])
+                st.seq_idx += 1
+                if st.seq_idx >= len(p.keys): st.seq_idx = 0
+        else:
+            io.click(p.btn)
+        io.submit()
+        return phase, use_delay, True
+
+    def stats(self) -> Dict[str, Any]:
+        """現在の計測値（エンジン＋キーボードフック）"""
+        return self._snapshot()
+
+    def _snapshot(self) -> Dict[str, Any]:
+        snap = self.metrics.snapshot()
+        snap.update(self.hook_metrics.snapshot())
+        snap.update(self.trigger_metrics.snapshot())
+        snap.update(self.finder_metrics.snapshot())
+        snap.update(self.log.snapshot())
+        return snap
+
+    def _run_trajectory(self, p: ClickPlan):
+        """軌跡ファイルを記録時の間隔で再生。ループしない設定なら最後まで再生して停止。
+        中身のないファイル（記録を途中でやめたものなど）は、ループ設定でも空回りしないようにすぐ停止"""
+        if not p.traj_file or not os.path.exists(p.traj_file) or record_count(p.traj_file) == 0:
+            self._finish(); return
+        m = self.metrics
         try:
-            if s.startswith("F") and s[1:].isdigit():
-                fk = getattr(keyboard.Key, f"f{int(s[1:])}", None)
-                if fk: self._keybd.press(fk); self._keybd.release(fk); return
-            if len(s) == 1 and s.isalnum():
-                self._keybd.press(s); self._keybd.release(s); return
-            self._keybd.press(s); self._keybd.release(s)
-        except Exception:
-            pass
+            done = replay(p.traj_file, self._io, p.traj_speed, self._wake, on_event=lambda _k: m.count())
+        except Exception as ex:
+            m.error(); self.log.error("trajectory", ex); self._finish(); return
+        if done and not p.traj_loop:
+            self._finish()
@@ -0,0 +1,72 @@
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QDialog, QHBoxLayout, QLabel, QPushButton, QTextBrowser, QVBoxLayout, QWidget
+from gui import GAP, PAD, apply_drop_shadow
+
+# ReadMe ダイアログ（使うときに初めて import される。起動時には読み込まない）
+
+README_MD = r"""
+# AutoClicker ©️2025 KisaragiIchigo
+
+## できること
+- 連打: **左クリック / 右クリック / 指定キー / キー列** の連打
+- バースト: **段1 / 段2** をチェックで有効化（例: 50ms→20ms→通常100ms）
+- クリック座標モード:
+  - **現在位置**（マウス追従）
+  - **固定座標**（X,Y指定）
+  - **ランダム矩形**（Xmin/Xmax, Ymin/Ymax 内でランダム）
+  - **記録操作**（**F12**で現在のカーソル座標を記録。記録順にループ再生）
+- ハンバーガーメニューを**開いている間はホットキー無効化**（誤作動防止）
+- プロファイル:
+  - 値変更のたび**自動保存**（現在選択名に上書き）
+  - **履歴300件**を保持（差分スナップショット）
+  - 最後に選んだ**プロファイルを次回起動時に復元**
+- 起動時最小化＆**トレイ常駐**
+- 権限チェック（管理者権限じゃない時に注意喚起）
+
+## 基本操作
+1. 上段の「プロファイル」で名前を選択/入力  
+   - **保存/上書**でプロファイル保存  
+   - **適用**でそのプロファイルの値を反映  
+2. 「連打ボタン」で **左/右/指定キー** を選ぶ  
+   - 指定キーはメニュー内「指定キー（単発）」で設定  
+   - **キー列**（例 `A,D,F8`）を入れると順番に送出  
+3. 「クリック座標」でモードを選択  
+   - **記録操作**を使うときは、狙いたい場所にマウスを置いて **F12** を押す → 座標が記録される（件数はメニューに表示）  
+   - 「記録クリア」で記録点を全消去  
+4. 「ディレイ/バースト」で持続と間隔を設定  
+   - 段1/段2はチェックを入れると有効化  
+5. **ホットキー**（デフォルト `Ctrl+Alt`）で開始/停止をトグル  
+   - メニュー内のホットキー欄をクリックして、好みの組み合わせを押すと更新される  
+   - メニューを開いている間は**常にミュート**されるから設定が安全
+
+## ちょいテク
+- **F12はミュート中でも座標記録**だけは受け付ける  
+- **キー列**は英数とFnキー（F1〜F24）に対応  
+- 記録操作モードは**記録順にループ**してクリック  
+- 設定・ログは実行フォルダ直下の `config/` と `logs/` に保存（exeでもOK）
+
+## トラブル対処
+- 連打が止まらない/誤爆する → メニューを開く（ホットキー無効）  
+- 権限不足っぽい → 管理者で再起動
+
+"""
+
+
+class ReadmeDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("README ©️2025 KisaragiIchigo")
+        self.setWindowFlags(Qt.Dialog | Qt.FramelessWindowHint)
+        self.setAttribute(Qt.WA_TranslucentBackground)
+        self.resize(850, 600); self.setMinimumSize(850, 600)
+        outer = QVBoxLayout(self); outer.setContentsMargins(0,0,0,0)
+        bg = QWidget(); bg.setObjectName("bgRoot"); outer.addWidget(bg)
+        bgL = QVBoxLayout(bg); bgL.setContentsMargins(GAP,GAP,GAP,GAP)
+        card = QWidget(); card.setObjectName("glassRoot"); bgL.addWidget(card)
+        cardL = QVBoxLayout(card); cardL.setContentsMargins(PAD,PAD,PAD,PAD); cardL.setSpacing(GAP)
+        bar = QHBoxLayout(); title = QLabel("README"); title.setObjectName("titleLabel"); bar.addWidget(title); bar.addStretch(1)
+        btn_close = QPushButton("x"); btn_close.setObjectName("closeBtn"); btn_close.setFixedSize(28,28); btn_close.clicked.connect(self.accept)
+        bar.addWidget(btn_close); cardL.addLayout(bar)
+        viewer = QTextBrowser(); viewer.setObjectName("readmeText"); viewer.setMarkdown(README_MD); viewer.setOpenExternalLinks(True)
+        cardL.addWidget(viewer, 1)
+        self._shadow = apply_drop_shadow(card)
@@ -0,0 +1,161 @@
+import os, queue, struct, threading, time
+from typing import Iterator, Optional, Tuple
+from scheduler import sleep_until
+
+# ===== 軌跡ファイル =====
+# [b"ACTR"][u32 version][f64 開始UNIX時刻] + 24バイト固定長レコードの列
+# レコード: t_ns(int64, 開始からの経過) / kind(u8) / x, y (int32) / code (int32)
+_MAGIC = b"ACTR"; _VERSION = 1
+_HEAD = struct.Struct("<4sId")
+_REC = struct.Struct("<qBxxxiii")
+
+MOVE, DOWN, UP, KEY_DOWN, KEY_UP = 1, 2, 3, 4, 5
+_BUTTONS = ("left", "right", "middle")
+# 名前付きキー（code = _SPECIAL_BASE + index）。文字キーは code = ord(文字)
+_SPECIAL = ("shift", "shift_r", "ctrl", "ctrl_r", "alt", "alt_r", "alt_gr", "cmd", "cmd_r",
+            "enter", "esc", "tab", "space", "backspace", "delete", "insert", "home", "end",
+            "page_up", "page_down", "up", "down", "left", "right", "caps_lock", "menu",
+            "print_screen", "scroll_lock", "pause", "num_lock") + tuple(f"f{i}" for i in range(1, 25))
+_SPECIAL_BASE = 0x110000
+_SPECIAL_IDX = {n: i for i, n in enumerate(_SPECIAL)}
+
+def _key_code(key) -> Optional[int]:
+    ch = getattr(key, "char", None)
+    if ch: return ord(ch[0])
+    name = getattr(key, "name", None)
+    if name in _SPECIAL_IDX: return _SPECIAL_BASE + _SPECIAL_IDX[name]
+    return None
+
+def key_name(code: int) -> Tuple[bool, str]:
+    """code → (文字か, 文字 or キー名)"""
+    if code >= _SPECIAL_BASE: return False, _SPECIAL[code - _SPECIAL_BASE]
+    return True, chr(code)
+
+def iter_records(path: str, chunk: int = 4096) -> Iterator[Tuple[int, int, int, int, int]]:
+    """軌跡ファイルを少しずつ読みながら (t_ns, kind, x, y, code) を返す（全体をメモリに載せない）"""
+    with open(path, "rb") as f:
+        head = f.read(_HEAD.size)
+        if len(head) < _HEAD.size or _HEAD.unpack(head)[0] != _MAGIC: return
+        size = _REC.size
+        while True:
+            buf = f.read(size * chunk)
+            if not buf: return
+            buf = buf[:len(buf) - len(buf) % size]
+            yield from _REC.iter_unpack(buf)
+
+def record_count(path: str) -> int:
+    try:
+        return max(0, (os.path.getsize(path) - _HEAD.size) // _REC.size)
+    except OSError:
+        return 0
+
+
+class TrajectoryRecorder:
+    """ポインタ移動・クリック・キー入力を高分解能の時刻付きで記録する。
+    フックのコールバックはキューに積むだけで、書き込みは専用スレッドがバッファ付きでまとめて行う"""
+    def __init__(self, path: str, min_move_ns: int = 0, keys: bool = True):
+        self.path = path
+        self.min_move_ns = max(0, int(min_move_ns))   # 移動の間引き（0=全部）
+        self._keys = keys
+        self._q: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._t0 = 0; self._last_move = 0
+        self.count = 0
+        self._listeners = []
+        self._writer: Optional[threading.Thread] = None
+
+    def start(self):
+        from pynput import mouse, keyboard
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._t0 = time.perf_counter_ns()
+        self._writer = threading.Thread(target=self._drain, daemon=True); self._writer.start()
+        self._listeners = [mouse.Listener(on_move=self._on_move, on_click=self._on_click)]
+        if self._keys:
+            self._listeners.append(keyboard.Listener(on_press=self._on_key_down, on_release=self._on_key_up))
+        for lis in self._listeners:
+            lis.daemon = True; lis.start()
+
+    def stop(self):
+        for lis in self._listeners:
+            try: lis.stop()
+            except Exception: pass
+        self._listeners = []
+        self._q.put(None)
+        if self._writer: self._writer.join(5.0)
+
+    # --- フック（積むだけ） ---
+    def _on_move(self, x, y):
+        t = time.perf_counter_ns() - self._t0
+        if self.min_move_ns and t - self._last_move < self.min_move_ns: return
+        self._last_move = t
+        self._q.put((t, MOVE, int(x), int(y), 0))
+
+    def _on_click(self, x, y, button, pressed):
+        name = getattr(button, "name", "left")
+        code = _BUTTONS.index(name) if name in _BUTTONS else 0
+        self._q.put((time.perf_counter_ns() - self._t0, DOWN if pressed else UP, int(x), int(y), code))
+
+    def _on_key_down(self, key):
+        c = _key_code(key)
+        if c is not None: self._q.put((time.perf_counter_ns() - self._t0, KEY_DOWN, 0, 0, c))
+
+    def _on_key_up(self, key):
+        c = _key_code(key)
+        if c is not None: self._q.put((time.perf_counter_ns() - self._t0, KEY_UP, 0, 0, c))
+
+    def _drain(self):
+        pack = _REC.pack
+        with open(self.path, "wb", buffering=1 << 16) as f:
+            f.write(_HEAD.pack(_MAGIC, _VERSION, time.time()))
+            while True:
+                item = self._q.get()
+                batch = []
+                while item is not None:
+                    batch.append(pack(*item))
+                    try: item = self._q.get_nowait()
+                    except queue.Empty: break
+                if batch:
+                    f.write(b"".join(batch)); self.count += len(batch)
+                if item is None: return
+
+
+def replay(path: str, io, speed: float = 1.0, wake: Optional[threading.Event] = None,
+           on_event=None) -> bool:
+    """記録時の間隔を再現して再生（speed=2.0 で倍速）。デッドラインは開始時刻からの絶対時刻で決めるので、
+    送出に時間がかかっても遅れが積み上がらない。停止要求で中断したら False
+    （押したまま中断したボタン・キーは離してから戻る。例外で抜けるときも同じ）"""
+    speed = max(0.01, float(speed))
+    buttons = {i: io.resolve_button(n) for i, n in enumerate(_BUTTONS)}
+    keys: dict = {}
+    def key(code):
+        k = keys.get(code)
+        if k is None and code not in keys:
+            is_char, s = key_name(code)
+            k = keys[code] = io.resolve_char(s) if is_char else io.resolve_key(s)
+        return k
+    btn_down: dict = {}; key_down: dict = {}   # 押したままのもの（押した順）
+    start = time.perf_counter()
+    try:
+        for t_ns, kind, x, y, code in iter_records(path):
+            if not sleep_until(start + t_ns / 1e9 / speed, wake):
+                return False
+            if kind == MOVE:
+                io.move(x, y)
+            elif kind == DOWN:
+                b = buttons.get(code, buttons[0])
+                io.move(x, y); io.mouse_down(b); btn_down[b] = None
+            elif kind == UP:
+                b = buttons.get(code, buttons[0])
+                io.move(x, y); io.mouse_up(b); btn_down.pop(b, None)
+            else:
+                k = key(code)
+                if k is None: continue
+                if kind == KEY_DOWN: io.press(k); key_down[k] = None
+                else: io.release(k); key_down.pop(k, None)
+            io.submit()
+            if on_event is not None: on_event(kind)
+        return True
+    finally:
+        if btn_down or key_down:
+            for k in reversed(list(key_down)): io.release(k)
+            for b in reversed(list(btn_down)): io.mouse_up(b)
+            io.submit()
@@ -0,0 +1,110 @@
+import heapq, threading, time
+from typing import Any, List, Optional, Tuple
+
+# 遅延ティックの扱い
+#   catchup : 遅れた分を即時に連続発火して取り戻す（最大 max_catchup 件まで）
+#   skip    : 遅れたティックは捨て、元の時間グリッドに再整列
+#   reset   : 遅れたら「今」から数え直す（グリッドを捨てる）
+TIMING_POLICIES = ("catchup", "skip", "reset")
+
+SPIN_S = 0.002       # 最後のこの時間だけはスピン待ち（OSスリープの粒度対策）
+MAX_CATCHUP = 5      # catchup で一度に取り戻す最大ティック数
+
+def sleep_until(deadline: float, wake: Optional[threading.Event] = None, spin_s: float = SPIN_S) -> bool:
+    """perf_counter 基準の絶対時刻まで待つ。粗い部分はsleep、最後の spin_s はスピン。
+    wake がセットされたら即座に False を返す（停止要求など）"""
+    while True:
+        remain = deadline - time.perf_counter()
+        if remain <= 0: return True
+        if remain > spin_s:
+            if wake is not None:
+                if wake.wait(remain - spin_s): return False
+            else:
+                time.sleep(remain - spin_s)
+            continue
+        # スピン（GILは都度解放）
+        while time.perf_counter() < deadline:
+            if wake is not None and wake.is_set(): return False
+        return True
+
+class DeadlineScheduler:
+    """絶対デッドライン(perf_counter)でティックを刻む。処理時間が間隔に上乗せされないのでドリフトしない"""
+    __slots__ = ("policy", "spin_s", "max_catchup", "_next", "missed", "late_s")
+
+    def __init__(self, policy: str = "skip", spin_s: float = SPIN_S, max_catchup: int = MAX_CATCHUP):
+        self.policy = policy if policy in TIMING_POLICIES else "skip"
+        self.spin_s = max(0.0, float(spin_s))
+        self.max_catchup = max(1, int(max_catchup))
+        self._next = time.perf_counter()
+        self.missed = 0      # skip/reset で捨てたティック数（累計）
+        self.late_s = 0.0    # 直近ティックの遅れ（秒）
+
+    @property
+    def deadline(self) -> float: return self._next
+
+    def start(self, t0: Optional[float] = None):
+        self._next = time.perf_counter() if t0 is None else t0
+        self.missed = 0; self.late_s = 0.0
+
+    def wait(self, wake: Optional[threading.Event] = None) -> bool:
+        """次のデッドラインまで待つ。停止要求で中断されたら False"""
+        ok = sleep_until(self._next, wake, self.spin_s)
+        self.arrived()
+        return ok
+
+    def arrived(self, now: Optional[float] = None) -> float:
+        """待機を呼び出し側（TimerHeap など）で済ませた場合に、発火時点の遅れを記録する"""
+        self.late_s = max(0.0, (time.perf_counter() if now is None else now) - self._next)
+        return self.late_s
+
+    def advance(self, interval_s: float) -> float:
+        """発火後に呼ぶ。次のデッドラインを interval_s 先へ進め、方針に従って遅れを処理する"""
+        interval_s = max(1e-6, interval_s)
+        nxt = self._next + interval_s
+        now = time.perf_counter()
+        behind = now - nxt
+        if behind > 0:
+            if self.policy == "reset":
+                self.missed += int(behind // interval_s); nxt = now + interval_s
+            elif self.policy == "skip":
+                n = int(behind // interval_s) + 1
+                self.missed += n; nxt += n * interval_s
+            else:  # catchup
+                limit = self.max_catchup * interval_s
+                if behind > limit:
+                    self.missed += int((behind - limit) // interval_s); nxt = now - limit
+        self._next = nxt
+        return nxt
+
+
+class TimerHeap:
+    """複数ジョブのデッドラインを1本のスレッドで回すための最小ヒープ。
+    要素は (デッドライン, 投入順, item)。同時刻なら先に積んだ方が先"""
+    __slots__ = ("_h", "_seq")
+
+    def __init__(self):
+        self._h: List[Tuple[float, int, Any]] = []
+        self._seq = 0
+
+    def __len__(self) -> int: return len(self._h)
+
+    def clear(self):
+        self._h.clear()
+
+    def push(self, deadline: float, item: Any):
+        self._seq += 1
+        heapq.heappush(self._h, (deadline, self._seq, item))
+
+    def peek(self) -> Tuple[float, Any]:
+        """最も早いデッドラインと item（空なら IndexError）"""
+        d, _, item = self._h[0]
+        return d, item
+
+    def pop(self) -> Tuple[float, Any]:
+        d, _, item = heapq.heappop(self._h)
+        return d, item
+
+    def replace(self, deadline: float, item: Any) -> None:
+        """先頭を取り出して積み直す（発火→次デッドラインへの更新を1回の sift で）"""
+        self._seq += 1
+        heapq.heapreplace(self._h, (deadline, self._seq, item))
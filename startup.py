@@ -0,0 +1,39 @@
+import json, os, time
+from typing import Dict, List, Tuple
+
+# 起動の段階ごとの経過時間（プロセス内で最初に import された時点が 0）。
+# first_paint（最初の描画）と hotkeys_ready（キーボードフック開始）の両方が揃ったら logs/ に1行追記する
+_T0 = time.perf_counter()
+
+STARTUP_LOG = "startup_timings.jsonl"
+
+class StartupTimer:
+    def __init__(self):
+        self.marks: List[Tuple[str, float]] = []
+        self._saved = False
+
+    def mark(self, name: str) -> float:
+        """段階名と経過ms を記録（同じ名前は最初の1回だけ）"""
+        if any(n == name for n, _ in self.marks): return 0.0
+        ms = (time.perf_counter() - _T0) * 1000.0
+        self.marks.append((name, ms))
+        return ms
+
+    def as_dict(self) -> Dict[str, float]:
+        return {n: round(ms, 1) for n, ms in self.marks}
+
+    def save_when(self, *required: str, logs_dir: str) -> bool:
+        """required の段階が全部そろっていれば追記（1プロセス1回）"""
+        if self._saved: return False
+        d = self.as_dict()
+        if any(r not in d for r in required): return False
+        self._saved = True
+        try:
+            os.makedirs(logs_dir, exist_ok=True)
+            with open(os.path.join(logs_dir, STARTUP_LOG), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"at": int(time.time()), **d}, ensure_ascii=False) + "\n")
+        except Exception:
+            pass
+        return True
+
+TIMER = StartupTimer()
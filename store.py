@@ -0,0 +1,145 @@
+import json, sqlite3, struct, sys, threading, time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from points import PointBuffer, PointSidecar
+
+# ===== プロファイルの保存先（SQLite） =====
+# 1プロファイル = 1行（name が主キー＝索引）。記録点は int32 (x, y) の BLOB として別の列に持つ。
+# INLINE_MAX_BYTES を超える記録点は行に入れず、サイドカーファイル（points.py の PointSidecar）に置いて
+# キーだけを points_ref に持つ。大きなファイルは mmap のまま読むので、巨大な記録点でも読み込みでコピーしない。
+# 読み込みも書き込みも1件単位なので、数千件あっても変更した分しか触らない（サイドカーは大きな記録点が増減したときだけ書き直す）。
+# 接続は1本をロックで共有（GUI スレッドの読み込みと ConfigWriter のスレッドの書き込み）。WAL なので書き込み中も速い。
+INLINE_MAX_BYTES = 64 * 1024   # これを超える記録点（8192点超）はサイドカーへ
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    name    TEXT PRIMARY KEY,
+    data    TEXT NOT NULL,      -- recorded_points を除いたプロファイル（JSON）
+    points  BLOB,               -- 記録点 x0,y0,x1,y1,… の int32（little endian）。無ければ NULL
+    updated INTEGER NOT NULL,
+    points_ref TEXT             -- サイドカー内の記録点のキー（points が NULL のときだけ）
+);
+"""
+
+def _as_points(v: Any) -> PointBuffer:
+    return PointBuffer.coerce(v) if not isinstance(v, dict) else PointBuffer()
+
+def _points_blob(pb: PointBuffer) -> Optional[bytes]:
+    if not len(pb): return None
+    if sys.byteorder != "little":
+        a = array("i", pb.tobytes()); a.byteswap(); return a.tobytes()
+    return pb.tobytes()
+
+def _points(blob: Optional[bytes]) -> PointBuffer:
+    if not blob: return PointBuffer()
+    xy = array("i"); xy.frombytes(blob)
+    if sys.byteorder != "little": xy.byteswap()
+    return PointBuffer(xy)
+
+
+class ProfileStore:
+    """points_path を渡さなければ記録点はすべて行の BLOB に入れる"""
+    def __init__(self, path: str, points_path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")   # WAL ならクラッシュしても壊れない（直前の書き込みが消えるだけ）
+        self._db.executescript(_SCHEMA)
+        if "points_ref" not in {r[1] for r in self._db.execute("PRAGMA table_info(profiles)")}:
+            self._db.execute("ALTER TABLE profiles ADD COLUMN points_ref TEXT")   # 列を足す前に作ったファイル
+        self._sidecar = PointSidecar(points_path) if points_path else None
+        self._table: Optional[Dict[str, PointBuffer]] = None   # サイドカーの中身（初めて要るときに読む）
+
+    def close(self):
+        with self._lock: self._db.close()
+
+    # ===== 読み込み =====
+    def names(self, like: str = "") -> List[str]:
+        """名前の一覧（名前順。主キーの索引を順に読むだけで、中身は読まない）。like は部分一致（大文字小文字を区別しない）"""
+        with self._lock:
+            if not like:
+                rows = self._db.execute("SELECT name FROM profiles ORDER BY name").fetchall()
+            else:
+                pat = "%" + like.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                rows = self._db.execute("SELECT name FROM profiles WHERE name LIKE ? ESCAPE '\\' ORDER BY name", (pat,)).fetchall()
+        return [r[0] for r in rows]
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """1件読む（移行前の dict。記録点は PointBuffer）。無ければ None"""
+        with self._lock:
+            row = self._db.execute("SELECT data, points, points_ref FROM profiles WHERE name = ?", (name,)).fetchone()
+            if row is None: return None
+            pts = self._sidecar_table().get(row[2], PointBuffer()) if row[2] else _points(row[1])
+        try:
+            p = json.loads(row[0])
+        except ValueError:
+            p = {}
+        if not isinstance(p, dict): p = {}
+        p["recorded_points"] = pts
+        return p
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    # ===== 書き込み（どれも1トランザクション） =====
+    def write(self, upserts: Iterable[Tuple[str, Dict[str, Any]]] = (), deletes: Iterable[str] = ()) -> None:
+        """upserts の各 (名前, 検証済みプロファイル) を書き、deletes の名前を消す"""
+        big: Dict[str, PointBuffer] = {}
+        rows = self._rows(upserts, big)
+        dels = [(name,) for name in deletes]
+        with self._lock:
+            if big: self._save_sidecar(big, keep_current=True)
+            with self._db:
+                self._db.execute("BEGIN")
+                if rows: self._db.executemany("INSERT OR REPLACE INTO profiles (name, data, points, updated, points_ref) VALUES (?, ?, ?, ?, ?)", rows)
+                if dels: self._db.executemany("DELETE FROM profiles WHERE name = ?", dels)
+
+    def replace_all(self, profiles: Dict[str, Dict[str, Any]]) -> None:
+        """全件を置き換える（旧形式の設定ファイルからの取り込み用）"""
+        big: Dict[str, PointBuffer] = {}
+        rows = self._rows(profiles.items(), big)
+        with self._lock:
+            if big or self._sidecar is not None: self._save_sidecar(big, keep_current=False)
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute("DELETE FROM profiles")
+                self._db.executemany("INSERT INTO profiles (name, data, points, updated, points_ref) VALUES (?, ?, ?, ?, ?)", rows)
+
+    # ===== 大きな記録点（サイドカー） =====
+    def _rows(self, items: Iterable[Tuple[str, Dict[str, Any]]], big: Dict[str, PointBuffer]) -> list:
+        """書き込む行。サイドカーへ回す記録点は big に集める"""
+        now = int(time.time()); rows = []
+        for name, p in items:
+            pb = _as_points(p.get("recorded_points"))
+            if self._sidecar is not None and 8 * len(pb) > INLINE_MAX_BYTES:
+                big[pb.key] = pb
+                rows.append((name, self._encode(p), None, now, pb.key))
+            else:
+                rows.append((name, self._encode(p), _points_blob(pb), now, None))
+        return rows
+
+    def _sidecar_table(self) -> Dict[str, PointBuffer]:
+        if self._table is None:
+            try:
+                self._table = self._sidecar.load() if self._sidecar is not None else {}
+            except (OSError, ValueError, struct.error):
+                self._table = {}
+        return self._table
+
+    def _save_sidecar(self, big: Dict[str, PointBuffer], keep_current: bool) -> None:
+        """いま行から参照されている記録点＋ big でサイドカーを書き直す（キーが変わらなければ書かない）。
+        行を書く前に呼ぶので、置き換えられる行の古い記録点も残る（次に大きな記録点を書くときに消える）"""
+        table = self._sidecar_table()
+        keep: Dict[str, PointBuffer] = {}
+        if keep_current:
+            for (ref,) in self._db.execute("SELECT DISTINCT points_ref FROM profiles WHERE points_ref IS NOT NULL"):
+                if ref in table: keep[ref] = table[ref]
+        keep.update(big)
+        self._sidecar.save(keep)
+        self._table = keep
+
+    @staticmethod
+    def _encode(p: Dict[str, Any]) -> str:
+        return json.dumps({k: v for k, v in p.items() if k != "recorded_points"}, ensure_ascii=False, separators=(",", ":"))
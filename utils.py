@@ -1,6 +1,5 @@
 import os, sys
 from typing import Optional
-from PySide6.QtGui import QGuiApplication
 
 APP_NAME = "AutoClicker"
 
@@ -44,6 +43,7 @@ def is_admin() -> bool:
 
 def screen_size() -> Optional[tuple[int, int]]:
     try:
+        from PySide6.QtGui import QGuiApplication   # ヘッドレス（cli.py）では Qt を読み込まない
         scr = QGuiApplication.primaryScreen().geometry()
         return (scr.width(), scr.height())
     except Exception: